@@ -0,0 +1,63 @@
+"""
+micro benchmark of the per call overhead of feature lifecycle (`initialize` on every fit / predict).
+
+`rebuild` emulates the old behavior, which creates the logger handlers and the experiment backend on every call.
+`reuse` is the current behavior, which sets them up only once.
+"""
+import os
+import tempfile
+from time import time
+
+import numpy as np
+import pandas as pd
+
+from vivid.core import AbstractFeature
+from vivid.executor import topological_sort
+
+
+class IdentityFeature(AbstractFeature):
+    def call(self, df_source: pd.DataFrame, y=None, test=False):
+        return df_source.iloc[:, :2]
+
+
+def create_graph(root_dir, n_features):
+    entry = IdentityFeature(name='entry', root_dir=root_dir)
+    singles = [IdentityFeature(name=f'single_{i}', parent=entry) for i in range(n_features)]
+    return IdentityFeature(name='last', parent=singles)
+
+
+def reset_runtime(feature):
+    for node in topological_sort(feature):
+        node._runtime_key = None
+        node.logger._vivid_config = None
+
+
+def benchmark(feature, n_calls, rebuild):
+    """seconds of `initialize` of all features in the graph (called at the start of each fit / predict)"""
+    nodes = topological_sort(feature)
+    start = time()
+    for _ in range(n_calls):
+        if rebuild:
+            reset_runtime(feature)
+        for node in nodes:
+            node.initialize()
+    return (time() - start) / n_calls
+
+
+def main():
+    input_df = pd.DataFrame(np.random.uniform(size=(100, 4)))
+    n_calls = 100
+
+    with tempfile.TemporaryDirectory() as root_dir:
+        for n_features in [10, 100]:
+            feature = create_graph(os.path.join(root_dir, str(n_features)), n_features)
+            feature.fit(input_df, np.zeros(len(input_df)))
+
+            rebuild = benchmark(feature, n_calls, rebuild=True)
+            reuse = benchmark(feature, n_calls, rebuild=False)
+            print(f'n_features={n_features:<4d} rebuild: {rebuild * 1000:.1f}[ms/call] '
+                  f'reuse: {reuse * 1000:.1f}[ms/call] ({rebuild / reuse:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
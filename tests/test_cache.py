@@ -0,0 +1,148 @@
+import gc
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+from vivid.cache import FeatureCache, get_feature_cache
+from vivid.core import AbstractFeature
+
+
+def create_df(n_rows=100):
+    return pd.DataFrame(np.random.uniform(size=(n_rows, 4)))
+
+
+@pytest.fixture
+def cache(output_dir) -> FeatureCache:
+    df = create_df()
+    nbytes = int(df.memory_usage(index=True).sum())
+    # the budget is two dataframes
+    return FeatureCache(max_bytes=nbytes * 2, spill_dir=os.path.join(output_dir, 'spill'))
+
+
+def test_invalid_policy():
+    with pytest.raises(ValueError):
+        FeatureCache(policy='foo')
+
+
+def test_lru_eviction_and_promotion(cache):
+    dfs = [create_df() for _ in range(3)]
+    for i, df in enumerate(dfs):
+        cache.put(('a', i), df)
+
+    stats = cache.get_stats()
+    assert stats['n_memory'] == 2
+    assert stats['evictions'] == 1
+    assert stats['spills'] == 1
+
+    # the first one was spilled and it is loaded from disk
+    assert cache.get(('a', 0)).equals(dfs[0])
+    assert cache.get_stats()['disk_hits'] == 1
+
+    # promoted to memory. next access is the memory hit
+    assert cache.get(('a', 0)) is not None
+    assert cache.get_stats()['hits'] == 1
+
+    assert cache.get(('b', 0)) is None
+    assert cache.get_stats()['misses'] == 1
+    assert cache.nbytes <= cache.max_bytes
+
+
+def test_evict_to_local_file(cache, output_dir):
+    df = create_df()
+    path = os.path.join(output_dir, 'saved.joblib')
+    joblib.dump(df, path)
+
+    cache.put(('a', 0), df, disk_path=path)
+    cache.put(('a', 1), create_df())
+    cache.put(('a', 2), create_df())
+
+    # the output has local file, so no need to spill
+    assert cache.get_stats()['spills'] == 0
+    assert cache.get(('a', 0)).equals(df)
+    assert os.path.exists(path)
+
+
+def test_release(cache, output_dir):
+    saved = create_df()
+    path = os.path.join(output_dir, 'saved.joblib')
+    joblib.dump(saved, path)
+    cache.put(('a', 0), saved, disk_path=path)
+    cache.put(('a', 1), create_df())
+
+    cache.release(('a', 0))
+    cache.release(('a', 1))
+    # the output which has local file is read from it, and the other is dropped without spilling
+    assert cache.location(('a', 0)) == 'disk'
+    assert cache.location(('a', 1)) is None
+    assert cache.get_stats()['spills'] == 0
+
+
+def test_cost_policy(output_dir):
+    df = create_df()
+    cache = FeatureCache(max_bytes=int(df.memory_usage(index=True).sum()) * 2, policy='cost',
+                         spill_dir=output_dir)
+    cache.put(('a', 0), create_df(), cost=100.)
+    cache.put(('a', 1), create_df(), cost=1.)
+    cache.put(('a', 2), create_df(), cost=10.)
+
+    assert cache.get(('a', 0)) is not None
+    assert cache.get(('a', 2)) is not None
+    assert cache.get_stats()['disk_hits'] == 0
+
+
+def test_discard_owner(cache):
+    cache.put(('a', 'train'), create_df())
+    cache.put(('a', 'test'), create_df())
+    cache.put(('b', 'train'), create_df())
+    cache.discard_owner('a')
+
+    assert cache.get(('a', 'train')) is None
+    assert cache.get(('b', 'train')) is not None
+
+
+def test_promote_local_train_output(train_data, output_dir, monkeypatch):
+    train_df, y = train_data
+
+    class ReadFeature(AbstractFeature):
+        def call(self, df_source, y=None, test=False):
+            return df_source
+
+    ReadFeature(name='read', root_dir=output_dir).fit(train_df, y)
+
+    parent = ReadFeature(name='read', root_dir=output_dir)
+    children = [ReadFeature(name=f'child_{i}', parent=parent) for i in range(3)]
+
+    backend = parent.dataframe_backend
+    n_loads = []
+    original_load = backend.load
+
+    def load(*args, **kwargs):
+        n_loads.append(1)
+        return original_load(*args, **kwargs)
+
+    monkeypatch.setattr(backend, 'load', load)
+    for child in children:
+        child.fit(train_df, y, release_outputs=False)
+
+    # saved output is loaded only once, and then it is hit on memory
+    assert len(n_loads) == 1
+    assert parent.feat_on_train_df is not None
+
+
+def test_release_on_garbage_collect(train_data):
+    train_df, y = train_data
+
+    class ReadFeature(AbstractFeature):
+        def call(self, df_source, y=None, test=False):
+            return df_source
+
+    feat = ReadFeature(name='read')
+    feat.fit(train_df, y)
+    key = (feat._cache_token, 'train')
+    assert get_feature_cache().get(key) is not None
+    del feat
+    gc.collect()
+    assert get_feature_cache().get(key) is None
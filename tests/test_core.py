@@ -2,11 +2,14 @@
 """
 
 import os
+import pickle
 
+import numpy as np
 import pandas as pd
 import pytest
 
 from vivid.core import AbstractFeature
+from vivid.frames import iter_row_chunks
 from .conftest import SampleFeature
 
 
@@ -63,6 +66,48 @@ def test_abstract_feature(output_dir):
     assert not not_save.is_recording
 
 
+def test_initialize_once(train_data, output_dir):
+    train_df, y = train_data
+    feat = SimpleMergeFeature(name='lazy', root_dir=output_dir)
+    logger, exp_backend = feat.logger, feat.exp_backend
+    # the output dir is not created until something is saved
+    assert not os.path.exists(feat.output_dir)
+
+    feat.fit(train_df, y)
+    feat.predict(train_df)
+    assert feat.logger is logger
+    assert feat.exp_backend is exp_backend
+    assert os.path.exists(feat.output_train_meta_path)
+
+    # changing the output dir sets up the context again
+    feat._root_dir = os.path.join(output_dir, 'other')
+    feat.initialize()
+    assert feat.exp_backend is not exp_backend
+    assert feat.exp_backend.output_dir == feat.output_dir
+
+
+def test_same_name_in_other_root_dir(train_data, output_dir):
+    train_df, y = train_data
+    features = [SimpleMergeFeature(name='same', root_dir=os.path.join(output_dir, d)) for d in ('a', 'b')]
+
+    # the logger is shared, but each feature writes the log into its own output dir
+    features[0].fit(train_df, y)
+    log_paths = [os.path.join(feat.output_dir, 'log.txt') for feat in features]
+    assert os.path.exists(log_paths[0])
+    assert not os.path.exists(log_paths[1])
+
+
+def test_pickle_without_logger(output_dir):
+    feat = SimpleMergeFeature(name='pickle', root_dir=output_dir)
+    state = feat.__getstate__()
+    assert all(key not in state for key in AbstractFeature.RUNTIME_ATTRIBUTES)
+
+    # the logger and the experiment backend are created again on load
+    loaded = pickle.loads(pickle.dumps(feat))
+    assert loaded.logger is feat.logger
+    assert loaded.exp_backend.output_dir == feat.output_dir
+
+
 def test_save_train_and_test(train_data, output_dir):
     train_df, y = train_data
 
@@ -124,3 +169,108 @@ def test_features_cache(train_data, use_cache: bool, output_dir):
     else:
         assert feat.feat_on_train_df is None
         assert feat.feat_on_test_df is None
+
+
+def test_stale_train_cache(train_data, output_dir):
+    """saved training output is re-created only when the input, y or parameters are changed"""
+    train_df, y = train_data
+
+    class ScaleFeature(AbstractFeature):
+        count = 0
+
+        def __init__(self, scale=1., **kwargs):
+            super(ScaleFeature, self).__init__(**kwargs)
+            self.scale = scale
+
+        def get_cache_params(self):
+            params = super(ScaleFeature, self).get_cache_params()
+            params['scale'] = self.scale
+            return params
+
+        def call(self, df_source: pd.DataFrame, y=None, test=False):
+            ScaleFeature.count += 1
+            return df_source * self.scale
+
+    feat = ScaleFeature(name='scale', root_dir=output_dir)
+    feat.fit(train_df, y)
+    assert ScaleFeature.count == 1
+
+    # same input. load from local
+    ScaleFeature(name='scale', root_dir=output_dir).fit(train_df, y)
+    assert ScaleFeature.count == 1
+
+    # target is changed
+    ScaleFeature(name='scale', root_dir=output_dir).fit(train_df, y + 1)
+    assert ScaleFeature.count == 2
+
+    # input data is changed
+    ScaleFeature(name='scale', root_dir=output_dir).fit(train_df + 1, y + 1)
+    assert ScaleFeature.count == 3
+
+    # parameter is changed
+    out_df = ScaleFeature(name='scale', root_dir=output_dir, scale=2.).fit(train_df + 1, y + 1)
+    assert ScaleFeature.count == 4
+    assert out_df.equals((train_df + 1) * 2.)
+
+    # the child of the changed feature is also re-created
+    parent = ScaleFeature(name='scale', root_dir=output_dir, scale=3.)
+    child = ScaleFeature(name='child', parent=parent)
+    child.fit(train_df, y)
+    assert ScaleFeature.count == 6
+    ScaleFeature(name='child', parent=ScaleFeature(name='scale', root_dir=output_dir, scale=3.)).fit(train_df, y)
+    assert ScaleFeature.count == 6
+    ScaleFeature(name='child', parent=ScaleFeature(name='scale', root_dir=output_dir, scale=4.)).fit(train_df, y)
+    assert ScaleFeature.count == 8
+
+
+class TargetMeanFeature(AbstractFeature):
+    def call(self, df_source, y=None, test=False):
+        if not test:
+            self.mean_ = np.mean(y)
+        return pd.DataFrame({'mean': np.full(len(df_source), self.mean_)})
+
+
+def test_refit_discards_test_output(train_data, output_dir):
+    train_df, y = train_data
+    feat = TargetMeanFeature(name='refit_test', root_dir=output_dir)
+    feat.fit(train_df, y)
+    feat.predict(train_df)
+
+    # training on the other target makes the predicted output stale
+    feat.fit(train_df, y * 100)
+    assert not os.path.exists(feat.output_test_meta_path)
+    pred_df = feat.predict(train_df)
+    assert np.allclose(pred_df['mean'], np.mean(y) * 100)
+
+
+def test_memory_cache_with_other_input(train_data):
+    train_df, y = train_data
+    feat = SampleFeature()
+    out_df = feat.fit(train_df, y)
+    assert feat.fit(train_df, y) is out_df
+    assert feat.fit(train_df.head(10), y[:10]).shape[0] == 10
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100, 1000])
+def test_predict_iter(train_data, output_dir, chunk_size):
+    train_df, y = train_data
+    train_df.index = train_df.index + 100
+
+    class ScaleFeature(AbstractFeature):
+        def call(self, df_source: pd.DataFrame, y=None, test=False):
+            return df_source.iloc[:, :3] * 2
+
+    parent = ScaleFeature(name='scale', root_dir=output_dir)
+    feat = SimpleMergeFeature(name='merge', parent=[parent, SampleFeature()])
+    feat.fit(train_df, y)
+    pred_df = feat.predict(train_df.reset_index(drop=True))
+
+    chunks = list(feat.predict_iter(iter_row_chunks(train_df, chunk_size), save=True))
+    assert len(chunks) == (len(train_df) - 1) // chunk_size + 1
+    chunk_df = pd.concat(chunks)
+    assert chunk_df.index.equals(train_df.index)
+    assert np.array_equal(chunk_df.values, pred_df.values)
+
+    # stream outputs are not cached
+    assert feat.feat_on_test_df is pred_df
+    assert os.path.exists(feat.output_test_chunk_path(0))
@@ -0,0 +1,232 @@
+"""Test for executor.py
+"""
+
+import os
+
+import pandas as pd
+import pytest
+
+from vivid.cache import get_feature_cache
+from vivid.core import AbstractFeature
+from vivid.executor import GraphExecutor, topological_sort
+from vivid.out_of_fold.kneighbor import KNeighborRegressorOutOfFold
+
+
+class CountFeature(AbstractFeature):
+    def __init__(self, name, parent=None, root_dir=None, scale=1.):
+        super(CountFeature, self).__init__(name=name, parent=parent, root_dir=root_dir)
+        self.scale = scale
+        self.n_calls = 0
+
+    def get_cache_params(self):
+        params = super(CountFeature, self).get_cache_params()
+        params['scale'] = self.scale
+        return params
+
+    def call(self, df_source: pd.DataFrame, y=None, test=False) -> pd.DataFrame:
+        self.n_calls += 1
+        out_df = df_source.iloc[:, :2] * self.scale
+        out_df.columns = [f'{self.name}_{c}' for c in range(out_df.shape[1])]
+        return out_df
+
+
+def create_graph(root_dir=None):
+    entry = CountFeature(name='entry', root_dir=root_dir)
+    singles = [CountFeature(name=f'single_{i}', parent=entry, scale=i + 1) for i in range(4)]
+    stacking = CountFeature(name='stacking', parent=singles)
+    last = CountFeature(name='last', parent=[stacking, *singles])
+    return last
+
+
+def test_topological_sort():
+    last = create_graph()
+    ordered = topological_sort(last)
+
+    assert len(ordered) == 7
+    assert ordered[-1] is last
+    for i, node in enumerate(ordered):
+        for parent in node.parent or []:
+            assert ordered.index(parent) < i
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        GraphExecutor(n_jobs=0)
+
+    with pytest.raises(ValueError):
+        GraphExecutor(n_jobs=2, backend='foo')
+
+
+@pytest.mark.parametrize('n_jobs,backend', [
+    (1, 'thread'), (4, 'thread'), (4, 'process'), (-1, 'thread')
+])
+def test_same_output_as_serial(train_data, n_jobs, backend, output_dir):
+    train_df, y = train_data
+    serial_df = create_graph().fit(train_df, y, n_jobs=1)
+
+    last = create_graph(root_dir=output_dir)
+    parallel_df = GraphExecutor(n_jobs=n_jobs, backend=backend).fit(last, train_df, y)
+    assert serial_df.equals(parallel_df)
+
+    for node in topological_sort(last):
+        assert node.feat_on_train_df is not None
+        assert node.n_calls == 1, node
+
+    pred_df = GraphExecutor(n_jobs=n_jobs, backend=backend).predict(last, train_df)
+    assert pred_df.equals(serial_df)
+
+
+def test_parents_of_cached_feature_not_run(train_data):
+    train_df, y = train_data
+    last = create_graph()
+    last.fit(train_df, y)
+
+    last.fit(train_df, y, n_jobs=2)
+    for node in topological_sort(last):
+        assert node.n_calls == 1
+
+
+def test_out_of_fold_graph(train_data):
+    train_df, y = train_data
+
+    def create_stacking():
+        entry = CountFeature(name='entry')
+        singles = [KNeighborRegressorOutOfFold(name=f'knn_{i}', parent=entry, add_init_param={'n_neighbors': 3 + i})
+                   for i in range(3)]
+        return KNeighborRegressorOutOfFold(name='stacking', parent=singles)
+
+    serial_df = create_stacking().fit(train_df, y, n_jobs=1)
+    parallel_df = create_stacking().fit(train_df, y, n_jobs=3)
+    assert serial_df.equals(parallel_df)
+
+
+@pytest.mark.parametrize('n_jobs', [1, 3])
+@pytest.mark.parametrize('recording', [True, False])
+def test_release_outputs(train_data, output_dir, n_jobs, recording):
+    train_df, y = train_data
+    last = create_graph(root_dir=output_dir if recording else None)
+    entry = topological_sort(last)[0]
+    stacking = last.parent[0]
+    # outputs are released by default
+    out_df = last.fit(train_df, y, n_jobs=n_jobs, keep_outputs=[stacking])
+
+    cache = get_feature_cache()
+    assert cache.in_memory((last._cache_token, 'train'))
+    assert cache.in_memory((stacking._cache_token, 'train'))
+    for node in [entry, *last.parent[1:]]:
+        assert not cache.in_memory((node._cache_token, 'train')), node
+
+    if recording:
+        # released outputs are read from the saved file
+        assert entry.feat_on_train_df.equals(train_df.iloc[:, :2].rename(columns=lambda c: f'entry_{c}'))
+    else:
+        assert entry.feat_on_train_df is None
+    assert out_df.equals(create_graph().fit(train_df, y, release_outputs=False))
+
+
+def test_keep_all_outputs(train_data):
+    train_df, y = train_data
+    last = create_graph()
+    last.fit(train_df, y, release_outputs=False)
+
+    for node in topological_sort(last):
+        assert get_feature_cache().in_memory((node._cache_token, 'train'))
+
+
+def test_release_outputs_without_writing(train_data, tmp_path, monkeypatch):
+    train_df, y = train_data
+    monkeypatch.setattr(get_feature_cache(), 'spill_dir', str(tmp_path))
+    get_feature_cache().reset_stats()
+    create_graph().fit(train_df, y)
+    assert get_feature_cache().get_stats()['spills'] == 0
+    assert not os.listdir(str(tmp_path))
+
+
+def test_plan(train_data, output_dir):
+    train_df, y = train_data
+    last = create_graph(root_dir=output_dir)
+    nodes = topological_sort(last)
+
+    plan_df = last.plan(train_df, y)
+    assert len(plan_df) == len(nodes)
+    assert (plan_df['state'] == 'missing').all()
+    assert plan_df['run'].all()
+    assert plan_df['estimated_seconds'].isnull().all()
+    # plan never runs features
+    assert all(node.n_calls == 0 for node in nodes)
+
+    last.fit(train_df, y, release_outputs=False)
+    plan_df = last.plan(train_df, y)
+    assert (plan_df['state'] == 'memory').all()
+    assert not plan_df['run'].any()
+
+    # new graph has no output in memory, but local outputs are available
+    last = create_graph(root_dir=output_dir)
+    plan_df = last.plan(train_df, y).set_index('name')
+    assert (plan_df['state'] == 'disk').all()
+    assert not plan_df['run'].any()
+
+    # change the target. all features are stale
+    plan_df = last.plan(train_df, y + 1).set_index('name')
+    assert (plan_df['state'] == 'stale').all()
+    assert plan_df['run'].all()
+    assert plan_df['estimated_seconds'].notnull().all()
+
+    # change only one first level feature.
+    last = create_graph(root_dir=output_dir)
+    changed = last.parent[1]
+    changed.scale = 100
+    plan_df = last.plan(train_df, y).set_index('name')
+    expected_run = {str(changed), str(last.parent[0]), str(last)}
+    assert set(plan_df.index[plan_df['run']]) == expected_run
+    assert plan_df.loc[str(topological_sort(last)[0]), 'state'] == 'disk'
+
+
+@pytest.mark.parametrize('n_jobs,backend', [(1, 'thread'), (3, 'thread'), (3, 'process')])
+def test_fit_predict(train_data, output_dir, n_jobs, backend):
+    train_df, y = train_data
+    test_df = train_df.iloc[:50] * 2
+    expected = create_graph()
+    expected_train = expected.fit(train_df, y)
+    expected_test = expected.predict(test_df)
+
+    last = create_graph(root_dir=output_dir)
+    out_train, out_test = GraphExecutor(n_jobs=n_jobs, backend=backend).fit_predict(last, train_df, y, test_df)
+    assert out_train.equals(expected_train)
+    assert out_test.equals(expected_test)
+    assert last.feat_on_test_df.equals(expected_test)
+    for node in topological_sort(last):
+        assert node.n_calls == 2, node
+
+
+def test_fit_predict_on_cached_graph(train_data):
+    train_df, y = train_data
+    last = create_graph()
+    # keep the outputs, the graph is not recording (released outputs are dropped)
+    last.fit(train_df, y, release_outputs=False)
+    changed = last.parent[1]
+    changed.scale = 100
+
+    test_df = train_df.iloc[:10]
+    out_train, out_test = last.fit_predict(train_df, y, test_df)
+
+    expected = create_graph()
+    expected.parent[1].scale = 100
+    assert out_train.equals(expected.fit(train_df, y))
+    assert out_test.equals(expected.predict(test_df))
+
+    # cached features only predict the test data
+    for node in topological_sort(last):
+        fitted = node in (changed, last.parent[0], last)
+        assert node.n_calls == (3 if fitted else 2), node
+
+
+def test_fit_predict_out_of_fold(train_data):
+    train_df, y = train_data
+    test_df = train_df.iloc[:20]
+    entry = CountFeature(name='entry')
+    knn = KNeighborRegressorOutOfFold(name='knn', parent=entry)
+
+    out_train, out_test = knn.fit_predict(train_df, y, test_df)
+    assert out_train.equals(knn.feat_on_train_df)
+    assert out_test.equals(knn.predict(test_df, recreate=True))
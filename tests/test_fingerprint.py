@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from sklearn.linear_model import Ridge
+from sklearn.model_selection import KFold, PredefinedSplit
+
+from vivid.fingerprint import fingerprint_array, fingerprint_dataframe, fingerprint_params, combine_fingerprints
+
+
+def test_array_fingerprint():
+    x = np.random.uniform(size=(10, 3))
+    assert fingerprint_array(x) == fingerprint_array(x.copy())
+    assert fingerprint_array(x) != fingerprint_array(x.astype(np.float32))
+    assert fingerprint_array(x) != fingerprint_array(x.reshape(3, 10))
+    assert fingerprint_array(x) == fingerprint_array(np.asfortranarray(x))
+    assert fingerprint_array(None) != fingerprint_array(np.array([]))
+
+
+def test_dataframe_fingerprint(toy_df):
+    assert fingerprint_dataframe(toy_df) == fingerprint_dataframe(toy_df.copy())
+
+    renamed = toy_df.rename(columns={'int_type': 'foo'})
+    assert fingerprint_dataframe(toy_df) != fingerprint_dataframe(renamed)
+
+    changed = toy_df.copy()
+    changed.iloc[0, 0] = 100
+    assert fingerprint_dataframe(toy_df) != fingerprint_dataframe(changed)
+
+
+@pytest.mark.parametrize('params1,params2', [
+    ({'a': 1, 'b': 2}, {'b': 2, 'a': 1}),
+    ({'cv': KFold(n_splits=3)}, {'cv': KFold(n_splits=3)}),
+    ({'x': np.arange(3)}, {'x': np.arange(3)}),
+])
+def test_same_params(params1, params2):
+    assert fingerprint_params(params1) == fingerprint_params(params2)
+
+
+@pytest.mark.parametrize('params1,params2', [
+    ({'a': 1}, {'a': 2}),
+    ({'cv': KFold(n_splits=3)}, {'cv': KFold(n_splits=4)}),
+    ({'a': 1}, {'a': '1'}),
+    # the repr of long parameters is truncated
+    ({'cv': PredefinedSplit(np.arange(5000) % 5)}, {'cv': PredefinedSplit(np.arange(5000)[::-1] % 5)}),
+    ({'x': np.zeros(5000)}, {'x': np.r_[np.zeros(4999), 1.]}),
+    ({'model': Ridge(alpha=np.ones(5000))}, {'model': Ridge(alpha=np.r_[np.ones(4999), 2.])}),
+])
+def test_different_params(params1, params2):
+    assert fingerprint_params(params1) != fingerprint_params(params2)
+
+
+def test_combine():
+    assert combine_fingerprints('a', 'b') != combine_fingerprints('b', 'a')
+    assert combine_fingerprints('ab', 'c') != combine_fingerprints('a', 'bc')
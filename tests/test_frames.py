@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from vivid.frames import concat_columns
+
+
+def sequential_concat(frames):
+    out_df = pd.DataFrame()
+    for df in frames:
+        out_df = pd.concat([out_df, df], axis=1)
+    return out_df
+
+
+@pytest.mark.parametrize('frames', [
+    [pd.DataFrame(np.random.uniform(size=(10, i + 1)), columns=[f'c{i}_{j}' for j in range(i + 1)])
+     for i in range(4)],
+    [pd.DataFrame(np.random.uniform(size=(10, 2))), pd.DataFrame(np.random.uniform(size=(10, 2)))],
+    # mixed dtypes
+    [pd.DataFrame({'a': np.arange(10)}), pd.DataFrame({'b': np.random.uniform(size=10)})],
+    [pd.DataFrame({'a': np.arange(10)}), pd.DataFrame({'b': ['foo'] * 10})],
+    # different index
+    [pd.DataFrame({'a': np.arange(10.)}), pd.DataFrame({'b': np.arange(10.)}, index=np.arange(5, 15))],
+])
+def test_same_as_pandas_concat(frames):
+    expected = sequential_concat(frames)
+    actual = concat_columns(frames)
+    pd.testing.assert_frame_equal(expected, actual, check_column_type=False)
+
+
+def test_single_allocation():
+    frames = [pd.DataFrame(np.random.uniform(size=(100, 3)).astype(np.float32)) for _ in range(5)]
+    df = concat_columns(frames)
+
+    values = df.values
+    assert values.shape == (100, 15)
+    assert values.flags['C_CONTIGUOUS']
+    # values is the storage of the dataframe itself (no copy)
+    assert np.shares_memory(values, df.iloc[:, 0].values)
+
+    # input frames are not shared
+    for frame in frames:
+        assert not np.shares_memory(values, frame.values)
+
+
+def test_empty():
+    assert concat_columns([]).empty
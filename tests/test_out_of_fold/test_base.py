@@ -1,7 +1,10 @@
 import os
+import tempfile
 from typing import Type
 
+import joblib
 import numpy as np
+import optuna
 import pandas as pd
 import pytest
 from sklearn.metrics import make_scorer
@@ -9,10 +12,15 @@ from sklearn.metrics import mean_absolute_error, mean_squared_log_error
 from sklearn.model_selection import KFold, StratifiedKFold
 
 from tests.conftest import SampleFeature, RecordingFeature
+from vivid.env import Settings
+from vivid.frames import iter_row_chunks
 from vivid.out_of_fold import boosting
-from vivid.out_of_fold.base import NotFittedError, BaseOutOfFoldFeature, EnsembleFeature
+from vivid.out_of_fold.base import NotFittedError, BaseOutOfFoldFeature, EnsembleFeature, \
+    aggregate_fold_predictions
 from vivid.out_of_fold.ensumble import RFRegressorFeatureOutOfFold
-from vivid.out_of_fold.kneighbor import OptunaKNeighborRegressorOutOfFold
+from vivid.out_of_fold.kneighbor import OptunaKNeighborRegressorOutOfFold, KNeighborRegressorOutOfFold
+from vivid.out_of_fold.registry import get_model_registry
+from vivid.out_of_fold.svm import SVROutOfFold
 
 base_feat = SampleFeature()
 
@@ -242,3 +250,388 @@ class TestLightGBM(object):
         train_df, y = regression_data
         feat = boosting.LGBMRegressorOutOfFold(parent=None, name='test_lightgbm')
         feat.fit(train_df, y, force=True)
+
+
+def test_predict_iter(regression_data):
+    df, y = regression_data
+    model = KNeighborRegressorOutOfFold(name='knn', parent=RecordingFeature())
+    model.fit(df, y)
+    pred_df = model.predict(df)
+
+    chunk_df = pd.concat(model.predict_iter(iter_row_chunks(df, chunk_size=100)))
+    assert np.array_equal(chunk_df.values, pred_df.values)
+
+
+@pytest.mark.parametrize('fold_backend', ['thread', 'process'])
+@pytest.mark.parametrize('model_class', [KNeighborRegressorOutOfFold, RFRegressorFeatureOutOfFold])
+def test_fold_parallel(regression_data, model_class, fold_backend):
+    df, y = regression_data
+    params = {'n_estimators': 10, 'random_state': 1} if model_class is RFRegressorFeatureOutOfFold else {}
+    serial = model_class(name='serial', add_init_param=params, n_fold_jobs=1)
+    serial_df = serial.fit(df, y)
+
+    parallel = model_class(name='parallel', add_init_param=params, n_fold_jobs=3, fold_backend=fold_backend)
+    parallel_df = parallel.fit(df, y)
+    assert np.array_equal(serial_df.values, parallel_df.values)
+    assert len(parallel._fitted_models) == len(serial._fitted_models)
+    assert np.array_equal(serial.predict(df).values, parallel.predict(df).values)
+
+
+def test_invalid_fold_jobs():
+    with pytest.raises(ValueError):
+        KNeighborRegressorOutOfFold(name='knn', n_fold_jobs=0)
+    with pytest.raises(ValueError):
+        KNeighborRegressorOutOfFold(name='knn', fold_backend='foo')
+
+
+def test_limit_model_threads():
+    feat = RFRegressorFeatureOutOfFold(name='rf')
+    params = feat.limit_model_threads({'n_jobs': -1}, n_workers=os.cpu_count() or 1)
+    assert params['n_jobs'] == 1
+    # model without `n_jobs` parameter is not changed
+    assert SVROutOfFold(name='svr').limit_model_threads({'C': 1.}, n_workers=2) == {'C': 1.}
+
+
+class BrokenKNeighborOutOfFold(KNeighborRegressorOutOfFold):
+    """raise error at `broken_fold` th fold"""
+
+    def __init__(self, broken_fold=None, **kwargs):
+        super(BrokenKNeighborOutOfFold, self).__init__(**kwargs)
+        self.broken_fold = broken_fold
+        self.n_fitted = 0
+
+    def _fit_model(self, X, y, default_params, validation_set, indexes_set, output_dir=None):
+        if self.n_fitted == self.broken_fold:
+            raise RuntimeError('broken')
+        self.n_fitted += 1
+        return super(BrokenKNeighborOutOfFold, self)._fit_model(X, y, default_params, validation_set, indexes_set,
+                                                                output_dir=output_dir)
+
+
+def test_resume_from_fold_checkpoints(regression_data):
+    df, y = regression_data
+    expected = KNeighborRegressorOutOfFold(name='knn')
+    expected_df = expected.fit(df, y)
+
+    feat = BrokenKNeighborOutOfFold(name='resume', parent=RecordingFeature(), broken_fold=3)
+    with pytest.raises(RuntimeError):
+        feat.fit(df, y, force=True)
+    assert feat.n_fitted == 3
+    assert all(os.path.exists(feat.get_fold_checkpoint_path(i)) for i in range(3))
+
+    # finished 3 folds are loaded from checkpoints
+    feat.broken_fold = None
+    feat.n_fitted = 0
+    out_df = feat.fit(df, y)
+    assert feat.n_fitted == 2
+    assert np.allclose(out_df.values, expected_df.values)
+    assert np.allclose(feat.predict(df, recreate=True).values, expected.predict(df).values)
+
+    # checkpoints are removed after all folds are finished
+    assert not any(os.path.exists(feat.get_fold_checkpoint_path(i)) for i in range(feat.num_cv))
+
+
+def test_not_resume_on_random_splits(regression_data):
+    df, y = regression_data
+    feat = BrokenKNeighborOutOfFold(name='resume_random', parent=RecordingFeature(), broken_fold=3,
+                                    cv=KFold(n_splits=5, shuffle=True))
+    with pytest.raises(RuntimeError):
+        feat.fit(df, y, force=True)
+    assert not any(os.path.exists(feat.get_fold_checkpoint_path(i)) for i in range(3))
+
+    feat.broken_fold = None
+    feat.n_fitted = 0
+    feat.fit(df, y)
+    assert feat.n_fitted == feat.num_cv
+
+
+def test_not_resume_on_other_splits(regression_data):
+    df, y = regression_data
+    feat = BrokenKNeighborOutOfFold(name='resume_other_splits', parent=RecordingFeature(), broken_fold=3)
+    with pytest.raises(RuntimeError):
+        feat.fit(df, y, force=True)
+
+    # same key, but the checkpoints have the other validation rows
+    for i in range(3):
+        path = feat.get_fold_checkpoint_path(i)
+        checkpoint = joblib.load(path)
+        checkpoint['idx_valid'] = checkpoint['idx_valid'][::-1]
+        joblib.dump(checkpoint, path)
+
+    feat.broken_fold = None
+    feat.n_fitted = 0
+    feat.fit(df, y)
+    assert feat.n_fitted == feat.num_cv
+
+
+def test_not_resume_on_other_data(regression_data):
+    df, y = regression_data
+    feat = BrokenKNeighborOutOfFold(name='resume_other', parent=RecordingFeature(), broken_fold=2)
+    with pytest.raises(RuntimeError):
+        feat.fit(df, y, force=True)
+
+    feat.broken_fold = None
+    feat.n_fitted = 0
+    feat.fit(df, y + 1)
+    assert feat.n_fitted == feat.num_cv
+
+
+@pytest.mark.parametrize('agg,expected', [
+    ('mean', [7 / 3, 4.]), ('median', [2., 2.]), ('gmean', [2., 2. ** (5 / 3)])
+])
+def test_aggregate_fold_predictions(agg, expected):
+    fold_predicts = [np.array([1., 2.]), np.array([2., 2.]), np.array([4., 8.])]
+    pred = aggregate_fold_predictions(fold_predicts, agg=agg)
+    assert pred.dtype == np.float32
+    assert np.allclose(pred, expected)
+
+
+@pytest.mark.parametrize('n_fold_jobs,chunk_size', [(1, None), (3, None), (3, 100), (1, 7)])
+def test_chunked_fold_predict(regression_data, n_fold_jobs, chunk_size):
+    df, y = regression_data
+    feat = KNeighborRegressorOutOfFold(name='knn', n_fold_jobs=n_fold_jobs, predict_chunk_size=chunk_size)
+    feat.fit(df, y)
+    pred_df = feat.predict(df)
+
+    fold_predicts = [m.predict(df.values).reshape(-1) for m in feat._fitted_models]
+    assert np.allclose(pred_df.values[:, 0], np.mean(fold_predicts, axis=0), rtol=1e-5)
+
+    median = KNeighborRegressorOutOfFold(name='knn_median', fold_agg='median', predict_chunk_size=chunk_size)
+    median.fit(df, y)
+    assert np.allclose(median.predict(df).values[:, 0], np.median(fold_predicts, axis=0), rtol=1e-5)
+
+
+def test_invalid_fold_agg():
+    with pytest.raises(ValueError):
+        KNeighborRegressorOutOfFold(name='knn', fold_agg='foo')
+
+
+class PruneAfterFirstTrial(optuna.pruners.BasePruner):
+    def prune(self, study, trial) -> bool:
+        return trial.number > 0
+
+
+class CountingOptunaKNeighbor(OptunaKNeighborRegressorOutOfFold):
+    optuna_jobs = 1
+
+    def __init__(self, **kwargs):
+        super(CountingOptunaKNeighbor, self).__init__(**kwargs)
+        self.n_fitted = 0
+
+    def _fit_model(self, *args, **kwargs):
+        self.n_fitted += 1
+        return super(CountingOptunaKNeighbor, self)._fit_model(*args, **kwargs)
+
+
+def test_optuna_pruning(regression_data):
+    df, y = regression_data
+    model = CountingOptunaKNeighbor(name='pruning', n_trials=3, pruner=PruneAfterFirstTrial(), cv=5,
+                                    parent=RecordingFeature())
+    model.fit(df, y)
+
+    states = model.study.trials_dataframe()['state'].tolist()
+    assert states == ['COMPLETE', 'PRUNED', 'PRUNED']
+    # first trial (5 folds) + pruned trials (1 fold each) + final training (5 folds)
+    assert model.n_fitted == 5 + 1 + 1 + 5
+    assert model.exp_backend.get_marked()['optuna_n_pruned'] == 2
+
+    study_log = pd.read_csv(os.path.join(model.output_dir, 'study_log.csv'))
+    assert (study_log['state'] == 'PRUNED').sum() == 2
+
+
+@pytest.mark.parametrize('pruner,expected', [
+    (None, optuna.pruners.NopPruner),
+    ('median', optuna.pruners.MedianPruner),
+    ('successive_halving', optuna.pruners.SuccessiveHalvingPruner),
+    ('hyperband', optuna.pruners.HyperbandPruner),
+])
+def test_create_pruner(pruner, expected):
+    model = OptunaKNeighborRegressorOutOfFold(name='pruner', pruner=pruner)
+    assert isinstance(model.create_pruner(), expected)
+
+
+def test_invalid_pruner():
+    with pytest.raises(ValueError):
+        OptunaKNeighborRegressorOutOfFold(name='pruner', pruner='foo')
+
+
+def test_resume_optuna_study(regression_data, output_dir):
+    df, y = regression_data
+
+    def create(n_trials):
+        return CountingOptunaKNeighbor(name='resume_study', n_trials=n_trials, parent=RecordingFeature())
+
+    model = create(n_trials=2)
+    model.fit(df, y)
+    assert model.get_storage().startswith('sqlite:///')
+    assert os.path.exists(os.path.join(model.output_dir, 'optuna.db'))
+
+    # only remaining trials are run
+    model = create(n_trials=3)
+    model.fit(df, y, force=True)
+    assert len(model.study.trials) == 3
+    assert model.n_fitted == model.num_cv * 2
+
+    # all trials are finished
+    model = create(n_trials=3)
+    model.fit(df, y, force=True)
+    assert len(model.study.trials) == 3
+    assert model.n_fitted == model.num_cv
+
+    # other data creates new study
+    model = create(n_trials=1)
+    model.fit(df, y + 1, force=True)
+    assert len(model.study.trials) == 1
+
+
+def test_shared_optuna_storage(regression_data, output_dir):
+    df, y = regression_data
+    storage = 'sqlite:///' + os.path.join(output_dir, 'shared.db')
+    model = CountingOptunaKNeighbor(name='shared_study', n_trials=2, storage=storage)
+    model.fit(df, y)
+
+    other = CountingOptunaKNeighbor(name='shared_study', n_trials=2, storage=storage)
+    other.fit(df, y)
+    assert other.study.study_name == model.study.study_name
+    assert len(other.study.trials) == 2
+    assert other.n_fitted == other.num_cv
+
+
+def test_in_memory_study_without_recording():
+    model = OptunaKNeighborRegressorOutOfFold(name='memory_study')
+    assert model.get_storage() is None
+
+
+def test_invalid_trial_backend():
+    with pytest.raises(ValueError):
+        OptunaKNeighborRegressorOutOfFold(name='trial_backend', trial_backend='foo')
+
+
+@pytest.mark.parametrize('optuna_jobs', [1, 2, -1])
+def test_trial_model_threads(optuna_jobs):
+    model = OptunaKNeighborRegressorOutOfFold(name='trial_threads')
+    model.optuna_jobs = optuna_jobs
+    params = model.generate_try_parameter(optuna.trial.FixedTrial({
+        'weights': 'uniform', 'p': 2, 'n_neighbors': 5, 'algorithm': 'kd_tree', 'leaf_size': 30}))
+    n_workers = os.cpu_count() if optuna_jobs < 0 else optuna_jobs
+    assert params['n_jobs'] == max(1, os.cpu_count() // n_workers)
+
+
+@pytest.mark.parametrize('shared_storage', [True, False])
+def test_process_trial_backend(regression_data, tmp_path, monkeypatch, shared_storage):
+    df, y = regression_data
+    monkeypatch.setattr(Settings, 'CACHE_DIR', str(tmp_path))
+    created = []
+    original_mkdtemp = tempfile.mkdtemp
+
+    def mkdtemp(prefix=None, **kwargs):
+        created.append(original_mkdtemp(prefix=prefix, dir=str(tmp_path)))
+        return created[-1]
+
+    monkeypatch.setattr(tempfile, 'mkdtemp', mkdtemp)
+    storage = 'sqlite:///' + str(tmp_path / 'shared.db') if shared_storage else None
+    model = OptunaKNeighborRegressorOutOfFold(name='process_trials', n_trials=4, trial_backend='process',
+                                              storage=storage)
+    model.optuna_jobs = 2
+    out_df = model.fit(df, y)
+
+    # trials run in the workers are collected by the storage
+    finished = [t for t in model.study.trials if t.state == optuna.trial.TrialState.COMPLETE]
+    assert len(finished) >= 4
+    assert len({t.number for t in finished}) == len(finished)
+    assert len(out_df) == len(df)
+
+    temporary_dirs = [d for d in created if os.path.basename(d).startswith('vivid_optuna_')]
+    if not shared_storage:
+        # temporary storage is removed, and the study is kept in memory
+        assert len(temporary_dirs) == 1
+        assert not os.path.exists(temporary_dirs[0])
+        assert isinstance(model.study._storage, optuna.storages.InMemoryStorage)
+    else:
+        assert not temporary_dirs
+
+
+def test_successive_halving(regression_data, output_dir):
+    df, y = regression_data
+
+    def create():
+        return CountingOptunaKNeighbor(name='halving', n_trials=9, halving_rungs=[.3, {'rows': .6}], halving_factor=3,
+                                       storage='sqlite:///' + os.path.join(output_dir, 'halving.db'))
+
+    model = create()
+    model.fit(df, y, force=True)
+
+    # 9 trials on 30% rows -> 3 trials on 60% rows -> 1 trial on full data
+    assert len(model.study.trials) == 1
+    rung1 = optuna.load_study(study_name=model.study.study_name + '_rung1', storage=model.storage)
+    assert len(rung1.trials) == 3
+    rung0 = optuna.load_study(study_name=model.study.study_name + '_rung0', storage=model.storage)
+    top_params = sorted(rung0.trials, key=lambda t: t.value, reverse=True)[0].params
+    assert top_params in [t.params for t in rung1.trials]
+    assert model.n_fitted == model.num_cv * (9 + 3 + 1 + 1)
+
+    # rerun resumes all rungs
+    model = create()
+    model.fit(df, y, force=True)
+    assert model.n_fitted == model.num_cv
+
+
+def test_rung_rows_stratified():
+    model = OptunaKNeighborRegressorOutOfFold(name='rung')
+    assert len(model.get_rung_rows(np.zeros(100), rows=.2)) == 20
+    assert len(model.get_rung_rows(np.zeros(100), rows=1.)) == 100
+
+
+@pytest.mark.parametrize('rungs', [[0], [1.5], [{'rows': .5, 'foo': 1}]])
+def test_invalid_halving_rungs(rungs):
+    with pytest.raises(ValueError):
+        OptunaKNeighborRegressorOutOfFold(name='rung', halving_rungs=rungs)
+
+
+def test_rung_budget_of_boosting():
+    model = boosting.OptunaXGBRegressionOutOfFold(name='xgb_rung', halving_rungs=[{'budget': .1}])
+    params = model.apply_rung_budget({'n_estimators': 1000}, budget=.1)
+    assert params['n_estimators'] == 100
+    assert model.apply_rung_budget({'n_estimators': 50}, budget=.1)['n_estimators'] == model.min_rung_estimators
+
+
+class TinySpaceOptunaKNeighbor(CountingOptunaKNeighbor):
+    def generate_model_class_try_params(self, trial):
+        return {'weights': trial.suggest_categorical('weights', ['distance', 'uniform'])}
+
+
+def test_memoize_duplicate_trials(regression_data):
+    df, y = regression_data
+    model = TinySpaceOptunaKNeighbor(name='memoize', n_trials=6, parent=RecordingFeature())
+    model.fit(df, y)
+
+    n_distinct = len({t.params['weights'] for t in model.study.trials})
+    # only distinct parameters are trained (+ final training)
+    assert model.n_fitted == model.num_cv * (n_distinct + 1)
+    n_hits = 6 - n_distinct
+    assert model.exp_backend.get_marked()['optuna_n_cache_hits'] == n_hits
+
+    study_log = pd.read_csv(os.path.join(model.output_dir, 'study_log.csv'))
+    assert study_log['user_attrs_cache_hit'].sum() == n_hits
+
+
+def test_refit(regression_data):
+    df, y = regression_data
+    feat = KNeighborRegressorOutOfFold(name='refit', refit=True, parent=RecordingFeature())
+    oof = feat.fit(df, y)
+    baseline = KNeighborRegressorOutOfFold(name='no_refit').fit(df, y)
+
+    # train output is still out-of-fold
+    assert np.allclose(oof.values, baseline.values)
+    assert len(feat._fold_models) == feat.num_cv
+    refit_model, = feat._fitted_models
+    assert refit_model.fitted_model_.n_samples_fit_ == len(df)
+
+    pred = feat.predict(df)
+    assert np.allclose(pred.values[:, 0], refit_model.predict(df.values).reshape(-1), atol=1e-4)
+
+    # new feature (like the one in other process) loads the refit model
+    get_model_registry().clear()
+    new_feat = KNeighborRegressorOutOfFold(name='refit', refit=True, parent=RecordingFeature())
+    assert len(new_feat.load_best_models()) == 1
+    assert np.allclose(new_feat.predict(df, recreate=True).values, pred.values)
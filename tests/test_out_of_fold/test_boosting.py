@@ -1,8 +1,14 @@
+import json
+import os
+
 import numpy as np
 import pytest
+import xgboost as xgb
 
 from vivid.out_of_fold import boosting
 from vivid.out_of_fold.boosting.block import create_boosting_seed_blocks
+from vivid.out_of_fold.boosting.helpers import get_best_iteration
+from vivid.out_of_fold.boosting.native import predict_booster
 
 
 def test_boosting_seed_block_default_prefix():
@@ -38,3 +44,89 @@ def test_change_seed_number():
 
     seeds = [m._initial_params.get('random_state', None) for m in models if '_ensemble' not in m.name]
     assert len(np.unique(seeds)) == 10, seeds
+
+
+@pytest.mark.parametrize('feature_class', [boosting.LGBMRegressorOutOfFold, boosting.XGBoostRegressorOutOfFold])
+def test_refit_with_mean_best_iteration(feature_class, regression_data):
+    df, y = regression_data
+    feat = feature_class(name='refit_boosting', refit=True, add_init_param={'n_estimators': 500})
+    feat.early_stopping_rounds = 5
+    feat.fit(df, y)
+
+    best_iterations = [get_best_iteration(m.fitted_model_) for m in feat._fold_models]
+    refit_model, = feat._fitted_models
+    assert refit_model.fitted_model_.get_params()['n_estimators'] == int(np.round(np.mean(best_iterations)))
+    assert len(feat.predict(df)) == len(df)
+
+
+@pytest.mark.parametrize('feature_class', [boosting.LGBMRegressorOutOfFold, boosting.XGBoostRegressorOutOfFold])
+def test_merge_folds_regression(feature_class, regression_data):
+    df, y = regression_data
+    feat = feature_class(name='merge_folds', merge_folds=True, add_init_param={'n_estimators': 300})
+    feat.early_stopping_rounds = 5
+    feat.fit(df, y)
+
+    fold_mean = np.mean([m.predict(df.values) for m in feat._fitted_models], axis=0)
+    pred = feat.predict(df).values[:, 0]
+    assert np.allclose(pred, fold_mean, atol=1e-3)
+
+
+@pytest.mark.parametrize('fold_agg', ['median', 'gmean'])
+def test_merge_folds_with_fold_agg(fold_agg):
+    with pytest.raises(ValueError):
+        boosting.LGBMRegressorOutOfFold(name='merge_folds', merge_folds=True, fold_agg=fold_agg)
+
+
+@pytest.mark.parametrize('feature_class', [boosting.LGBMClassifierOutOfFold, boosting.XGBoostClassifierOutOfFold])
+def test_merge_folds_classification(feature_class, binary_data, output_dir):
+    df, y = binary_data
+    feat = feature_class(name='merge_folds', merge_folds=True, add_init_param={'n_estimators': 300})
+    feat.early_stopping_rounds = 5
+    feat.fit(df, y)
+
+    probs = np.array([m.predict(df.values, prob=True)[:, 1] for m in feat._fitted_models])
+    mean_raw = np.mean(np.log(probs) - np.log1p(-probs), axis=0)
+    pred = feat.predict(df).values[:, 0]
+    assert np.allclose(pred, 1 / (1 + np.exp(-mean_raw)), atol=1e-3)
+
+    path = os.path.join(output_dir, 'merged_booster')
+    feat.export_merged_booster(path)
+    assert os.path.exists(path)
+
+
+def test_not_merge_scaled_models(regression_data):
+    df, y = regression_data
+    feat = boosting.LGBMRegressorOutOfFold(name='merge_scaled', merge_folds=True,
+                                           add_init_param={'n_estimators': 10, 'input_scaling': 'standard'})
+    feat.fit(df, y)
+    with pytest.raises(ValueError):
+        feat.predict(df)
+
+
+@pytest.mark.parametrize('feature_class,data', [
+    (boosting.LGBMRegressorOutOfFold, 'regression_data'),
+    (boosting.XGBoostRegressorOutOfFold, 'regression_data'),
+    (boosting.LGBMClassifierOutOfFold, 'binary_data'),
+    (boosting.XGBoostClassifierOutOfFold, 'binary_data'),
+])
+@pytest.mark.parametrize('add_init_param', [{}, {'input_logscale': True, 'input_scaling': 'standard'}])
+def test_native_predict(feature_class, data, add_init_param, request):
+    df, y = request.getfixturevalue(data)
+    feat = feature_class(name='native_predict', native_predict=True, predict_threads=2,
+                         add_init_param={'n_estimators': 50, **add_init_param})
+    feat.fit(df, y)
+
+    pred = feat.predict(df).values[:, 0]
+    feat.native_predict = False
+    expected = feat.predict(df, recreate=True).values[:, 0]
+    assert np.allclose(pred, expected, atol=1e-3)
+
+
+def test_predict_threads_not_change_booster(regression_data):
+    df, y = regression_data
+    model = xgb.XGBRegressor(n_estimators=5, n_jobs=3).fit(df.values, y)
+    booster = model.get_booster()
+
+    predict_booster(booster, df.values.astype(np.float32), n_threads=1)
+    config = json.loads(booster.save_config())
+    assert config['learner']['generic_param']['nthread'] == '3'
@@ -0,0 +1,115 @@
+import os
+
+import numpy as np
+import pytest
+from sklearn.model_selection import GroupKFold, KFold, PredefinedSplit, ShuffleSplit, StratifiedShuffleSplit
+
+from tests.conftest import RecordingFeature
+from vivid.env import Settings
+from vivid.out_of_fold.folds import FoldStore, get_fold_store, is_deterministic
+from vivid.out_of_fold.kneighbor import KNeighborRegressorOutOfFold
+
+
+class CountingKFold(KFold):
+    n_called = 0
+
+    def split(self, X, y=None, groups=None):
+        CountingKFold.n_called += 1
+        return super(CountingKFold, self).split(X, y, groups)
+
+
+def test_save_and_load(tmp_path):
+    X, y = np.zeros((100, 2)), np.arange(100)
+    cv = KFold(n_splits=4, shuffle=True, random_state=1)
+    store = FoldStore()
+    splits = store.get_splits(cv, X, y, save_dir=str(tmp_path))
+    assert os.path.exists(store.get_path(store.get_key(cv, y), str(tmp_path)))
+    assert all(idx.dtype == np.int32 for s in splits for idx in s)
+
+    # new store (like the one in other process) loads the same splits from the file
+    new_store = FoldStore()
+    loaded = new_store.get_splits(cv, X, y, save_dir=str(tmp_path))
+    assert new_store.get_stats()['loads'] == 1
+    for (a_train, a_valid), (b_train, b_valid) in zip(splits, loaded):
+        assert np.array_equal(a_train, b_train)
+        assert np.array_equal(a_valid, b_valid)
+
+
+def test_not_save_without_recording(regression_data, tmp_path, monkeypatch):
+    df, y = regression_data
+    monkeypatch.setattr(Settings, 'CACHE_DIR', str(tmp_path))
+    feat = KNeighborRegressorOutOfFold(name='knn_not_recording', cv=KFold(n_splits=3, shuffle=True, random_state=2))
+    feat.fit(df, y)
+    assert feat.fold_save_dir is None
+    assert get_fold_store().get_key(feat.cv, y) in get_fold_store()
+    assert not os.listdir(str(tmp_path))
+
+
+def test_save_failure_is_warned(tmp_path):
+    not_dir = tmp_path / 'file'
+    not_dir.write_text('')
+    with pytest.warns(UserWarning):
+        splits = FoldStore().get_splits(KFold(n_splits=3), np.zeros((10, 1)), np.arange(10), save_dir=str(not_dir))
+    assert len(splits) == 3
+
+
+def test_shuffle_without_seed_is_not_stored():
+    store = FoldStore()
+    cv = KFold(n_splits=3, shuffle=True)
+    for _ in range(2):
+        store.get_splits(cv, np.zeros((10, 1)), np.arange(10))
+    assert store.get_stats()['splits'] == 2
+    assert store.get_stats()['n_entries'] == 0
+
+
+@pytest.mark.parametrize('cv,expected', [
+    (KFold(n_splits=3), True),
+    (KFold(n_splits=3, shuffle=True, random_state=1), True),
+    (KFold(n_splits=3, shuffle=True), False),
+    (KFold(n_splits=3, shuffle=True, random_state=np.random.RandomState(1)), False),
+    (ShuffleSplit(n_splits=3), False),
+    (StratifiedShuffleSplit(n_splits=3), False),
+    (ShuffleSplit(n_splits=3, random_state=1), True),
+    (GroupKFold(n_splits=3), True),
+])
+def test_is_deterministic(cv, expected):
+    assert is_deterministic(cv) == expected
+
+
+def test_shuffle_split_is_not_saved(tmp_path):
+    store = FoldStore()
+    store.get_splits(ShuffleSplit(n_splits=3), np.zeros((10, 1)), np.arange(10), save_dir=str(tmp_path))
+    assert store.get_stats()['n_entries'] == 0
+    assert not os.listdir(str(tmp_path))
+
+
+def test_key_changes():
+    store = FoldStore()
+    y = np.arange(10)
+    key = store.get_key(KFold(n_splits=5), y)
+    assert key == store.get_key(KFold(n_splits=5), y.copy())
+    assert key != store.get_key(KFold(n_splits=3), y)
+    assert key != store.get_key(KFold(n_splits=5), y[::-1])
+    assert key != store.get_key(KFold(n_splits=5), y, groups=np.arange(10) % 2)
+
+    # long array attributes are not truncated
+    y = np.arange(5000)
+    assert store.get_key(PredefinedSplit(y % 5), y) != store.get_key(PredefinedSplit(y[::-1] % 5), y)
+
+
+def test_share_splits_in_graph(regression_data):
+    df, y = regression_data
+    get_fold_store().clear()
+    CountingKFold.n_called = 0
+
+    entry = RecordingFeature()
+    feats = [KNeighborRegressorOutOfFold(name=f'knn_fold_{i}', parent=entry,
+                                         cv=CountingKFold(n_splits=3, shuffle=True, random_state=1))
+             for i in range(2)]
+    for feat in feats:
+        feat.fit(df, y)
+
+    assert CountingKFold.n_called == 1
+    assert feats[0].exp_backend.get_marked()['fold_key'] == feats[1].get_fold_key(y)
+    # the splits are saved in the root dir of the recording features
+    assert os.path.exists(get_fold_store().get_path(feats[0].get_fold_key(y), feats[0].fold_save_dir))
@@ -0,0 +1,64 @@
+import numpy as np
+
+from tests.conftest import RecordingFeature
+from vivid.out_of_fold.kneighbor import KNeighborRegressorOutOfFold
+from vivid.out_of_fold.registry import ModelRegistry, get_model_registry, warm_up
+
+
+def test_lru_eviction():
+    registry = ModelRegistry(max_bytes=20)
+    registry.put('a', [1], nbytes=10)
+    registry.put('b', [2], nbytes=10)
+    assert registry.get('a') == [1]
+
+    # `b` is least recently used
+    registry.put('c', [3], nbytes=10)
+    assert 'b' not in registry
+    assert 'a' in registry and 'c' in registry
+    assert registry.get_stats()['evictions'] == 1
+
+
+def test_version():
+    registry = ModelRegistry()
+    registry.put('a', [1], version=1)
+    assert registry.get('a', version=1) == [1]
+    assert registry.get('a', version=2) is None
+
+    loaded = registry.get_or_load('a', lambda: [2], version=2)
+    assert loaded == [2]
+    assert registry.get('a', version=2) == [2]
+
+
+def test_load_models_once(regression_data):
+    df, y = regression_data
+    feat = KNeighborRegressorOutOfFold(name='registry', parent=RecordingFeature())
+    feat.fit(df, y)
+
+    # new feature (like the one in a new process) uses the models registered on fit
+    registry = get_model_registry()
+    registry.clear()
+    registry.reset_stats()
+    new_feat = KNeighborRegressorOutOfFold(name='registry', parent=RecordingFeature())
+    first = new_feat.predict(df, recreate=True)
+    second = new_feat.predict(df, recreate=True)
+    assert np.array_equal(first.values, second.values)
+    assert registry.get_stats()['misses'] == 1
+    assert registry.get_stats()['hits'] == 1
+
+    # fit again creates the new version
+    new_feat.fit(df, y, force=True)
+    key, version = new_feat._get_registry_key()
+    assert registry.get(key, version=version) is new_feat._fitted_models
+
+
+def test_warm_up(regression_data):
+    df, y = regression_data
+    entry = RecordingFeature()
+    feats = [KNeighborRegressorOutOfFold(name=f'knn_{i}', parent=entry) for i in range(2)]
+    stacking = KNeighborRegressorOutOfFold(name='stacking', parent=feats)
+    stacking.fit(df, y)
+
+    registry = get_model_registry()
+    registry.clear()
+    assert warm_up(stacking) == 3
+    assert registry.get_stats()['n_entries'] == 3
@@ -0,0 +1,79 @@
+import numpy as np
+
+from tests.conftest import RecordingFeature
+from vivid.out_of_fold.kneighbor import KNeighborRegressorOutOfFold
+from vivid.out_of_fold.transform_cache import FoldTransform, FoldTransformCache, get_fold_transform_cache
+from vivid.sklearn_extend.wrapper import UtilityTransform
+
+
+def create_transform(n):
+    return FoldTransform(None, None, np.zeros(n, dtype=np.int8), np.zeros(0), np.zeros(0), np.zeros(0))
+
+
+def test_lru_eviction():
+    cache = FoldTransformCache(max_bytes=20)
+    cache.put('a', create_transform(10))
+    cache.put('b', create_transform(10))
+    assert cache.get('a') is not None
+
+    # `b` is least recently used
+    cache.put('c', create_transform(10))
+    assert 'b' not in cache
+    assert 'a' in cache and 'c' in cache
+    assert cache.get_stats()['evictions'] == 1
+
+    # larger than the budget is not registered
+    cache.put('d', create_transform(30))
+    assert 'd' not in cache
+
+
+def test_share_fold_transforms(regression_data, monkeypatch):
+    df, y = regression_data
+    n_fitted = []
+    original_fit = UtilityTransform.fit
+
+    def counting_fit(self, x, y=None):
+        n_fitted.append(1)
+        return original_fit(self, x, y)
+
+    monkeypatch.setattr(UtilityTransform, 'fit', counting_fit)
+    cache = get_fold_transform_cache()
+    cache.clear()
+    cache.reset_stats()
+
+    entry = RecordingFeature()
+    params = {'input_scaling': 'standard', 'target_logscale': True}
+    feats = [KNeighborRegressorOutOfFold(name=f'knn_scaling_{i}', parent=entry, add_init_param=params)
+             for i in range(2)]
+    outputs = [feat.fit(df, y) for feat in feats]
+
+    # input and target transformers are fitted once per fold
+    assert len(n_fitted) == 2 * feats[0].num_cv
+    assert cache.get_stats()['hits'] == feats[0].num_cv
+    assert np.allclose(outputs[0].values, outputs[1].values)
+
+    pred = feats[1].predict(df, recreate=True)
+    assert len(pred) == len(df)
+
+
+def test_same_train_other_valid(regression_data):
+    df, y = regression_data
+    cache = get_fold_transform_cache()
+    cache.clear()
+    cache.reset_stats()
+    idx_train = np.arange(60)
+    for i, idx_valid in enumerate([np.arange(60, 80), np.arange(80, 100)]):
+        KNeighborRegressorOutOfFold(name=f'knn_valid_{i}', cv=[(idx_train, idx_valid)],
+                                    add_init_param={'input_scaling': 'standard'}).fit(df, y)
+
+    # transformed validation set of the other fold must not be used
+    assert cache.get_stats()['hits'] == 0
+    assert cache.get_stats()['n_entries'] == 2
+
+
+def test_not_cache_without_scaling(regression_data):
+    df, y = regression_data
+    cache = get_fold_transform_cache()
+    cache.clear()
+    KNeighborRegressorOutOfFold(name='knn_no_scaling').fit(df, y)
+    assert cache.get_stats()['n_entries'] == 0
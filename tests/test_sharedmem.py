@@ -0,0 +1,84 @@
+"""Test for sharedmem.py
+"""
+
+import os
+import tempfile
+
+import joblib
+import numpy as np
+import pytest
+
+from vivid.env import Settings
+from vivid.out_of_fold.kneighbor import KNeighborRegressorOutOfFold
+from vivid.sharedmem import share_array, is_shared_array, clear_shared_arrays, shared_scope
+
+
+def _sum_rows(x, idx):
+    return is_shared_array(x), x[idx].sum()
+
+
+@pytest.fixture
+def shared_dir(output_dir):
+    return os.path.join(output_dir, 'memmap')
+
+
+def test_share_array(shared_dir):
+    x = np.random.uniform(size=(100, 3))
+    shared = share_array(x, directory=shared_dir)
+
+    assert is_shared_array(shared)
+    assert np.array_equal(shared, x)
+    assert not shared.flags.writeable
+
+    # same array is written only once
+    assert share_array(x, directory=shared_dir).filename == shared.filename
+    assert share_array(shared) is shared
+    assert len(os.listdir(shared_dir)) == 1
+
+    # object array can not be memory-mapped
+    obj = np.array(['a', None], dtype=object)
+    assert share_array(obj, directory=shared_dir) is obj
+
+
+def test_process_workers_attach(shared_dir):
+    x = np.random.uniform(size=(1000, 10))
+    shared = share_array(x, directory=shared_dir)
+    idx = np.arange(0, 1000, 3)
+
+    results = joblib.Parallel(n_jobs=2, backend='loky')(joblib.delayed(_sum_rows)(shared, idx) for _ in range(2))
+    for is_shared, value in results:
+        assert is_shared
+        assert np.isclose(value, x[idx].sum())
+
+
+def test_clear_shared_arrays():
+    x = np.random.uniform(size=(10, 2))
+    shared = share_array(x)
+    assert os.path.exists(shared.filename)
+    clear_shared_arrays()
+    assert not os.path.exists(shared.filename)
+
+
+def test_shared_scope():
+    x = np.random.uniform(size=(10, 2))
+    with shared_scope() as directory:
+        shared = share_array(x)
+        assert os.path.dirname(shared.filename) == directory
+    assert not os.path.exists(directory)
+
+
+def test_remove_shared_arrays_after_fit(train_data, tmp_path, monkeypatch):
+    df, y = train_data
+    monkeypatch.setattr(Settings, 'CACHE_DIR', str(tmp_path / 'cache'))
+    created = []
+    original_mkdtemp = tempfile.mkdtemp
+
+    def mkdtemp(**kwargs):
+        created.append(original_mkdtemp(dir=str(tmp_path), **kwargs))
+        return created[-1]
+
+    monkeypatch.setattr(tempfile, 'mkdtemp', mkdtemp)
+    KNeighborRegressorOutOfFold(name='knn_shared', n_fold_jobs=2, fold_backend='process').fit(df, y)
+    assert len(created) == 1
+    assert not os.path.exists(created[0])
+    assert not os.path.exists(str(tmp_path / 'cache'))
@@ -29,6 +29,21 @@ class TestTransform(object):
         x_inv = transformer.inverse_transform(x_trans)
         assert is_close_to_zero(x, x_inv)
 
+    @pytest.mark.parametrize('log,scaling', [
+        (True, None),
+        (False, 'standard'),
+        (True, 'standard')
+    ])
+    def test_transform_inplace(self, log, scaling):
+        transformer = UtilityTransform(log=log, scaling=scaling)
+        x = np.random.uniform(size=(100, 3))
+        transformer.fit(x)
+
+        x_inplace = x.astype(np.float32)
+        x_trans = transformer.transform_inplace(x_inplace)
+        assert x_trans is x_inplace
+        assert np.allclose(x_trans, transformer.transform(x), atol=1e-5)
+
     def test_out_of_scaling_string(self):
         transformer = UtilityTransform(log=True, scaling='hogehoge')
         assert transformer.scaling is None
@@ -0,0 +1,76 @@
+"""Test for tracing.py
+"""
+
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from vivid.executor import GraphExecutor
+from vivid.out_of_fold.kneighbor import KNeighborRegressorOutOfFold
+from vivid.tracing import tracing, get_tracer, trace, SPAN_COLUMNS
+from .test_executor import create_graph, CountFeature
+
+
+def test_disabled_by_default():
+    tracer = get_tracer()
+    n_spans = len(tracer.spans)
+    with trace('foo') as span:
+        span['rows'] = 1
+    assert len(tracer.spans) == n_spans
+
+
+def test_span_args():
+    with tracing() as tracer:
+        with trace('foo', category='bar', rows=10) as span:
+            span['columns'] = 2
+    assert len(tracer.spans) == 1
+    span = tracer.spans[0]
+    assert span.name == 'foo'
+    assert span.category == 'bar'
+    assert span.args == {'rows': 10, 'columns': 2}
+    assert span.end >= span.start
+    assert span.pid == os.getpid()
+
+
+@pytest.mark.parametrize('backend', ['thread', 'process'])
+def test_trace_graph(train_data, output_dir, backend):
+    train_df, y = train_data
+    last = create_graph(root_dir=output_dir)
+
+    with tracing() as tracer:
+        GraphExecutor(n_jobs=2, backend=backend).fit(last, train_df, y)
+
+    df = tracer.to_dataframe()
+    assert list(df.columns[:len(SPAN_COLUMNS)]) == SPAN_COLUMNS
+    fit_df = df[df['category'] == 'fit']
+    assert len(fit_df) == 7
+    assert (fit_df['rows'] == len(train_df)).all()
+    assert set(df['category']) >= {'fit', 'assemble', 'save'}
+
+    if backend == 'process':
+        assert (fit_df['pid'] != os.getpid()).any()
+
+    path = os.path.join(output_dir, 'trace.json')
+    tracer.save_chrome_trace(path)
+    with open(path, 'r') as f:
+        events = json.load(f)['traceEvents']
+    assert len(events) == len(df)
+    assert all(e['ph'] == 'X' and e['ts'] >= 0 for e in events)
+
+    tracer.save_csv(os.path.join(output_dir, 'trace.csv'))
+    assert len(pd.read_csv(os.path.join(output_dir, 'trace.csv'))) == len(df)
+
+
+def test_trace_out_of_fold(train_data, output_dir):
+    train_df, y = train_data
+    feat = KNeighborRegressorOutOfFold(name='knn', parent=CountFeature(name='entry', root_dir=output_dir))
+    with tracing() as tracer:
+        feat.fit(train_df, y)
+        feat.predict(train_df)
+
+    df = tracer.to_dataframe()
+    assert (df['category'] == 'fold').sum() == feat.num_cv
+    assert (df['category'] == 'report').sum() > 0
+    assert (df['category'] == 'predict').sum() == 2
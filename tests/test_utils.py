@@ -1,7 +1,9 @@
+import os
+
 import pytest
 from sklearn.model_selection import KFold
 
-from vivid.utils import get_train_valid_set
+from vivid.utils import get_train_valid_set, get_logger
 
 
 def test_get_train_test_set():
@@ -15,3 +17,20 @@ def test_get_train_test_set():
     y2 = []
     with pytest.raises(ValueError):
         get_train_valid_set(fold1, x, y2)
+
+
+def test_get_logger_reuse_handlers(output_dir):
+    log_path = os.path.join(output_dir, 'not', 'exist', 'log.txt')
+    logger = get_logger('vivid.test_reuse', output_file=log_path)
+    handlers = list(logger.handlers)
+
+    # same arguments does not create new handlers
+    assert get_logger('vivid.test_reuse', output_file=log_path).handlers == handlers
+    # the directory and file are created at the first record
+    assert not os.path.exists(log_path)
+    logger.info('hello')
+    assert os.path.exists(log_path)
+
+    logger = get_logger('vivid.test_reuse', output_file=None)
+    assert len(logger.handlers) == 1
+    assert handlers[1].stream is None
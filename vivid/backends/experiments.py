@@ -9,6 +9,7 @@ import matplotlib.pyplot as plt
 import pandas as pd
 
 from vivid.json_encoder import NestedEncoder
+from vivid.tracing import trace
 
 
 class ExperimentBackend:
@@ -36,7 +37,8 @@ class ExperimentBackend:
                 break
 
         try:
-            func(key, obj)
+            with trace(key, category='save'):
+                func(key, obj)
         except Exception as e:
             warnings.warn(f'Error has occurred when save experiment object {key} {type(obj)}')
             warnings.warn(str(e))
@@ -121,6 +123,8 @@ class LocalExperimentBackend(ExperimentBackend):
             key = key
         else:
             key = f'{key}.{ext}'
+        # the directory is created at the first save
+        os.makedirs(self.output_dir, exist_ok=True)
         return os.path.join(self.output_dir, key)
 
     @save_method
@@ -0,0 +1,223 @@
+# coding: utf-8
+"""
+Process wide cache of the feature outputs.
+
+The outputs are kept in memory up to the byte budget. When the budget is exceeded, entries are evicted and the
+evicted outputs are spilled to the local storage by the dataframe backend (or simply dropped if the feature has
+already saved the same output to its own output dir). The spilled outputs are loaded and promoted to memory again
+when they are requested.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Union, Hashable
+
+import pandas as pd
+
+from .env import Settings, get_dataframe_backend
+
+CACHE_POLICIES = ('lru', 'cost')
+
+
+class _Entry:
+    def __init__(self, df: pd.DataFrame, disk_path: Union[None, str] = None, cost: float = 0.):
+        self.df = df
+        self.nbytes = int(df.memory_usage(index=True).sum())
+        self.disk_path = disk_path
+        self.cost = cost
+
+
+class FeatureCache:
+    """two tier (memory / disk) cache with the memory budget"""
+
+    def __init__(self,
+                 max_bytes: Union[None, int] = None,
+                 policy='lru',
+                 spill_dir: Union[None, str] = None):
+        """
+        Args:
+            max_bytes:
+                memory budget. If set None, the outputs are never evicted.
+            policy:
+                eviction policy.
+                `"lru"`: evict least recently used output first.
+                `"cost"`: evict the output which is the cheapest to create again per byte
+                (i.e. the seconds to create it / nbytes) first.
+            spill_dir:
+                directory to save evicted outputs which have no local file.
+                If set None, use `Settings.CACHE_DIR/spill`.
+        """
+        if policy not in CACHE_POLICIES:
+            raise ValueError('`policy` must be in {}. actually: {}'.format(','.join(CACHE_POLICIES), policy))
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.spill_dir = spill_dir
+
+        self._memory = OrderedDict()  # type: OrderedDict[Hashable, _Entry]
+        self._disk = {}  # type: dict[Hashable, str]
+        self._spilled = set()
+        self._lock = threading.RLock()
+        self.reset_stats()
+
+    @property
+    def nbytes(self) -> int:
+        """total bytes of the outputs in memory"""
+        return sum(e.nbytes for e in self._memory.values())
+
+    def reset_stats(self):
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.spills = 0
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'spills': self.spills,
+                'n_memory': len(self._memory),
+                'n_disk': len(self._disk),
+                'nbytes': self.nbytes
+            }
+
+    def put(self, key: Hashable, df: pd.DataFrame, disk_path: Union[None, str] = None, cost: float = 0.):
+        """
+        Args:
+            key: cache key.
+            df: output dataframe.
+            disk_path: path to the local file which has the same data as `df` if exists.
+                When the entry is evicted, it is used instead of spilling.
+            cost: seconds to create the output. used in `"cost"` policy.
+        """
+        with self._lock:
+            self._discard_disk(key)
+            self._memory[key] = _Entry(df, disk_path=disk_path, cost=cost)
+            self._memory.move_to_end(key)
+            self._evict(keep=key)
+
+    def get(self, key: Hashable) -> Union[None, pd.DataFrame]:
+        with self._lock:
+            if key in self._memory:
+                self.hits += 1
+                self._memory.move_to_end(key)
+                return self._memory[key].df
+
+            if key in self._disk and os.path.exists(self._disk[key]):
+                self.disk_hits += 1
+                path = self._disk[key]
+                df = get_dataframe_backend().load(path)
+                is_spilled = key in self._spilled
+                self._disk.pop(key)
+                self._spilled.discard(key)
+                self.put(key, df, disk_path=None if is_spilled else path)
+                if is_spilled:
+                    os.remove(path)
+                return df
+
+            self.misses += 1
+            return None
+
+    def in_memory(self, key: Hashable) -> bool:
+        """whether the output is in memory tier or not. the access order and stats are not changed."""
+        return self.location(key) == 'memory'
+
+    def location(self, key: Hashable) -> Union[None, str]:
+        """`"memory"`, `"disk"` or None (not cached). the access order and stats are not changed."""
+        with self._lock:
+            if key in self._memory:
+                return 'memory'
+            if key in self._disk and os.path.exists(self._disk[key]):
+                return 'disk'
+            return None
+
+    def discard(self, key: Hashable):
+        with self._lock:
+            self._memory.pop(key, None)
+            self._discard_disk(key)
+
+    def discard_owner(self, owner: Hashable):
+        """discard all outputs whose key is `(owner, ...)` tuple"""
+        with self._lock:
+            for key in [k for k in [*self._memory.keys(), *self._disk.keys()] if k[0] == owner]:
+                self.discard(key)
+
+    def spill(self, key: Hashable):
+        """move the output from memory to the disk"""
+        with self._lock:
+            entry = self._memory.pop(key, None)
+            if entry is None:
+                return
+
+            if entry.disk_path is not None and os.path.exists(entry.disk_path):
+                self._disk[key] = entry.disk_path
+                return
+
+            spill_dir = self.spill_dir or os.path.join(Settings.CACHE_DIR, 'spill')
+            backend = get_dataframe_backend()
+            path = backend.to_filename(os.path.join(spill_dir, '_'.join(map(str, key)) + f'_{id(self)}'))
+            try:
+                os.makedirs(spill_dir, exist_ok=True)
+                backend.save(entry.df, path)
+            except Exception:
+                # do not leave the broken file
+                if os.path.isfile(path):
+                    os.remove(path)
+                raise
+            self._disk[key] = path
+            self._spilled.add(key)
+            self.spills += 1
+
+    def release(self, key: Hashable):
+        """
+        move the output out of memory without writing anything. The output saved by the recording feature is read
+        from the local file when it is requested again, and the other outputs are simply dropped (the feature creates
+        it again if required).
+        """
+        with self._lock:
+            entry = self._memory.pop(key, None)
+            if entry is not None and entry.disk_path is not None and os.path.exists(entry.disk_path):
+                self._disk[key] = entry.disk_path
+
+    def clear(self):
+        with self._lock:
+            for key in [*self._memory.keys(), *self._disk.keys()]:
+                self.discard(key)
+
+    def _discard_disk(self, key):
+        path = self._disk.pop(key, None)
+        if key in self._spilled:
+            self._spilled.discard(key)
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+
+    def _evict(self, keep=None):
+        if self.max_bytes is None:
+            return
+        while self.nbytes > self.max_bytes:
+            candidates = [k for k in self._memory.keys() if k != keep]
+            if len(candidates) == 0:
+                return
+            if self.policy == 'cost':
+                victim = min(candidates, key=lambda k: self._memory[k].cost / max(self._memory[k].nbytes, 1))
+            else:
+                victim = candidates[0]
+            self.evictions += 1
+            self.spill(victim)
+
+
+_feature_cache = None  # type: Union[None, FeatureCache]
+_feature_cache_lock = threading.Lock()
+
+
+def get_feature_cache() -> FeatureCache:
+    """get process wide feature cache. the budget is set from `Settings.CACHE_MAX_BYTES`"""
+    global _feature_cache
+    with _feature_cache_lock:
+        if _feature_cache is None:
+            _feature_cache = FeatureCache(max_bytes=Settings.CACHE_MAX_BYTES, policy=Settings.CACHE_POLICY)
+    return _feature_cache
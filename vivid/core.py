@@ -3,14 +3,21 @@
 """
 
 import os
+import uuid
+import weakref
 from contextlib import contextmanager
-from typing import Union, List
+from time import time
+from typing import Union, List, Iterable, Iterator
 
 import numpy as np
 import pandas as pd
 
 from .backends.experiments import LocalExperimentBackend
+from .cache import get_feature_cache
 from .env import Settings, get_dataframe_backend
+from .executor import GraphExecutor
+from .fingerprint import fingerprint_class_source
+from .tracing import trace, data_stats
 from .utils import get_logger, timer
 
 
@@ -61,8 +68,24 @@ class AbstractFeature(object):
         self.name = name
         self._root_dir = root_dir
 
-        self.feat_on_train_df = None  # type: Union[None, pd.DataFrame]
-        self.feat_on_test_df = None  # type: Union[None, pd.DataFrame]
+        # outputs are stored in the process wide cache (see `vivid.cache`) by this token
+        self._cache_token = uuid.uuid4().hex
+        self._train_cache_key = None  # type: Union[None, str]
+        self._last_fit_seconds = None  # type: Union[None, float]
+        weakref.finalize(self, get_feature_cache().discard_owner, self._cache_token)
+        self.initialize()
+
+    # attributes created by `initialize`. they are not pickled (the logger holds the lock of the handlers)
+    RUNTIME_ATTRIBUTES = ('logger', 'exp_backend', '_runtime_key')
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in self.RUNTIME_ATTRIBUTES:
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
         self.initialize()
 
     def __str__(self):
@@ -70,6 +93,33 @@ class AbstractFeature(object):
             return self.name
         return '{}__{}'.format(str(self.name), str(self._primary_parent))
 
+    @property
+    def feat_on_train_df(self) -> Union[None, pd.DataFrame]:
+        """cached output of the training data"""
+        return get_feature_cache().get((self._cache_token, 'train'))
+
+    @feat_on_train_df.setter
+    def feat_on_train_df(self, df: Union[None, pd.DataFrame]):
+        self._set_cached_output('train', df, disk_path=self.output_train_meta_path)
+
+    @property
+    def feat_on_test_df(self) -> Union[None, pd.DataFrame]:
+        """cached output of the test data"""
+        return get_feature_cache().get((self._cache_token, 'test'))
+
+    @feat_on_test_df.setter
+    def feat_on_test_df(self, df: Union[None, pd.DataFrame]):
+        self._set_cached_output('test', df, disk_path=self.output_test_meta_path)
+
+    def _set_cached_output(self, kind: str, df: Union[None, pd.DataFrame], disk_path=None, cost=0.):
+        key = (self._cache_token, kind)
+        if df is None:
+            get_feature_cache().discard(key)
+            return
+        if not self.is_recording:
+            disk_path = None
+        get_feature_cache().put(key, df, disk_path=disk_path, cost=cost)
+
     @property
     def root_dir(self):
         """
@@ -129,6 +179,12 @@ class AbstractFeature(object):
         if not self.has_output_dir: return None
         return os.path.join(self.output_dir, self.dataframe_backend.to_filename('test'))
 
+    @property
+    def output_train_cache_key_path(self):
+        """path to the file which stores the cache key of the training output"""
+        if not self.has_output_dir: return None
+        return os.path.join(self.output_dir, 'train_cache_key.txt')
+
     @property
     def has_train_meta_path(self) -> bool:
         return self.output_train_meta_path is not None and \
@@ -145,24 +201,49 @@ class AbstractFeature(object):
     def call(self, df_source: pd.DataFrame, y=None, test=False) -> pd.DataFrame:
         raise NotImplementedError()
 
-    def initialize(self):
-        log_output = None
-        if self.is_recording:
-            os.makedirs(self.output_dir, exist_ok=True)
-            log_output = os.path.join(self.output_dir, 'log.txt')
+    def get_cache_params(self) -> dict:
+        """
+        parameters which change the output of this feature. It is used to create the cache key of training output,
+        so when the value is changed, the cached output is treated as stale one and re-created.
 
+        By default, the feature name and the source code of the feature class are used.
+        If your feature has some attributes that change the output, override this method and add them.
+        """
+        return {
+            'name': str(self),
+            'class': fingerprint_class_source(self.__class__)
+        }
+
+    def initialize(self):
+        """
+        set up the logger and the experiment backend.
+        It is called at the start of every fit / predict, but they are created again only when the output dir or
+        the log settings (of the shared logger) are changed. The output dir is not created here (it is created at
+        the first save).
+        """
         if self.parent is None:
             logger_name = '****.' + self.name
         else:
             logger_name = self._primary_parent.name + '.' + self.name
 
+        output_dir = self.output_dir
+        log_output = None
+        if self.is_recording:
+            log_output = os.path.join(output_dir, 'log.txt')
+
+        # the logger is shared by the features which have the same name (e.g. in the other root dir), so it is
+        # always passed to `get_logger`. The handlers are attached again only when the other one has changed them.
         self.logger = get_logger(f'vivid.{logger_name}',
                                  log_level=Settings.LOG_LEVEL,
                                  output_file=log_output,
                                  output_level=Settings.TXT_LOG_LEVEL,
                                  format_str='[vivid.{}] %(message)s'.format(logger_name))
 
-        self.exp_backend = LocalExperimentBackend(output_dir=self.output_dir)
+        runtime_key = (output_dir, self.is_recording)
+        if getattr(self, '_runtime_key', None) == runtime_key:
+            return
+        self.exp_backend = LocalExperimentBackend(output_dir=output_dir)
+        self._runtime_key = runtime_key
 
     @contextmanager
     def set_silent(self):
@@ -171,7 +252,13 @@ class AbstractFeature(object):
             yield exp
         self.logger.disabled = False
 
-    def fit(self, input_df: pd.DataFrame, y: np.ndarray, force=False) -> pd.DataFrame:
+    def fit(self,
+            input_df: pd.DataFrame,
+            y: np.ndarray,
+            force=False,
+            n_jobs=None,
+            release_outputs=None,
+            keep_outputs=None) -> pd.DataFrame:
         """
         fit feature to input dataframe
 
@@ -182,33 +269,154 @@ class AbstractFeature(object):
                 target value
             force:
                 force re-fit call. If set `True`, ignore cache train feature and run fit again.
+                Even if not set, the cached output is re-created when the input data, `y` or the feature parameters
+                (see `get_cache_params`) are changed from the last fit.
+            n_jobs:
+                number of workers used to run independent features at the same time.
+                If set None, use `Settings.N_JOBS`. See `vivid.executor.GraphExecutor` for more details.
+            release_outputs:
+                If set `True`, move the output of each feature out of memory once all of its children have used it.
+                If set None, use `Settings.RELEASE_OUTPUTS` (`True` by default). Set `False` to keep all outputs.
+            keep_outputs:
+                list of features whose output is kept in memory even if `release_outputs` is set.
 
         Returns:
             features corresponding to the training data
         """
-        self.initialize()
+        executor = GraphExecutor(n_jobs=n_jobs, release_outputs=release_outputs, keep_outputs=keep_outputs)
+        return executor.fit(self, input_df, y, force=force)
+
+    def get_train_cache_state(self, cache_key=None, force=False) -> str:
+        """
+        state of the cached training output.
+
+        Args:
+            cache_key: the key of current input. If it is not matched with saved key, the cache is treated as stale.
+            force: If set `True`, ignore local saved output.
+
+        Returns:
+            one of the follows.
+            * `"memory"`: the output is in memory.
+            * `"disk"`: the output is saved in local (or spilled from memory) and can be loaded.
+            * `"stale"`: the output exists but it was created from different input or parameters.
+            * `"missing"`: the output does not exist.
+        """
+        location = get_feature_cache().location((self._cache_token, 'train'))
+        if location is not None and (cache_key is None or self._train_cache_key == cache_key):
+            return location
+
         if self.has_train_meta_path and not force:
-            self.logger.debug('train data is exists. load from local.')
-            return self.dataframe_backend.load(self.output_train_meta_path)
+            if cache_key is None or self._read_train_cache_key() == cache_key:
+                return 'disk'
+            return 'stale'
 
-        if self.feat_on_train_df is not None:
-            return self.feat_on_train_df
+        if location is not None:
+            return 'stale'
+        return 'missing'
 
-        if self.has_parent:
-            parent_output_df = pd.DataFrame()
-            for parent in self.parent:
-                parent_output_df = pd.concat([parent.fit(input_df, y, force=force), parent_output_df], axis=1)
-        else:
-            parent_output_df = input_df
+    def _load_train_cache(self, force=False, cache_key=None) -> Union[None, pd.DataFrame]:
+        """
+        return cached training output if exists. If not, return None
 
-        with timer(self.logger, format_str='fit: {:.3f}[s]'):
-            output_df = self.call(parent_output_df, y, test=False)
-            if Settings.CACHE_ON_TRAIN:
-                self.feat_on_train_df = output_df
+        Args:
+            force: If set `True`, ignore local saved output.
+            cache_key: the key of current input. If it is not matched with saved key, the cache is treated as stale.
+        """
+        self.initialize()
+        state = self.get_train_cache_state(cache_key=cache_key, force=force)
+        if state == 'stale':
+            self.logger.info('train data is exists but stale. run fit again.')
+        if state in ('stale', 'missing'):
+            return None
+
+        output_df = self.feat_on_train_df
+        if output_df is not None and (cache_key is None or self._train_cache_key == cache_key):
+            return output_df
 
-        self.post_fit(input_df, parent_output_df=parent_output_df, out_df=output_df, y=y)
+        self.logger.debug('train data is exists. load from local.')
+        output_df = self.dataframe_backend.load(self.output_train_meta_path)
+        # promote to memory, in order not to read the file again from the other children
+        self._cache_train_output(output_df, cache_key)
         return output_df
 
+    def get_recorded_fit_seconds(self) -> Union[None, float]:
+        """seconds taken by the last fit. If this feature has never been fitted, return None"""
+        if self._last_fit_seconds is not None:
+            return self._last_fit_seconds
+        if not self.is_recording:
+            return None
+        marked = self.exp_backend.get_marked() or {}
+        return marked.get('fit_seconds', None)
+
+    def plan(self, input_df: pd.DataFrame, y: np.ndarray, force=False) -> pd.DataFrame:
+        """
+        dry-run of `fit`. Walk the feature graph without running any features and report what will happen.
+
+        Args:
+            input_df: training dataframe.
+            y: target value.
+            force: same as `fit`.
+
+        Returns:
+            dataframe which has one row per feature (parents come first) and the following columns.
+            * `name`: feature name (`str(feature)`).
+            * `state`: state of the cached output. see `get_train_cache_state`.
+            * `run`: whether the feature will run `call` or not.
+            * `estimated_seconds`: seconds of the last fit if recorded. Only set when the feature will run.
+        """
+        executor = GraphExecutor(n_jobs=1)
+        return executor.plan(self, input_df, y, force=force)
+
+    def _read_train_cache_key(self) -> Union[None, str]:
+        if not os.path.exists(self.output_train_cache_key_path):
+            return None
+        with open(self.output_train_cache_key_path, 'r') as f:
+            return f.read().strip()
+
+    def _fit_node(self,
+                  parent_output_df: pd.DataFrame,
+                  input_df: pd.DataFrame,
+                  y: np.ndarray,
+                  cache_key=None) -> pd.DataFrame:
+        """run fit on this feature only. parent features must be fitted before call it."""
+        if self.is_recording:
+            os.makedirs(self.output_dir, exist_ok=True)
+        self._discard_test_output()
+        start = time()
+        with trace(str(self), category='fit') as span:
+            with timer(self.logger, format_str='fit: {:.3f}[s]'):
+                output_df = self.call(parent_output_df, y, test=False)
+
+            self.post_fit(input_df, parent_output_df=parent_output_df, out_df=output_df, y=y)
+            span.update(data_stats(output_df))
+
+        self._last_fit_seconds = time() - start
+        self.exp_backend.mark('fit_seconds', self._last_fit_seconds)
+
+        # write the key at last, so the output saved halfway is never treated as valid cache
+        if self.is_recording and cache_key is not None:
+            with open(self.output_train_cache_key_path, 'w') as f:
+                f.write(cache_key)
+        self._cache_train_output(output_df, cache_key, cost=self._last_fit_seconds)
+        return output_df
+
+    def _discard_test_output(self):
+        """the test output created by the previous fit is stale, so remove it from the cache and the local file"""
+        self.feat_on_test_df = None
+        if self.output_test_meta_path is not None and os.path.exists(self.output_test_meta_path):
+            os.remove(self.output_test_meta_path)
+
+    def _cache_train_output(self, output_df: pd.DataFrame, cache_key=None, cost=0.):
+        if not Settings.CACHE_ON_TRAIN:
+            return
+        self._train_cache_key = cache_key
+        self._set_cached_output('train', output_df, disk_path=self.output_train_meta_path, cost=cost)
+
+    def _cache_test_output(self, pred_df: pd.DataFrame):
+        if not Settings.CACHE_ON_TEST:
+            return
+        self._set_cached_output('test', pred_df, disk_path=self.output_test_meta_path)
+
     def post_fit(self,
                  input_df: pd.DataFrame,
                  parent_output_df: pd.DataFrame,
@@ -233,7 +441,7 @@ class AbstractFeature(object):
             Nothing
         """
         if self.is_recording:
-            self.dataframe_backend.save(out_df, save_to=self.output_train_meta_path)
+            self._save_output(out_df, self.output_train_meta_path)
         self.exp_backend.mark('train_meta', {
             'shape': out_df.shape,
             'input_columns': input_df.columns,
@@ -244,7 +452,12 @@ class AbstractFeature(object):
         self.exp_backend.save_object('parent_output_sample', parent_output_df.head(100))
         self.exp_backend.save_object('oof_output_sample', out_df.head(100))
 
-    def predict(self, input_df: pd.DataFrame, recreate=False) -> pd.DataFrame:
+    def predict(self,
+                input_df: pd.DataFrame,
+                recreate=False,
+                n_jobs=None,
+                release_outputs=None,
+                keep_outputs=None) -> pd.DataFrame:
         """
         predict new data.
 
@@ -259,27 +472,129 @@ class AbstractFeature(object):
         Args:
             input_df: predict target dataframe
             recreate: optional. If set as `True`, ignore cache file and call core create method (i.e. `self.call`).
+            n_jobs: number of workers. If set None, use `Settings.N_JOBS`.
+            release_outputs: see `fit`.
+            keep_outputs: see `fit`.
 
         Returns:
 
         """
-        self.initialize()
+        executor = GraphExecutor(n_jobs=n_jobs, release_outputs=release_outputs, keep_outputs=keep_outputs)
+        return executor.predict(self, input_df, recreate=recreate)
+
+    def fit_predict(self,
+                    input_df: pd.DataFrame,
+                    y: np.ndarray,
+                    test_df: pd.DataFrame,
+                    force=False,
+                    n_jobs=None,
+                    release_outputs=None,
+                    keep_outputs=None):
+        """
+        fit feature to input dataframe and predict test dataframe at once.
+
+        The result is the same as `fit` followed by `predict(test_df, recreate=True)`, but the feature graph is walked
+        only once. Each feature predicts the test data right after it is fitted, so the fitted models in memory are
+        used without reloading them.
 
-        if not recreate and self.feat_on_test_df is not None:
-            return self.feat_on_test_df
-        if self.has_parent:
-            output_df = pd.DataFrame()
-            for parent in self.parent:
-                output_df = pd.concat([parent.predict(input_df, recreate), output_df], axis=1)
+        Args:
+            input_df: training dataframe.
+            y: target value.
+            test_df: predict target dataframe.
+            force: see `fit`.
+            n_jobs: see `fit`.
+            release_outputs: see `fit`. Both of the training and test outputs are released.
+            keep_outputs: see `fit`.
+
+        Returns:
+            tuple of features corresponding to the training data and the test data.
+        """
+        executor = GraphExecutor(n_jobs=n_jobs, release_outputs=release_outputs, keep_outputs=keep_outputs)
+        return executor.fit_predict(self, input_df, y, test_df, force=force)
+
+    def _fit_predict_node(self,
+                          parent_train_df: Union[None, pd.DataFrame],
+                          parent_test_df: pd.DataFrame,
+                          input_df: pd.DataFrame,
+                          y: np.ndarray,
+                          cache_key=None,
+                          mode=None):
+        """
+        run fit and predict on this feature only.
+
+        Args:
+            mode: how to get the training output.
+                `"fit"`: run fit on `parent_train_df`. `"load"`: load cached output. None: not required.
+        """
+        output_df = None
+        if mode == 'load':
+            output_df = self._load_train_cache(cache_key=cache_key)
         else:
-            output_df = input_df
-        pred_df = self.call(output_df, test=True)
+            self.initialize()
 
-        if Settings.CACHE_ON_TEST:
-            self.feat_on_test_df = pred_df
+        if mode == 'fit':
+            output_df = self._fit_node(parent_train_df, input_df, y, cache_key=cache_key)
+        return output_df, self._predict_node(parent_test_df)
+
+    def _load_test_cache(self, recreate=False) -> Union[None, pd.DataFrame]:
+        self.initialize()
+        if recreate:
+            return None
+        return self.feat_on_test_df
+
+    def _predict_node(self, parent_output_df: pd.DataFrame, stream=False) -> pd.DataFrame:
+        """
+        run predict on this feature only. parent features must be predicted before call it.
+        If `stream` is True, the output is neither cached nor saved (the output is a part of the whole data)
+        """
+        with trace(str(self), category='predict') as span:
+            pred_df = self.call(parent_output_df, test=True)
+            span.update(data_stats(pred_df))
+        if stream:
+            return pred_df
 
         if self.is_recording:
-            os.makedirs(self.output_dir, exist_ok=True)
-            self.dataframe_backend.save(pred_df, self.output_test_meta_path)
+            self._save_output(pred_df, self.output_test_meta_path)
 
+        self._cache_test_output(pred_df)
         return pred_df
+
+    def predict_iter(self, chunks: Iterable[pd.DataFrame], n_jobs=None, save=False) -> Iterator[pd.DataFrame]:
+        """
+        predict new data chunk by chunk.
+
+        Each chunk is pushed through the whole fitted feature graph and the output is yielded at once,
+        so only the intermediate outputs of one chunk are kept in memory.
+        The output is the same as the one of `predict` on the whole data.
+        Note that the outputs of the chunks are not cached (`feat_on_test_df` is not changed).
+
+        Args:
+            chunks:
+                iterable of the dataframe. For example, `pd.read_csv(path, chunksize=100000)` or
+                `vivid.frames.iter_row_chunks(df, chunk_size=100000)`.
+            n_jobs:
+                number of workers. If set None, use `Settings.N_JOBS`.
+            save:
+                If set `True` and this feature is recording, save each output to `test_chunk_XXXXX.<ext>`
+
+        Yields:
+            predicted dataframe of each chunk. the index is the same as the chunk.
+        """
+        executor = GraphExecutor(n_jobs=n_jobs)
+        for i, chunk in enumerate(chunks):
+            pred_df = executor.predict(self, chunk.reset_index(drop=True), stream=True)
+            pred_df.index = chunk.index
+
+            if save and self.is_recording:
+                self._save_output(pred_df, self.output_test_chunk_path(i))
+            yield pred_df
+
+    def _save_output(self, df: pd.DataFrame, path: str):
+        with trace(os.path.basename(path), category='save', feature=str(self), **data_stats(df)):
+            os.makedirs(self.output_dir, exist_ok=True)
+            self.dataframe_backend.save(df, path)
+
+    def output_test_chunk_path(self, index: int) -> Union[None, str]:
+        """path to the output of the `index` th chunk created by `predict_iter`"""
+        if not self.has_output_dir: return None
+        return os.path.join(self.output_dir, self.dataframe_backend.to_filename(f'test_chunk_{index:05d}'))
@@ -23,6 +23,38 @@ class Settings:
     CACHE_ON_TRAIN = os.getenv('VIVID_CACHE_ON_TRAIN', 'true') == 'true'
     CACHE_ON_TEST = os.getenv('VIVID_CACHE_ON_TEST', 'true') == 'true'
     CACHE_DIR = os.path.join(os.path.expanduser('~'), '.vivid')
+    # memory budget (bytes) of cached feature outputs. If not set, the outputs are never evicted.
+    CACHE_MAX_BYTES = int(os.environ['VIVID_CACHE_MAX_BYTES']) if os.getenv('VIVID_CACHE_MAX_BYTES') else None
+    # eviction policy of cached feature outputs. `"lru"` or `"cost"`
+    CACHE_POLICY = os.getenv('VIVID_CACHE_POLICY', 'lru')
+    # memory budget (bytes) of the fitted models loaded from local. If not set, the models are never evicted.
+    MODEL_REGISTRY_MAX_BYTES = int(os.environ['VIVID_MODEL_REGISTRY_MAX_BYTES']) \
+        if os.getenv('VIVID_MODEL_REGISTRY_MAX_BYTES') else None
+    # memory budget (bytes) of the input / target transforms of the folds shared by optuna trials and seed features.
+    FOLD_TRANSFORM_CACHE_MAX_BYTES = int(os.getenv('VIVID_FOLD_TRANSFORM_CACHE_MAX_BYTES', 1 << 30))
+    # move the cached output out of memory as soon as all children in the graph have used it.
+    # set `false` to keep the outputs of all features in memory.
+    RELEASE_OUTPUTS = os.getenv('VIVID_RELEASE_OUTPUTS', 'true') == 'true'
+
+    # number of workers to run independent features at the same time. `-1` means using all cpu cores.
+    N_JOBS = int(os.getenv('VIVID_N_JOBS', 1))
+    # worker pool type for feature graph execution. `"thread"` or `"process"`
+    EXECUTOR_BACKEND = os.getenv('VIVID_EXECUTOR_BACKEND', 'thread')
+    # number of workers to train the folds of out-of-fold feature at the same time. `-1` means using all cpu cores.
+    N_FOLD_JOBS = int(os.getenv('VIVID_N_FOLD_JOBS', 1))
+    # worker pool type for fold training. `"thread"` or `"process"`
+    FOLD_BACKEND = os.getenv('VIVID_FOLD_BACKEND', 'thread')
+    # number of rows predicted at once by out-of-fold models. If not set, predict whole rows at once.
+    PREDICT_CHUNK_SIZE = int(os.environ['VIVID_PREDICT_CHUNK_SIZE']) if os.getenv('VIVID_PREDICT_CHUNK_SIZE') else None
+
+    # worker pool type to run optuna trials at the same time. `"thread"` or `"process"`
+    TRIAL_BACKEND = os.getenv('VIVID_TRIAL_BACKEND', 'thread')
+
+    # optuna storage URL shared by all optuna out-of-fold features (like `"sqlite:///path/to/optuna.db"`).
+    # If not set, the study is saved to `optuna.db` in the output dir of each feature.
+    OPTUNA_STORAGE = os.getenv('VIVID_OPTUNA_STORAGE', None)
+    # seconds to wait for the lock of the SQLite storage written by the other trial processes
+    OPTUNA_SQLITE_TIMEOUT = float(os.getenv('VIVID_OPTUNA_SQLITE_TIMEOUT', 60))
 
     # using csv save / load backend class
     DATAFRAME_BACKEND = 'vivid.backends.dataframes.JoblibBackend'
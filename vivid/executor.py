@@ -0,0 +1,368 @@
+# coding: utf-8
+"""
+Graph executor which runs the fit / predict of the feature DAG.
+
+Each feature only knows about its parents, so the whole graph is discovered from the last feature (the one user calls
+`fit` or `predict`) and the features are run in topological order. Features which do not depend on each other
+(i.e. first level out-of-fold models on the same parents) can be run at the same time in a thread or process pool.
+"""
+
+import copy
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Callable, Union
+
+import pandas as pd
+
+from .cache import get_feature_cache
+from .env import Settings
+from .frames import concat_columns
+from .fingerprint import combine_fingerprints, fingerprint_array, fingerprint_dataframe, fingerprint_params
+from .tracing import get_tracer, trace, data_stats
+
+EXECUTOR_BACKENDS = ('thread', 'process')
+
+
+def topological_sort(feature) -> List:
+    """
+    sort all features in the graph so that each feature comes after all of its parents.
+
+    Args:
+        feature: the last feature of the graph.
+
+    Returns:
+        list of features. The order is the same as the serial (recursive) fit call order.
+    """
+    visited = set()
+    ordered = []
+
+    def visit(node):
+        if node in visited:
+            return
+        visited.add(node)
+        for parent in node.parent or []:
+            visit(parent)
+        ordered.append(node)
+
+    visit(feature)
+    return ordered
+
+
+def create_cache_keys(feature, input_df: pd.DataFrame, y) -> dict:
+    """
+    create the cache key of training output for all features in the graph.
+
+    The key of the feature is the digest of its own parameters (`get_cache_params`) and the keys of its parents.
+    The entrypoint feature uses the fingerprint of the input dataframe instead of parents.
+    The output of a feature is determined by its parameters and the parent outputs, so the parent key stands in for
+    the hash of the parent output buffer and the key is created without running any features.
+
+    Returns:
+        dict of feature to the cache key string.
+    """
+    input_key = combine_fingerprints(fingerprint_dataframe(input_df), fingerprint_array(y))
+    keys = {}
+    for node in topological_sort(feature):
+        if node.has_parent:
+            sources = [keys[p] for p in node.parent]
+        else:
+            sources = [input_key]
+        keys[node] = combine_fingerprints(fingerprint_params(node.get_cache_params()), *sources)
+    return keys
+
+
+def concat_parent_outputs(feature, outputs: dict) -> pd.DataFrame:
+    """concat parent outputs in the same column order as the serial fit (last parent comes first)"""
+    return concat_columns([outputs[parent] for parent in reversed(feature.parent)])
+
+
+def _concat_assembler(input_df: pd.DataFrame) -> Callable:
+    """the source of the feature is the input dataframe (entrypoint) or the concatenated parent outputs"""
+    def assemble(node, outputs):
+        if not node.has_parent:
+            return input_df,
+        return concat_parent_outputs(node, outputs),
+    return assemble
+
+
+def _detach(feature):
+    """
+    create a shallow copy of the feature graph, in order to send the feature to the other process.
+    cached outputs are not included because they are stored in the process wide cache, not in the feature.
+    The logger and the experiment backend are not pickled, and they are created again in the worker
+    (see `AbstractFeature.__getstate__`).
+    """
+    clone = copy.copy(feature)
+    if feature.parent is not None:
+        clone.parent = [_detach(p) for p in feature.parent]
+        clone._primary_parent = clone.parent[0]
+    return clone
+
+
+def _run_detached(feature, method: str, args: tuple, tracing=False):
+    """entrypoint of process worker. return the output, the updated feature state and the spans recorded"""
+    tracer = get_tracer()
+    tracer.enabled = tracing
+    n_spans = len(tracer.spans)
+    output = getattr(feature, method)(*args)
+    excludes = ('parent', '_primary_parent', *feature.RUNTIME_ATTRIBUTES)
+    state = {k: v for k, v in vars(feature).items() if k not in excludes}
+    return output, state, tracer.pop_since(n_spans)
+
+
+class GraphExecutor:
+    """
+    Run the feature graph in topological order.
+
+    When `n_jobs` is 1, the features are run one by one in the current thread (same as the recursive call).
+    Otherwise independent features are submitted to the worker pool as soon as all of their parents are finished.
+    The outputs do not depend on `n_jobs` or `backend`.
+    """
+
+    def __init__(self,
+                 n_jobs: Union[None, int] = None,
+                 backend: Union[None, str] = None,
+                 release_outputs: Union[None, bool] = None,
+                 keep_outputs: Union[None, List] = None):
+        """
+        Args:
+            n_jobs:
+                number of workers. If set None, use `Settings.N_JOBS`. If set `-1`, use all cpu cores.
+            backend:
+                worker pool type. `"thread"` or `"process"`. If set None, use `Settings.EXECUTOR_BACKEND`.
+                In `"process"` backend, the state of the feature created in the worker (like fitted models) is
+                copied back to the feature in the main process.
+            release_outputs:
+                If set `True`, the cached output of the feature is moved out of memory (see `FeatureCache.release`)
+                as soon as all of its children in the graph have used it. The output is still available through
+                `feat_on_train_df` (it is read from the disk) if the feature is recording, otherwise it is dropped.
+                The output of the last feature is always kept. If set None, use `Settings.RELEASE_OUTPUTS`
+                (`True` by default).
+            keep_outputs:
+                features whose output is kept in memory even if `release_outputs` is `True`.
+        """
+        if n_jobs is None:
+            n_jobs = Settings.N_JOBS
+        if n_jobs < 0:
+            n_jobs = os.cpu_count() or 1
+        if n_jobs == 0:
+            raise ValueError('`n_jobs` must not be zero.')
+        if backend is None:
+            backend = Settings.EXECUTOR_BACKEND
+        if backend not in EXECUTOR_BACKENDS:
+            raise ValueError('`backend` must be in {}. actually: {}'.format(','.join(EXECUTOR_BACKENDS), backend))
+        if release_outputs is None:
+            release_outputs = Settings.RELEASE_OUTPUTS
+
+        self.n_jobs = n_jobs
+        self.backend = backend
+        self.release_outputs = release_outputs
+        self.keep_outputs = keep_outputs or []
+
+    def fit(self, feature, input_df: pd.DataFrame, y, force=False) -> pd.DataFrame:
+        cache_keys = create_cache_keys(feature, input_df, y)
+        return self._execute(feature,
+                             load=lambda node: node._load_train_cache(force=force, cache_key=cache_keys[node]),
+                             method='_fit_node',
+                             args_of=lambda node: (input_df, y, cache_keys[node]),
+                             kinds=('train',),
+                             assemble=_concat_assembler(input_df))
+
+    def plan(self, feature, input_df: pd.DataFrame, y, force=False) -> pd.DataFrame:
+        """
+        report the cache state of all features and which features will run on `fit`, without running anything.
+        see `AbstractFeature.plan` for the details of the output.
+        """
+        cache_keys = create_cache_keys(feature, input_df, y)
+        states, runs = self._find_fit_nodes(feature, cache_keys, force=force)
+
+        rows = []
+        for node in topological_sort(feature):
+            state = states.get(node, None) or node.get_train_cache_state(cache_key=cache_keys[node], force=force)
+            run = node in runs
+            rows.append({
+                'name': str(node),
+                'state': state,
+                'run': run,
+                'estimated_seconds': node.get_recorded_fit_seconds() if run else None
+            })
+        return pd.DataFrame(rows, columns=['name', 'state', 'run', 'estimated_seconds'])
+
+    def fit_predict(self, feature, input_df: pd.DataFrame, y, test_df: pd.DataFrame, force=False):
+        """
+        fit the graph and predict `test_df` in one traversal.
+        Each feature predicts the test data right after it is fitted, so the fitted models are used as they are.
+        The test outputs are always created again (cached test outputs are not used).
+
+        Returns:
+            tuple of the training output and the test output of the last feature.
+        """
+        cache_keys = create_cache_keys(feature, input_df, y)
+        _, fit_nodes = self._find_fit_nodes(feature, cache_keys, force=force)
+
+        # training outputs are only required by the features to fit (and the caller)
+        train_required = {feature, *(p for node in fit_nodes for p in node.parent or [])}
+
+        def mode_of(node):
+            if node in fit_nodes:
+                return 'fit'
+            if node in train_required:
+                return 'load'
+            return None
+
+        def assemble(node, outputs):
+            if not node.has_parent:
+                return input_df if node in fit_nodes else None, test_df
+            train_source = None
+            if node in fit_nodes:
+                train_source = concat_columns([outputs[p][0] for p in reversed(node.parent)])
+            return train_source, concat_columns([outputs[p][1] for p in reversed(node.parent)])
+
+        return self._execute(feature,
+                             load=lambda node: None,
+                             method='_fit_predict_node',
+                             args_of=lambda node: (input_df, y, cache_keys[node], mode_of(node)),
+                             kinds=('train', 'test'),
+                             assemble=assemble)
+
+    def predict(self, feature, input_df: pd.DataFrame, recreate=False, stream=False) -> pd.DataFrame:
+        """
+        Args:
+            feature: the last feature of the graph.
+            input_df: predict target dataframe.
+            recreate: If set `True`, ignore cached outputs.
+            stream: If set `True`, the input is treated as a part of the whole data (i.e. chunk).
+                All features are run and the outputs are neither cached nor saved.
+        """
+        return self._execute(feature,
+                             load=lambda node: node._load_test_cache(recreate=recreate or stream),
+                             method='_predict_node',
+                             args_of=lambda node: (stream,),
+                             kinds=('test',),
+                             assemble=_concat_assembler(input_df))
+
+    def _find_fit_nodes(self, feature, cache_keys: dict, force=False):
+        """
+        Returns:
+            tuple of the cache states of the visited features and the set of features which will run on `fit`.
+            the parents of cached features are not visited.
+        """
+        states = {}
+        runs = set()
+
+        def visit(node):
+            if node in states:
+                return
+            states[node] = node.get_train_cache_state(cache_key=cache_keys[node], force=force)
+            if states[node] in ('memory', 'disk'):
+                return
+            runs.add(node)
+            for parent in node.parent or []:
+                visit(parent)
+
+        visit(feature)
+        return states, runs
+
+    def _execute(self,
+                 feature,
+                 load: Callable,
+                 method: str,
+                 args_of: Callable,
+                 kinds: tuple,
+                 assemble: Callable):
+        """
+        Args:
+            load: function which returns the cached output of the feature or None.
+            method: name of the feature method to run. called as `method(*assemble(node, outputs), *args_of(node))`
+            args_of: function which returns the extra arguments of the feature.
+            kinds: kinds of the cached outputs (`"train"`, `"test"`) to release.
+            assemble: function which creates the source arguments from the parent outputs.
+        """
+        outputs = {}
+        pending = []
+        visited = set()
+
+        # discover the features to run. the parents of cached feature are never required.
+        def visit(node):
+            if node in visited:
+                return
+            visited.add(node)
+            cached = load(node)
+            if cached is not None:
+                outputs[node] = cached
+                return
+            for parent in node.parent or []:
+                visit(parent)
+            pending.append(node)
+
+        visit(feature)
+
+        # number of children which have not used the output yet
+        n_consumers = Counter(p for node in pending for p in node.parent or [])
+
+        def sources_of(node):
+            with trace(str(node), category='assemble') as span:
+                sources = assemble(node, outputs)
+                span.update(data_stats(sources[0] if sources[0] is not None else sources[-1]))
+            for parent in node.parent or []:
+                n_consumers[parent] -= 1
+                if n_consumers[parent] == 0:
+                    self._release(parent, outputs, kinds=kinds)
+            return sources
+
+        if self.n_jobs == 1 or len(pending) < 2:
+            for node in pending:
+                outputs[node] = getattr(node, method)(*sources_of(node), *args_of(node))
+            return outputs[feature]
+
+        pool_class = ThreadPoolExecutor if self.backend == 'thread' else ProcessPoolExecutor
+        with pool_class(max_workers=self.n_jobs) as pool:
+            running = {}
+            finished = set(outputs.keys())
+            while pending or running:
+                ready = [node for node in pending if all(p in finished for p in node.parent or [])]
+                for node in ready:
+                    pending.remove(node)
+                    args = (*sources_of(node), *args_of(node))
+                    running[self._submit(pool, node, method, args)] = (node, args)
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node, args = running.pop(future)
+                    outputs[node] = self._collect(node, method, args, future.result())
+                    finished.add(node)
+        return outputs[feature]
+
+    def _release(self, node, outputs: dict, kinds: tuple):
+        """drop the reference of the output which is no longer used in this run"""
+        if node in self.keep_outputs:
+            return
+        outputs.pop(node, None)
+        if self.release_outputs:
+            for kind in kinds:
+                get_feature_cache().release((node._cache_token, kind))
+
+    def _submit(self, pool, node, method, args):
+        if self.backend == 'thread':
+            return pool.submit(getattr(node, method), *args)
+        return pool.submit(_run_detached, _detach(node), method, args, get_tracer().enabled)
+
+    def _collect(self, node, method, args, result):
+        if self.backend == 'thread':
+            return result
+        output, state, spans = result
+        vars(node).update(state)
+        get_tracer().add(*spans)
+
+        # the output cached in the worker process is lost, so cache it again in this process
+        if method == '_fit_node':
+            node._cache_train_output(output, cache_key=args[-1])
+        elif method == '_fit_predict_node':
+            train_df, test_df = output
+            if train_df is not None:
+                node._cache_train_output(train_df, cache_key=args[-2])
+            node._cache_test_output(test_df)
+        elif not args[-1]:
+            node._cache_test_output(output)
+        return output
@@ -2,9 +2,10 @@ import os
 from typing import List
 
 import joblib
-import pandas as pd
 
 from vivid.core import AbstractFeature
+from vivid.fingerprint import fingerprint_class_source
+from vivid.frames import concat_columns
 from vivid.utils import timer
 from .atoms import AbstractAtom
 
@@ -21,7 +22,7 @@ class Molecule:
         self.name = name
 
     def generate(self, df_input, y=None):
-        return pd.concat([atom.generate(df_input, y) for atom in self.atoms], axis=1)
+        return concat_columns([atom.generate(df_input, y) for atom in self.atoms])
 
 
 class MoleculeFactory(object):
@@ -47,6 +48,11 @@ class MoleculeFeature(AbstractFeature):
         super(MoleculeFeature, self).__init__(name=molecule.name, parent=parent, root_dir=root_dir)
         self.molecule = molecule
 
+    def get_cache_params(self) -> dict:
+        params = super(MoleculeFeature, self).get_cache_params()
+        params['atoms'] = [fingerprint_class_source(atom.__class__) for atom in self.molecule.atoms]
+        return params
+
     @property
     def molecule_path(self):
         if self.has_output_dir:
@@ -64,11 +70,13 @@ class MoleculeFeature(AbstractFeature):
         if test:
             self.load_molecule()
 
-        out_df = pd.DataFrame()
+        atom_outputs = []
 
         for atom in self.molecule.atoms:
             with timer(self.logger, format_str=f'{str(atom)} ' + '{:.3f}[s]'):
-                out_df = pd.concat([out_df, atom.generate(df_source, y)], axis=1)
+                atom_outputs.append(atom.generate(df_source, y))
+
+        out_df = concat_columns(atom_outputs)
 
         if not test and self.is_recording:
             joblib.dump(self.molecule, self.molecule_path)
@@ -0,0 +1,140 @@
+# coding: utf-8
+"""
+Fast fingerprints (hash digest) of the data and parameters.
+
+These are used as cache keys, so the same input always creates the same string in any process.
+"""
+
+import hashlib
+import inspect
+from functools import lru_cache
+from typing import Union
+
+import numpy as np
+import pandas as pd
+
+DIGEST_SIZE = 16
+
+
+def _new_hash():
+    return hashlib.blake2b(digest_size=DIGEST_SIZE)
+
+
+def fingerprint_array(x: Union[None, np.ndarray, list]) -> str:
+    """fingerprint of the array. shape and dtype are also considered."""
+    h = _new_hash()
+    if x is None:
+        h.update(b'none')
+        return h.hexdigest()
+
+    x = np.asarray(x)
+    if x.dtype == object:
+        return fingerprint_dataframe(pd.DataFrame(x.reshape(len(x), -1)))
+    h.update(str((x.shape, x.dtype.str)).encode())
+    h.update(np.ascontiguousarray(x).view(np.uint8).data)
+    return h.hexdigest()
+
+
+def fingerprint_dataframe(df: pd.DataFrame) -> str:
+    """fingerprint of the dataframe. columns, dtypes and index are also considered."""
+    h = _new_hash()
+    h.update(str([(str(c), str(t)) for c, t in df.dtypes.items()]).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).values.data)
+    return h.hexdigest()
+
+
+def fingerprint_data(x) -> str:
+    if isinstance(x, pd.DataFrame):
+        return fingerprint_dataframe(x)
+    if isinstance(x, pd.Series):
+        return fingerprint_dataframe(x.to_frame())
+    return fingerprint_array(x)
+
+
+# types whose repr is the complete value. other objects are canonicalized by their contents.
+PRIMITIVE_TYPES = (type(None), bool, int, float, complex, str, bytes)
+
+
+def _canonical_object(obj, visiting: set) -> str:
+    if id(obj) in visiting:
+        # recursive reference
+        return '<recursion>'
+    visiting.add(id(obj))
+    try:
+        if hasattr(obj, 'get_params') and callable(obj.get_params):
+            # sklearn estimator and cv splitter. (their repr truncates long parameters)
+            try:
+                return _canonical(type(obj)) + _canonical(obj.get_params(deep=True), visiting)
+            except Exception:
+                pass
+        if isinstance(obj, np.random.RandomState):
+            return _canonical(type(obj)) + _canonical(obj.get_state(), visiting)
+        if hasattr(obj, '__dict__'):
+            return _canonical(type(obj)) + _canonical(vars(obj), visiting)
+        slots = [name for c in type(obj).__mro__ for name in getattr(c, '__slots__', ())]
+        return _canonical(type(obj)) + _canonical({name: getattr(obj, name, None) for name in slots}, visiting)
+    finally:
+        visiting.discard(id(obj))
+
+
+def _canonical(obj, visiting: Union[None, set] = None) -> str:
+    """
+    convert the object to the string which does not depend on the process (memory address, dict order, ...).
+    `repr` is used only for the primitive values, because the repr of the other objects (like sklearn estimator or
+    numpy array) may be truncated. The arrays are converted to the fingerprint of their contents.
+    """
+    if visiting is None:
+        visiting = set()
+    if isinstance(obj, PRIMITIVE_TYPES):
+        return repr(obj)
+    if isinstance(obj, np.generic):
+        return repr(obj.item())
+    if isinstance(obj, dict):
+        items = sorted((str(k), _canonical(v, visiting)) for k, v in obj.items())
+        return '{' + ','.join(f'{k}:{v}' for k, v in items) + '}'
+    if isinstance(obj, (list, tuple)):
+        return '[' + ','.join(_canonical(v, visiting) for v in obj) + ']'
+    if isinstance(obj, (set, frozenset)):
+        return '{' + ','.join(sorted(_canonical(v, visiting) for v in obj)) + '}'
+    if isinstance(obj, (np.ndarray, pd.DataFrame, pd.Series)):
+        return fingerprint_data(obj)
+    if isinstance(obj, pd.Index):
+        return fingerprint_array(obj.values)
+    if isinstance(obj, type):
+        return f'{obj.__module__}.{obj.__qualname__}'
+    if callable(obj) and hasattr(obj, '__qualname__'):
+        return f'{getattr(obj, "__module__", "")}.{obj.__qualname__}'
+    return _canonical_object(obj, visiting)
+
+
+def fingerprint_params(params) -> str:
+    """canonical digest of the parameters (nested dict, list, numpy array, sklearn object...)"""
+    h = _new_hash()
+    h.update(_canonical(params).encode())
+    return h.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def fingerprint_class_source(cls: type) -> str:
+    """
+    digest of the source code of the class and its base classes.
+    If the source code is not available (like class defined in the interactive shell), use the class name instead.
+    """
+    h = _new_hash()
+    for c in inspect.getmro(cls):
+        if c.__module__ == 'builtins':
+            continue
+        try:
+            source = inspect.getsource(c)
+        except (OSError, TypeError):
+            source = _canonical(c)
+        h.update(source.encode())
+    return h.hexdigest()
+
+
+def combine_fingerprints(*fingerprints: str) -> str:
+    h = _new_hash()
+    for f in fingerprints:
+        h.update(str(f).encode())
+        h.update(b'|')
+    return h.hexdigest()
@@ -0,0 +1,59 @@
+# coding: utf-8
+"""
+Helpers to assemble dataframes created by many features.
+"""
+
+from typing import List, Iterator
+
+import numpy as np
+import pandas as pd
+
+
+def _is_plain_numeric(dtype) -> bool:
+    return isinstance(dtype, np.dtype) and (np.issubdtype(dtype, np.number) or dtype == np.bool_)
+
+
+def concat_columns(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    concat dataframes along the columns (same as `pd.concat(frames, axis=1)`).
+
+    When all frames share the same index and the same numeric dtype, the result is created in one allocation
+    as a single C-contiguous block, so `result.values` returns the block itself without any copy.
+    Otherwise, all frames are passed to `pd.concat` at once (not one by one), so the data is copied only once.
+
+    Args:
+        frames: dataframes to concat. the order is kept on the result columns.
+
+    Returns:
+        new concatenated dataframe. the input frames are never shared with the result.
+    """
+    frames = list(frames)
+    if len(frames) == 0:
+        return pd.DataFrame()
+
+    index = frames[0].index
+    dtypes = set(t for df in frames for t in df.dtypes)
+    can_allocate = len(dtypes) == 1 and _is_plain_numeric(next(iter(dtypes))) \
+        and all(df.index.equals(index) for df in frames[1:])
+
+    if not can_allocate:
+        return pd.concat(frames, axis=1)
+
+    n_columns = sum(df.shape[1] for df in frames)
+    values = np.empty((len(index), n_columns), dtype=next(iter(dtypes)))
+    columns = []
+    start = 0
+    for df in frames:
+        end = start + df.shape[1]
+        values[:, start:end] = df.values
+        columns.extend(df.columns)
+        start = end
+    return pd.DataFrame(values, index=index, columns=columns, copy=False)
+
+
+def iter_row_chunks(df: pd.DataFrame, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """split the dataframe into chunks of `chunk_size` rows (the last one may be smaller)"""
+    if chunk_size <= 0:
+        raise ValueError('`chunk_size` must be over zero. actually: {}'.format(chunk_size))
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
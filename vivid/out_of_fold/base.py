@@ -1,6 +1,9 @@
 import copy
 import os
+import shutil
+import tempfile
 from collections.abc import Iterable
+from contextlib import contextmanager
 from typing import List, Union, Callable, Tuple
 
 import joblib
@@ -13,22 +16,113 @@ from sklearn.base import is_regressor
 from sklearn.exceptions import NotFittedError
 from sklearn.metrics import check_scoring
 from sklearn.metrics._scorer import _BaseScorer, SCORERS
-from sklearn.model_selection import KFold, check_cv
+from sklearn.model_selection import KFold, check_cv, train_test_split
 from tabulate import tabulate
 
 from vivid.core import AbstractFeature
 from vivid.env import Settings
+from vivid.fingerprint import combine_fingerprints, fingerprint_array, fingerprint_params
 from vivid.metrics import binary_metrics, regression_metrics
+from vivid.out_of_fold.folds import get_fold_store, is_deterministic
+from vivid.out_of_fold.registry import get_model_registry
+from vivid.out_of_fold.transform_cache import FoldTransform, get_fold_transform_cache
+from vivid.sharedmem import share_array, shared_scope
 from vivid.sklearn_extend import PrePostProcessModel
+from vivid.tracing import trace, data_stats, get_tracer
 from vivid.utils import timer
 from vivid.visualize import visualize_feature_importance, visualize_roc_auc_curve, visualize_pr_curve, \
     visualize_distributions, NotSupportedError
 
 
+FOLD_BACKENDS = ('thread', 'process')
+FOLD_AGGREGATIONS = ('mean', 'median', 'gmean')
+TRIAL_BACKENDS = ('thread', 'process')
+TRANSFORM_PARAMS = ('input_logscale', 'input_scaling', 'target_logscale', 'target_scaling')
+
+
 def create_default_cv():
     return KFold(n_splits=Settings.N_FOLDS, shuffle=True, random_state=Settings.RANDOM_SEED)
 
 
+def aggregate_fold_predictions(fold_predicts: List[np.ndarray], agg='mean') -> np.ndarray:
+    """
+    aggregate the predictions of fold models into one float32 array.
+
+    Args:
+        fold_predicts: list of 1d prediction array. all arrays have the same length.
+        agg: `"mean"`, `"median"` or `"gmean"` (geometric mean. predictions must be positive).
+    """
+    if agg == 'median':
+        return np.median(np.asarray(fold_predicts, dtype=np.float32), axis=0)
+
+    acc = np.zeros(len(fold_predicts[0]), dtype=np.float32)
+    for pred in fold_predicts:
+        acc += np.log(pred) if agg == 'gmean' else pred
+    acc /= len(fold_predicts)
+    if agg == 'gmean':
+        np.exp(acc, out=acc)
+    return acc
+
+
+def _count_finished_trials(study: Study) -> int:
+    states = (optuna.trial.TrialState.COMPLETE, optuna.trial.TrialState.PRUNED)
+    return len([t for t in study.get_trials(deepcopy=False) if t.state in states])
+
+
+def _create_stop_callback(n_trials: int) -> Callable:
+    """callback to stop the optimization when the study has `n_trials` finished trials (including other processes)"""
+
+    def stop_when_finished(study, trial):
+        if _count_finished_trials(study) >= n_trials:
+            study.stop()
+
+    return stop_when_finished
+
+
+def _optimize_in_worker(feature: 'BaseOptunaOutOfFoldFeature', X, y, study_name: str, storage, n_trials: int,
+                        n_total: int, tracing=False):
+    """entrypoint of trial process worker. run trials on the study shared by the storage"""
+    tracer = get_tracer()
+    tracer.enabled = tracing
+    n_spans = len(tracer.spans)
+    study = optuna.load_study(study_name=study_name, storage=storage, pruner=feature.create_pruner())
+    with feature.set_silent():
+        study.optimize(lambda trial: feature.get_objective(trial, X, y), n_trials=n_trials, n_jobs=1,
+                       callbacks=[_create_stop_callback(n_total)])
+    return tracer.pop_since(n_spans)
+
+
+def _copy_study_to_memory(study: Study, pruner) -> Study:
+    """copy the finished trials of the study to the in memory storage"""
+    copied = optuna.create_study(study_name=study.study_name, direction='maximize', pruner=pruner)
+    for t in study.get_trials(deepcopy=False):
+        if t.state.is_finished():
+            copied.add_trial(t)
+    return copied
+
+
+def _parse_halving_rung(rung: Union[float, dict]) -> dict:
+    if not isinstance(rung, dict):
+        rung = {'rows': rung}
+    unknown = set(rung.keys()) - {'rows', 'budget'}
+    if unknown:
+        raise ValueError('unknown keys of halving rung: {}'.format(','.join(sorted(unknown))))
+    rung = {'rows': rung.get('rows', 1.), 'budget': rung.get('budget', 1.)}
+    for key, value in rung.items():
+        if not 0 < value <= 1:
+            raise ValueError(f'`{key}` of halving rung must be in (0, 1]. actually: {value}')
+    return rung
+
+
+def _run_fold_detached(feature: 'BaseOutOfFoldFeature', args: tuple, tracing=False):
+    """entrypoint of fold process worker. return the fold result and the spans recorded in the worker"""
+    tracer = get_tracer()
+    tracer.enabled = tracing
+    n_spans = len(tracer.spans)
+    result = feature._run_fold(*args)
+    return result, tracer.pop_since(n_spans)
+
+
 class BaseOutOfFoldFeature(AbstractFeature):
     """Base class that creates Out of Fold features for input data
     K-Fold CV is performed at the time of train to create K number of models.
@@ -40,9 +134,11 @@ class BaseOutOfFoldFeature(AbstractFeature):
     initial_params = {}
     model_class = None
     _parameter_path = 'model_parameters.joblib'
+    _checkpoint_filename = 'checkpoint.joblib'
 
     def __init__(self, name, parent=None, cv=None, groups=None, sample_weight=None,
-                 add_init_param=None, root_dir=None):
+                 add_init_param=None, root_dir=None, n_fold_jobs=None, fold_backend=None,
+                 fold_agg='mean', predict_chunk_size=None, refit=False):
         """
 
         Args:
@@ -59,7 +155,43 @@ class BaseOutOfFoldFeature(AbstractFeature):
                 additional init params. class attribute `init_params` are updated by it.
             root_dir:
                 root_dir, pass to `AbstractFeature`.
+            n_fold_jobs:
+                number of folds trained at the same time. If set None, use `Settings.N_FOLD_JOBS`.
+                If set `-1`, use all cpu cores. The threads of the model (`n_jobs` parameter) are limited so that
+                all folds share the cpu cores. The output is the same as the serial training.
+            fold_backend:
+                worker pool type of fold training. `"thread"` or `"process"`.
+                In `"process"` backend, the workers attach to the training matrix shared by the memory-mapped file
+                (see `vivid.sharedmem`) instead of receiving the copy of it. In both backends, each fold copies its
+                own training and validation rows. If set None, use `Settings.FOLD_BACKEND`.
+            fold_agg:
+                how to aggregate the predictions of fold models on test. `"mean"`, `"median"` or `"gmean"`.
+            predict_chunk_size:
+                number of rows predicted at once on test. The fold models predict each chunk in parallel
+                (`n_fold_jobs` threads). If set None, use `Settings.PREDICT_CHUNK_SIZE` (None means whole rows).
+            refit:
+                If set `True`, one model is trained on all training rows after the out-of-fold training and it is
+                used on test instead of K fold models (the parameters are created by `get_refit_model_params`).
+                The output on train is still the out-of-fold prediction.
         """
+        if n_fold_jobs is None:
+            n_fold_jobs = Settings.N_FOLD_JOBS
+        if n_fold_jobs < 0:
+            n_fold_jobs = os.cpu_count() or 1
+        if n_fold_jobs == 0:
+            raise ValueError('`n_fold_jobs` must not be zero.')
+        if fold_backend is None:
+            fold_backend = Settings.FOLD_BACKEND
+        if fold_backend not in FOLD_BACKENDS:
+            raise ValueError('`fold_backend` must be in {}. actually: {}'.format(','.join(FOLD_BACKENDS),
+                                                                                fold_backend))
+        if fold_agg not in FOLD_AGGREGATIONS:
+            raise ValueError('`fold_agg` must be in {}. actually: {}'.format(','.join(FOLD_AGGREGATIONS), fold_agg))
+        self.n_fold_jobs = n_fold_jobs
+        self.fold_backend = fold_backend
+        self.fold_agg = fold_agg
+        self.predict_chunk_size = predict_chunk_size or Settings.PREDICT_CHUNK_SIZE
+        self.refit = refit
 
         if cv is None:
             cv = create_default_cv()
@@ -75,6 +207,9 @@ class BaseOutOfFoldFeature(AbstractFeature):
         super(BaseOutOfFoldFeature, self).__init__(name, parent, root_dir=root_dir)
         self.logger.info(self.name)
         self.is_train_finished = False
+        self._data_key_memo = None
+        self._fold_key_memo = None
+        self._transform_data_key = None
 
     @property
     def is_regression_model(self):
@@ -94,14 +229,34 @@ class BaseOutOfFoldFeature(AbstractFeature):
             return self._checked_cv.n_splits
         return None
 
+    def get_cache_params(self) -> dict:
+        params = super(BaseOutOfFoldFeature, self).get_cache_params()
+        params.update({
+            'model_class': self.model_class,
+            'initial_params': self._initial_params,
+            'cv': self.cv,
+            'groups': self.groups,
+            'sample_weight': self.sample_weight,
+            'refit': self.refit
+        })
+        return params
+
     def load_best_models(self) -> List[PrePostProcessModel]:
-        """load fitted models from local model parameters."""
+        """
+        load fitted models from local model parameters.
+        The loaded models are kept in the process wide registry (see `vivid.out_of_fold.registry`), so the files are
+        not read again until the models are saved by a new fit.
+        """
         if self.output_dir is None:
             raise NotFittedError('Feature run without recording. Must Set Output Dir. ')
 
         if not os.path.exists(self.model_param_path):
             raise NotFittedError('Model Serialized file {} not found.'.format(self.model_param_path) +
                                  'Run fit before load model.')
+        key, version = self._get_registry_key()
+        return get_model_registry().get_or_load(key, self._load_models_from_local, version=version)
+
+    def _load_models_from_local(self) -> List[PrePostProcessModel]:
         param_list = joblib.load(self.model_param_path)
         models = []
         for params in param_list:
@@ -110,28 +265,71 @@ class BaseOutOfFoldFeature(AbstractFeature):
             models.append(model)
         return models
 
+    def _get_registry_key(self):
+        """key of the model registry (output dir) and the version of saved models (modified time)"""
+        return os.path.abspath(self.output_dir), os.stat(self.model_param_path).st_mtime_ns
+
     def get_fold_splitting(self, X, y) -> Iterable:
         # If cv is iterable obj, convert to list and return
         if isinstance(self.cv, Iterable):
             return list(self.cv)
         if self._checked_cv is None:
             self._checked_cv = check_cv(self.cv, y, classifier=self.model_class)
-        return list(self._checked_cv.split(X, y, self.groups))
+        # the splits are shared by all features (and trials) on the same target through the fold store
+        return get_fold_store().get_splits(self._checked_cv, X, y, self.groups, key=self.get_fold_key(y),
+                                           save_dir=self.fold_save_dir)
 
-    def _predict_trained_models(self, test_df: pd.DataFrame) -> pd.DataFrame:
+    @property
+    def fold_save_dir(self) -> Union[None, str]:
+        """directory to save the fold splits shared by the features in the same root dir. None if not recording"""
+        if not self.is_recording:
+            return None
+        return os.path.join(self.root_dir, '.folds')
+
+    def get_fold_key(self, y) -> Union[None, str]:
+        """
+        key of the splits in the fold store. memorized while the same target is used (i.e. in optuna trials).
+        If `cv` is the fixed fold indexes, return None.
+        """
+        if isinstance(self.cv, Iterable):
+            return None
+        memo = self._fold_key_memo
+        if memo is not None and memo[0] is y and memo[1] is self.groups:
+            return memo[2]
+        if self._checked_cv is None:
+            self._checked_cv = check_cv(self.cv, y, classifier=self.model_class)
+        key = get_fold_store().get_key(self._checked_cv, y, self.groups)
+        self._fold_key_memo = (y, self.groups, key)
+        return key
+
+    def get_predict_models(self) -> List[PrePostProcessModel]:
+        """models used on test. the models fitted in this process or loaded from local"""
         if not self.is_train_finished:
-            models = self.load_best_models()
-        else:
-            models = self._fitted_models
+            return self.load_best_models()
+        return self._fitted_models
 
-        if self.is_regression_model:
-            fold_predicts = [model.predict(test_df.values) for model in models]
-        else:
-            fold_predicts = [model.predict(test_df.values, prob=True)[:, 1] for model in models]
-        preds = np.asarray(fold_predicts).mean(axis=0)
-        df = pd.DataFrame(preds.T, columns=[str(self)])
+    def get_predict_matrix(self, test_df: pd.DataFrame) -> np.ndarray:
+        """array passed to the fold models on test"""
+        return test_df.values
+
+    def _predict_trained_models(self, test_df: pd.DataFrame) -> pd.DataFrame:
+        models = self.get_predict_models()
+        X = self.get_predict_matrix(test_df)
+        preds = np.zeros(len(X), dtype=np.float32)
+        chunk_size = self.predict_chunk_size or max(len(X), 1)
+        with joblib.Parallel(n_jobs=min(self.n_fold_jobs, len(models)), backend='threading') as parallel:
+            for start in range(0, len(X), chunk_size):
+                x = X[start:start + chunk_size]
+                fold_predicts = parallel(joblib.delayed(self._predict_fold)(model, x) for model in models)
+                preds[start:start + len(x)] = aggregate_fold_predictions(fold_predicts, agg=self.fold_agg)
+        df = pd.DataFrame(preds, columns=[str(self)])
         return df
 
+    def _predict_fold(self, model: PrePostProcessModel, x: np.ndarray) -> np.ndarray:
+        if self.is_regression_model:
+            return model.predict(x).reshape(-1)
+        return model.predict(x, prob=True)[:, 1]
+
     def generate_default_model_parameter(self, X, y) -> dict:
         """
         generate model init parameter. It be shared with all Fold.
@@ -188,11 +386,27 @@ class BaseOutOfFoldFeature(AbstractFeature):
             return self._predict_trained_models(df_source)
 
         X, y = df_source.values, y
-        default_params = self.generate_default_model_parameter(X, y)
+        # the arrays shared with the process workers are removed when the fit ends
+        with shared_scope():
+            if self.n_fold_jobs > 1 and self.fold_backend == 'process':
+                # share once, so that all folds and optuna trials use the same memory-mapped file
+                X, y = share_array(X), share_array(y)
+            try:
+                default_params = self.generate_default_model_parameter(X, y)
+
+                with self.exp_backend.mark_time(prefix='train_'):
+                    models, oof = self.run_oof_train(X, y, default_params)
 
-        with self.exp_backend.mark_time(prefix='train_'):
-            models, oof = self.run_oof_train(X, y, default_params)
+                self._fold_models = models
+                if self.refit:
+                    with self.exp_backend.mark_time(prefix='refit_'):
+                        models = [self.run_refit(X, y, default_params, fold_models=models)]
+            finally:
+                # do not keep the reference to the training data
+                self._data_key_memo = None
+                self._fold_key_memo = None
 
+        # models used on test
         self._fitted_models = models
 
         self.is_train_finished = True
@@ -201,7 +415,8 @@ class BaseOutOfFoldFeature(AbstractFeature):
 
     def run_oof_train(self, X, y, default_params,
                       n_fold: Union[int, None] = None,
-                      silent=False) -> ([List[PrePostProcessModel], np.ndarray]):
+                      silent=False,
+                      fold_callback: Union[None, Callable] = None) -> ([List[PrePostProcessModel], np.ndarray]):
         """
         main training loop.
 
@@ -220,40 +435,202 @@ class BaseOutOfFoldFeature(AbstractFeature):
                     * if n_fold = 1, stop one fold.
                     * if n_fold > num_cv, run all folds
                     * if n_fold <= 0, no fold run, return empty list and zero vector out-of-fold
+            silent:
+                If set `True`, the models are not saved (used in optuna trials).
+            fold_callback:
+                function called as `fold_callback(i, idx_valid, pred_i)` at the end of each fold.
+                If set, the folds are trained one by one (the callback can stop the training by raising error).
         Returns:
             list of fitted models and out-of-fold numpy array.
         """
-        oof = np.zeros_like(y, dtype=np.float32)
+        oof = np.zeros(np.shape(y), dtype=np.float32)
         splits = self.get_fold_splitting(X, y)
+        if not silent and not isinstance(self.cv, Iterable):
+            # record which folds are used. the splits are saved in the fold store by the key.
+            self.exp_backend.mark('fold_key', self.get_fold_key(y))
+        if n_fold is not None and n_fold < len(splits):
+            splits = [s for i, s in enumerate(splits) if i < max(0, n_fold)]
+            self.logger.info(f'Stop K-Fold at {len(splits)}')
+
+        # finished folds are saved as checkpoints and skipped in the rerun on the same data and parameters.
+        # the cv which changes the splits on every run can not be resumed.
+        checkpoint_key = None
+        if self.is_recording and not silent and \
+                (isinstance(self.cv, Iterable) or is_deterministic(self._checked_cv)):
+            checkpoint_key = combine_fingerprints(fingerprint_params(self.get_cache_params()),
+                                                  fingerprint_params(default_params),
+                                                  self._get_data_key(X, y))
+
+        # the fold transforms are shared by all trials (and features on the same data) when the scaling is used
+        use_scaling = any(default_params.get(k, None) for k in TRANSFORM_PARAMS)
+        self._transform_data_key = self._get_data_key(X, y) if use_scaling else None
+
+        n_workers = min(self.n_fold_jobs, len(splits))
+        if n_workers > 1 and self.fold_backend == 'process':
+            # workers attach to the memory-mapped file instead of receiving the copy of the matrix
+            X, y = share_array(X), share_array(y)
+        fold_args = [(i, X, y, idx_train, idx_valid, default_params, silent, n_workers, checkpoint_key)
+                     for i, (idx_train, idx_valid) in enumerate(splits)]
+
+        if n_workers < 2 or fold_callback is not None:
+            results = []
+            for args in fold_args:
+                clf, pred_i = self._run_fold(*args)
+                results.append((clf, pred_i))
+                if fold_callback is not None:
+                    fold_callback(args[0], args[4], pred_i)
+        elif self.fold_backend == 'thread':
+            results = joblib.Parallel(n_jobs=n_workers, backend='threading')(
+                joblib.delayed(self._run_fold)(*args) for args in fold_args)
+        else:
+            # fitted models and optuna study are not required in the worker (and study can not be pickled)
+            worker = copy.copy(self)
+            for key in ('study', '_fitted_models', '_fold_models', '_data_key_memo'):
+                vars(worker).pop(key, None)
+            detached = joblib.Parallel(n_jobs=n_workers, backend='loky')(
+                joblib.delayed(_run_fold_detached)(worker, args, get_tracer().enabled) for args in fold_args)
+            results = []
+            for result, spans in detached:
+                get_tracer().add(*spans)
+                results.append(result)
+
         models = []
+        for (_, idx_valid), (clf, pred_i) in zip(splits, results):
+            oof[idx_valid] = pred_i
+            models.append(clf)
 
-        for i, (idx_train, idx_valid) in enumerate(splits):
-            if n_fold is not None and i >= max(0, n_fold):
-                self.logger.info(f'Stop K-Fold at {i}')
-                break
+        # all folds are finished, so next run must train them again
+        if checkpoint_key is not None:
+            for i in range(len(splits)):
+                path = self.get_fold_checkpoint_path(i)
+                if os.path.exists(path):
+                    os.remove(path)
+        return models, oof
 
-            self.logger.info('start k-fold: {}/{}'.format(i + 1, self.num_cv))
+    def _get_data_key(self, X, y) -> str:
+        """fingerprint of the training data. memorized while the same arrays are used (i.e. in optuna trials)"""
+        memo = self._data_key_memo
+        if memo is not None and memo[0] is X and memo[1] is y:
+            return memo[2]
+        key = combine_fingerprints(fingerprint_array(X), fingerprint_array(y))
+        self._data_key_memo = (X, y, key)
+        return key
 
-            X_i, y_i = X[idx_train], y[idx_train]
-            X_valid, y_valid = X[idx_valid], y[idx_valid]
+    def get_refit_model_params(self, default_params: dict, fold_models: List[PrePostProcessModel]) -> dict:
+        """
+        generate model init parameter of the model trained on all training rows (used in `refit` mode).
 
-            with timer(self.logger, format_str='Fold: {}/{}'.format(i + 1, self.num_cv) + ' {:.1f}[s]'):
-                output_i = None if not self.is_recording or silent else os.path.join(self.output_dir, f'fold_{i:02d}')
-                clf = self._fit_model(X_i, y_i,
-                                      default_params=default_params,
-                                      validation_set=(X_valid, y_valid),
-                                      indexes_set=(idx_train, idx_valid),
-                                      output_dir=output_i)
+        Args:
+            default_params: default parameter. the same as passed to the folds.
+            fold_models: fitted fold models.
 
-            if self.is_regression_model:
-                pred_i = clf.predict(X_valid).reshape(-1)
-            else:
-                pred_i = clf.predict(X_valid, prob=True)[:, 1]
+        Returns:
+            parameter pass to model class
+        """
+        return copy.deepcopy(default_params)
 
-            oof[idx_valid] = pred_i
-            models.append(clf)
+    def run_refit(self, X, y, default_params, fold_models: List[PrePostProcessModel]) -> PrePostProcessModel:
+        """
+        train the model on all training rows. `sample_weight` is passed to fit if set.
 
-        return models, oof
+        Returns:
+            fitted model
+        """
+        model_params = self.get_refit_model_params(default_params, fold_models)
+        self.logger.info('start refit on all rows: {}'.format(model_params))
+        output_dir = os.path.join(self.output_dir, 'refit') if self.is_recording else None
+        model = self.create_model(model_params, output_dir=output_dir)
+        fit_params = {}
+        if self.sample_weight is not None:
+            fit_params['sample_weight'] = self.sample_weight
+
+        with trace('refit', category='fold', feature=str(self), **data_stats(X)), \
+                timer(self.logger, format_str='Refit: {:.1f}[s]'):
+            model.fit(X, y, **fit_params)
+        return model
+
+    def get_fold_checkpoint_path(self, i: int) -> Union[None, str]:
+        """path to the checkpoint of `i` th fold (it exists only while the training is not finished)"""
+        if not self.is_recording:
+            return None
+        return os.path.join(self.output_dir, f'fold_{i:02d}', self._checkpoint_filename)
+
+    def _load_fold_checkpoint(self, i: int, key: str,
+                              idx_valid: np.ndarray) -> Union[None, Tuple[PrePostProcessModel, np.ndarray]]:
+        path = self.get_fold_checkpoint_path(i)
+        if not os.path.exists(path):
+            return None
+        checkpoint = joblib.load(path)
+        # the model trained on the other split must not predict the validation rows (it leaks out-of-fold)
+        if checkpoint['key'] != key or not np.array_equal(checkpoint['idx_valid'], idx_valid):
+            return None
+
+        model = self.create_model(dict(checkpoint['model_params']), output_dir=checkpoint['output_dir'])
+        model.load_trained_model()
+        return model, checkpoint['pred']
+
+    def _save_fold_checkpoint(self, i: int, key: str, model: PrePostProcessModel, idx_valid, pred: np.ndarray):
+        path = self.get_fold_checkpoint_path(i)
+        params = model.get_params(deep=False)
+        checkpoint = {
+            'key': key,
+            'idx_valid': idx_valid,
+            'pred': pred,
+            'model_params': params['model_params'],
+            'output_dir': params['output_dir']
+        }
+        # write to the temporary file at first, in order not to leave a broken checkpoint
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        joblib.dump(checkpoint, path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+    def _run_fold(self, i, X, y, idx_train, idx_valid, default_params, silent=False, n_workers=1,
+                  checkpoint_key=None):
+        """
+        fit the model of `i` th fold. return the fitted model and the prediction on validation data.
+        If `checkpoint_key` is set, the result is loaded from the checkpoint of the same key if exists,
+        otherwise saved as the checkpoint.
+        """
+        if checkpoint_key is not None:
+            checkpoint = self._load_fold_checkpoint(i, checkpoint_key, idx_valid)
+            if checkpoint is not None:
+                self.logger.info('load k-fold: {}/{} from checkpoint'.format(i + 1, self.num_cv))
+                return checkpoint
+
+        self.logger.info('start k-fold: {}/{}'.format(i + 1, self.num_cv))
+
+        # the estimators are fitted on the plain arrays, so the rows of the fold are copied here
+        X_i, y_i = X[idx_train], y[idx_train]
+        X_valid, y_valid = X[idx_valid], y[idx_valid]
+        if n_workers > 1:
+            default_params = self.limit_model_threads(default_params, n_workers)
+
+        with trace(f'fold_{i:02d}', category='fold', feature=str(self), **data_stats(X_i)), \
+                timer(self.logger, format_str='Fold: {}/{}'.format(i + 1, self.num_cv) + ' {:.1f}[s]'):
+            output_i = None if not self.is_recording or silent else os.path.join(self.output_dir, f'fold_{i:02d}')
+            clf = self._fit_model(X_i, y_i,
+                                  default_params=default_params,
+                                  validation_set=(X_valid, y_valid),
+                                  indexes_set=(idx_train, idx_valid),
+                                  output_dir=output_i)
+            pred_i = self._predict_fold(clf, X_valid)
+
+        if checkpoint_key is not None:
+            self._save_fold_checkpoint(i, checkpoint_key, clf, idx_valid, pred_i)
+        return clf, pred_i
+
+    def limit_model_threads(self, model_params: dict, n_workers: int) -> dict:
+        """
+        limit the threads of the model (`n_jobs` parameter), so that `n_workers` folds share the cpu cores.
+        Models which do not have `n_jobs` parameter are not changed.
+        """
+        if 'n_jobs' not in self.model_class().get_params():
+            return model_params
+        budget = max(1, (os.cpu_count() or 1) // n_workers)
+        n_jobs = model_params.get('n_jobs', None)
+        if n_jobs is None or n_jobs < 0 or n_jobs > budget:
+            model_params = {**model_params, 'n_jobs': budget}
+        return model_params
 
     def create_model(self, model_params, output_dir=None) -> PrePostProcessModel:
         """
@@ -310,26 +687,59 @@ class BaseOutOfFoldFeature(AbstractFeature):
         model_params = self.get_model_params_on_each_fold(default_params, indexes_set)
         model = self.create_model(model_params, output_dir=output_dir)
 
-        # MEMO: validation data are not transform so validation score is invalid (in boosting model, eval_set)
-        model._before_fit(X, y)
-        x_valid, y_valid = validation_set
-        x_valid = model.input_transformer.transform(x_valid)
-        y_valid = model.target_transformer.transform(y_valid)
+        # MEMO: validation data are transformed by the transformers fitted on the training data
+        # (in boosting model, eval_set), so the validation score is on the transformed scale.
+        transform = self._transform_fold(model, X, y, validation_set, indexes_set)
 
         fit_params = self.get_fit_params_on_each_fold(model_params,
                                                       training_set=(X, y),
-                                                      validation_set=(x_valid, y_valid),
+                                                      validation_set=(transform.x_valid, transform.y_valid),
                                                       indexes_set=indexes_set)
         if fit_params is None:
             fit_params = {}
-        model.fit(X, y, **fit_params)
+        model.fit_transformed(transform.x_train, transform.y_train, **fit_params)
         return model
 
+    def _transform_fold(self, model: PrePostProcessModel, X, y, validation_set: tuple,
+                        indexes_set: tuple) -> FoldTransform:
+        """
+        fit the input / target transformers of the model on the fold and transform the training and validation set.
+        When the scaling is used, the result is shared through the process wide fold transform cache.
+        """
+        transformers = (model.input_transformer, model.target_transformer)
+        use_cache = self._transform_data_key is not None and any(t.log or t.use_scaling for t in transformers)
+        key = None
+        if use_cache:
+            # the validation set is also transformed, so both indexes are the part of the key
+            key = combine_fingerprints(self._transform_data_key,
+                                       fingerprint_array(indexes_set[0]),
+                                       fingerprint_array(indexes_set[1]),
+                                       fingerprint_params([t.get_params(deep=False) for t in transformers]))
+            transform = get_fold_transform_cache().get(key)
+            if transform is not None:
+                # fitted transformers are never changed, so the models can share them
+                model.input_transformer = transform.input_transformer
+                model.target_transformer = transform.target_transformer
+                return transform
+
+        x_train, y_train = model._before_fit(X, y)
+        x_valid, y_valid = validation_set
+        transform = FoldTransform(model.input_transformer, model.target_transformer,
+                                  x_train=x_train, y_train=y_train,
+                                  x_valid=model.input_transformer.transform(x_valid),
+                                  y_valid=model.target_transformer.transform(y_valid))
+        if use_cache:
+            get_fold_transform_cache().put(key, transform)
+        return transform
+
     def post_fit(self,
                  input_df: pd.DataFrame, parent_output_df: pd.DataFrame,
                  out_df: pd.DataFrame, y: np.ndarray) -> pd.DataFrame:
         if self.is_recording:
             self.save_model_parameters(self._fitted_models)
+            # register the models in memory, in order not to load them again in this process
+            key, version = self._get_registry_key()
+            get_model_registry().put(key, self._fitted_models, version=version)
         return super(BaseOutOfFoldFeature, self).post_fit(input_df, parent_output_df, out_df, y)
 
     def save_model_parameters(self, best_models: List[PrePostProcessModel]) -> List[dict]:
@@ -353,11 +763,17 @@ class BaseOptunaOutOfFoldFeature(BaseOutOfFoldFeature):
     """
     optuna_jobs = -1  # optuna parallels
     SCORING_STRATEGY_CHOICES = ['fold', 'whole']  # choice of scoring strategy
+    PRUNER_CHOICES = ['median', 'successive_halving', 'hyperband']  # choice of pruner name
 
     def __init__(self,
                  n_trials=200,
                  scoring_strategy='fold',
                  scoring: Union[str, Callable, None] = None,
+                 pruner: Union[None, str, optuna.pruners.BasePruner] = None,
+                 storage: Union[None, str, optuna.storages.BaseStorage] = None,
+                 trial_backend: Union[None, str] = None,
+                 halving_rungs: Union[None, List[Union[float, dict]]] = None,
+                 halving_factor=3,
                  **kwargs):
         """
         Optuna Optimization Model Feature
@@ -372,6 +788,35 @@ class BaseOptunaOutOfFoldFeature(BaseOutOfFoldFeature):
             scoring:
                 scoring method. String or Scoring Object
                  (scoring obj must be satisfied check_scoring validation)
+            pruner:
+                optuna pruner to stop the unpromising trials at the end of each fold.
+                The mean of the fold scores so far is reported to the trial as the intermediate value.
+                String (`"median"`, `"successive_halving"` or `"hyperband"`) or optuna pruner instance.
+                If set None, all trials run all folds.
+            storage:
+                optuna storage (URL like `"sqlite:///path/to/optuna.db"` or storage instance) to save the trials.
+                The study is named from the feature and the fingerprint of the data, so the rerun on the same data
+                resumes the study and runs only the remaining trials. Features in many processes can share the same
+                storage. If set None, use `Settings.OPTUNA_STORAGE` if set, otherwise SQLite file
+                (`optuna.db` in output dir) when the feature is recording, otherwise in memory storage.
+            trial_backend:
+                worker pool type to run `optuna_jobs` trials at the same time. `"thread"` or `"process"`.
+                In `"process"` backend, the training matrix is shared by the memory-mapped file and the study is
+                shared by the storage. If the feature has no storage, the temporary SQLite file is used while the
+                trials run (it is removed after the optimization, and the study is copied to memory).
+                SQLite storage waits for the lock of the other processes up to `Settings.OPTUNA_SQLITE_TIMEOUT`.
+                In both backends, the threads of the model (`n_jobs` parameter) in each trial are limited to
+                `cpu_count / optuna_jobs`. If set None, use `Settings.TRIAL_BACKEND`.
+            halving_rungs:
+                low fidelity rungs of successive halving search. If set, `n_trials` trials are scored on the first
+                rung and only the top `1 / halving_factor` trials are promoted to the next rung. The trials promoted
+                from the last rung are scored on the full data K-Fold, and the best of them is used.
+                Each rung is the fraction of rows (stratified sub-sample for classification) or dict like
+                `{"rows": .1, "budget": .2}`, where `budget` is the fraction of the training budget
+                (boosting rounds on boosting models, see `apply_rung_budget`).
+                If set None, all trials are scored on the full data.
+            halving_factor:
+                reduction factor of the trials on each rung.
             **kwargs:
                 pass to superclass
         """
@@ -396,10 +841,56 @@ class BaseOptunaOutOfFoldFeature(BaseOutOfFoldFeature):
             raise ValueError(s)
         self.scoring_method = scoring  # type: _BaseScorer
 
+        if isinstance(pruner, str):
+            if pruner not in self.PRUNER_CHOICES:
+                raise ValueError('`pruner` must be in {}. actually: {}'.format(','.join(self.PRUNER_CHOICES), pruner))
+        self.pruner = pruner
+        self.storage = storage
+
+        if trial_backend is None:
+            trial_backend = Settings.TRIAL_BACKEND
+        if trial_backend not in TRIAL_BACKENDS:
+            raise ValueError('`trial_backend` must be in {}. actually: {}'.format(','.join(TRIAL_BACKENDS),
+                                                                                 trial_backend))
+        self.trial_backend = trial_backend
+        self._temporary_storage = None  # type: Union[None, str]
+
+        self.halving_rungs = [_parse_halving_rung(r) for r in halving_rungs or []]
+        if halving_factor < 2:
+            raise ValueError(f'`halving_factor` must be greater than 1. actually: {halving_factor}')
+        self.halving_factor = halving_factor
+        if isinstance(self.cv, Iterable) and any(r['rows'] < 1 for r in self.halving_rungs):
+            raise ValueError('row sub-sample rungs can not be used with the fixed fold indexes `cv`.')
+        self._rung_budget = None
+
         self.exp_backend.mark('n_trials', self.n_trails)
         self.exp_backend.mark('scoring_strategy', self.scoring_strategy)
         self.exp_backend.mark('scoring', str(self.scoring_method))
 
+    def get_cache_params(self) -> dict:
+        params = super(BaseOptunaOutOfFoldFeature, self).get_cache_params()
+        params.update({
+            'n_trials': self.n_trails,
+            'scoring_strategy': self.scoring_strategy,
+            'scoring': self.scoring_method,
+            'pruner': self.pruner,
+            'halving_rungs': self.halving_rungs,
+            'halving_factor': self.halving_factor
+        })
+        return params
+
+    def create_pruner(self) -> optuna.pruners.BasePruner:
+        """create optuna pruner from `pruner` argument"""
+        if self.pruner is None:
+            return optuna.pruners.NopPruner()
+        if self.pruner == 'median':
+            return optuna.pruners.MedianPruner()
+        if self.pruner == 'successive_halving':
+            return optuna.pruners.SuccessiveHalvingPruner()
+        if self.pruner == 'hyperband':
+            return optuna.pruners.HyperbandPruner(min_resource=1, max_resource=self.num_cv or 'auto')
+        return self.pruner
+
     def generate_model_class_try_params(self, trial: Trial) -> dict:
         """method to get the range of parameters to look for in the model's init
         The created value overrides the class variable and becomes the initial value of the model.
@@ -435,8 +926,32 @@ class BaseOptunaOutOfFoldFeature(BaseOutOfFoldFeature):
         model_params = copy.deepcopy(self._initial_params)
         add_model_params = self.generate_model_class_try_params(trial)
         model_params.update(add_model_params)
+        if self._rung_budget is not None:
+            model_params = self.apply_rung_budget(model_params, self._rung_budget)
+        # trials x threads of each model = cpu cores
+        return self.limit_model_threads(model_params, self.n_trial_workers)
+
+    def apply_rung_budget(self, model_params: dict, budget: float) -> dict:
+        """
+        reduce the training budget of the model on the low fidelity rung.
+        By default, the parameters are not changed (only row sub-sample is used).
+
+        Args:
+            model_params: parameters of the trial.
+            budget: fraction of the budget. `0 < budget <= 1`.
+
+        Returns:
+            parameters used on the rung
+        """
         return model_params
 
+    @property
+    def n_trial_workers(self) -> int:
+        """number of trials run at the same time"""
+        if self.optuna_jobs < 0:
+            return os.cpu_count() or 1
+        return max(self.optuna_jobs, 1)
+
     def calculate_score(self, y_true, y_pred, sample_weight) -> float:
         if sample_weight is not None:
             return self.scoring_method._sign * self.scoring_method._score_func(y_true,
@@ -464,10 +979,30 @@ class BaseOptunaOutOfFoldFeature(BaseOutOfFoldFeature):
             score of this trial
         """
         params = self.generate_try_parameter(trial)
-        models, oof = self.run_oof_train(X, y, default_params=params, silent=True)
+        sample_weight = self.sample_weight
+
+        # the study name contains the fingerprint of the data, so the key is unique to the params and the data
+        params_key = combine_fingerprints(fingerprint_params(params), trial.study.study_name)
+        trial.set_user_attr('params_key', params_key)
+        memoized = self._find_memoized_value(trial.study, params_key)
+        trial.set_user_attr('cache_hit', memoized is not None)
+        if memoized is not None:
+            return memoized
+
+        fold_scores = []
+
+        def report_fold_score(i, idx_valid, pred_i):
+            sample_weight_i = sample_weight[idx_valid] if sample_weight is not None else None
+            fold_scores.append(self.calculate_score(y[idx_valid], pred_i, sample_weight=sample_weight_i))
+            trial.report(np.mean(fold_scores), step=i)
+            if trial.should_prune():
+                raise optuna.TrialPruned(f'pruned at fold {i + 1}')
+
+        with trace(f'trial_{trial.number}', category='trial', feature=str(self), **data_stats(X)):
+            models, oof = self.run_oof_train(X, y, default_params=params, silent=True,
+                                             fold_callback=report_fold_score if self.pruner is not None else None)
 
         scores = []
-        sample_weight = self.sample_weight
         if self.scoring_strategy == 'whole':
             score = self.calculate_score(y, oof, sample_weight)
         elif self.scoring_strategy == 'fold':
@@ -480,6 +1015,187 @@ class BaseOptunaOutOfFoldFeature(BaseOutOfFoldFeature):
             raise ValueError()
         return score
 
+    def _find_memoized_value(self, study: Study, params_key: str) -> Union[None, float]:
+        """objective value of the completed trial which has the same parameters on the same study"""
+        for t in study.get_trials(deepcopy=False):
+            if t.state == optuna.trial.TrialState.COMPLETE and t.user_attrs.get('params_key') == params_key:
+                return t.value
+        return None
+
+    def get_storage(self) -> Union[None, str, optuna.storages.BaseStorage]:
+        """optuna storage of the study. None means in memory storage."""
+        if self.storage is not None:
+            return self.storage
+        if Settings.OPTUNA_STORAGE:
+            return Settings.OPTUNA_STORAGE
+        if self.is_recording:
+            os.makedirs(self.output_dir, exist_ok=True)
+            return 'sqlite:///' + os.path.join(os.path.abspath(self.output_dir), 'optuna.db')
+        return None
+
+    def get_study_name(self, X, y) -> str:
+        """
+        study name which is unique to the feature parameters and the training data.
+        `n_trials` is not included, so the study can be resumed with more trials.
+        """
+        params = self.get_cache_params()
+        params.pop('n_trials', None)
+        key = combine_fingerprints(fingerprint_params(params),
+                                   fingerprint_array(X),
+                                   fingerprint_array(y))
+        return f'{self}_{key}'
+
+    @property
+    def use_trial_processes(self) -> bool:
+        return self.trial_backend == 'process' and self.n_trial_workers > 1
+
+    def _get_shared_storage(self) -> Union[None, str, optuna.storages.BaseStorage]:
+        storage = self.get_storage()
+        if not self.use_trial_processes:
+            return storage
+        if storage is None:
+            # in memory study can not be shared by the processes (see `_trial_storage_scope`)
+            storage = self._temporary_storage
+        if isinstance(storage, str) and storage.startswith('sqlite:'):
+            # the trial processes write to the same file, so wait for the lock instead of "database is locked"
+            storage = optuna.storages.RDBStorage(
+                storage, engine_kwargs={'connect_args': {'timeout': Settings.OPTUNA_SQLITE_TIMEOUT}})
+        return storage
+
+    @contextmanager
+    def _trial_storage_scope(self):
+        """
+        create the temporary SQLite storage for the trial processes, when the feature has no storage.
+        the file is removed at the end, so the unrelated runs never resume the study.
+        """
+        if not self.use_trial_processes or self.get_storage() is not None:
+            yield
+            return
+
+        tmp_dir = tempfile.mkdtemp(prefix='vivid_optuna_')
+        self._temporary_storage = 'sqlite:///' + os.path.join(tmp_dir, 'studies.db')
+        try:
+            yield
+        finally:
+            self._temporary_storage = None
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def create_study(self, X, y, study_name: Union[None, str] = None) -> Study:
+        """create the study. If the study of the same name exists in the storage, load it."""
+        return optuna.study.create_study(study_name=study_name or self.get_study_name(X, y),
+                                         storage=self._get_shared_storage(),
+                                         load_if_exists=True,
+                                         direction='maximize',
+                                         pruner=self.create_pruner())
+
+    def _optimize(self, study: Study, X, y, n_total: int) -> Study:
+        """run trials until the study has `n_total` finished trials"""
+        n_remaining = n_total - _count_finished_trials(study)
+        if n_remaining <= 0:
+            return study
+        if self.use_trial_processes:
+            return self._optimize_in_processes(study, X, y, n_remaining, n_total)
+        with self.set_silent():
+            study.optimize(lambda trial: self.get_objective(trial, X, y), n_trials=n_remaining,
+                           n_jobs=self.optuna_jobs, callbacks=[_create_stop_callback(n_total)])
+        return study
+
+    def _optimize_in_processes(self, study: Study, X, y, n_trials: int, n_total: int) -> Study:
+        """run trials in the process pool. the workers share the study by the storage."""
+        storage = self._get_shared_storage()
+        n_workers = min(self.n_trial_workers, n_trials)
+        X, y = share_array(X), share_array(y)
+
+        worker = copy.copy(self)
+        for key in ('study', '_fitted_models', '_fold_models', '_data_key_memo'):
+            vars(worker).pop(key, None)
+        results = joblib.Parallel(n_jobs=n_workers, backend='loky')(
+            joblib.delayed(_optimize_in_worker)(worker, X, y, study.study_name, storage, n_trials, n_total,
+                                                get_tracer().enabled)
+            for _ in range(n_workers))
+        for spans in results:
+            get_tracer().add(*spans)
+        return optuna.load_study(study_name=study.study_name, storage=storage, pruner=self.create_pruner())
+
+    def get_rung_rows(self, y, rows: float) -> np.ndarray:
+        """
+        row indexes of the sub-sample used on the rung. classification target is stratified.
+
+        Args:
+            y: target array.
+            rows: fraction of rows. `0 < rows <= 1`.
+        """
+        indexes = np.arange(len(y))
+        if rows >= 1:
+            return indexes
+        stratify = None if self.is_regression_model else y
+        indexes, _ = train_test_split(indexes, train_size=rows, stratify=stratify,
+                                      random_state=Settings.RANDOM_SEED)
+        return np.sort(indexes)
+
+    @contextmanager
+    def _use_rung(self, indexes: np.ndarray, budget: float):
+        """use the rows and the training budget of the rung in the block"""
+        groups, sample_weight = self.groups, self.sample_weight
+        if groups is not None:
+            self.groups = np.asarray(groups)[indexes]
+        if sample_weight is not None:
+            self.sample_weight = np.asarray(sample_weight)[indexes]
+        self._rung_budget = budget if budget < 1 else None
+        try:
+            yield
+        finally:
+            self.groups, self.sample_weight = groups, sample_weight
+            self._rung_budget = None
+
+    def _promote(self, study: Study, promoted_from: Study, n_promoted: int) -> int:
+        """
+        enqueue the top trials of the lower rung to the study. the trials already in the study
+        (scored or enqueued by the interrupted run) are not enqueued.
+
+        Returns:
+            number of the trials on the study when all promoted trials are finished.
+        """
+        completed = [t for t in promoted_from.trials if t.state == optuna.trial.TrialState.COMPLETE]
+        top_params = [t.params for t in sorted(completed, key=lambda t: t.value, reverse=True)][:n_promoted]
+        # the enqueued trials keep the params in `fixed_params` until they start
+        existing = [t.system_attrs.get('fixed_params', t.params) for t in study.trials]
+        for params in top_params:
+            if params not in existing:
+                study.enqueue_trial(params)
+        return len(top_params)
+
+    def _optimize_by_halving(self, X, y) -> Study:
+        """
+        successive halving search. the trials are scored on the low fidelity rungs at first and
+        only the top trials are promoted to the next rung (the last one is full data).
+        """
+        study_name = self.get_study_name(X, y)
+        rungs = self.halving_rungs + [{'rows': 1., 'budget': 1.}]
+        n_trials = self.n_trails
+        study = None
+        for k, rung in enumerate(rungs):
+            is_last = k == len(rungs) - 1
+            name = study_name if is_last else f'{study_name}_rung{k}'
+            indexes = self.get_rung_rows(y, rung['rows'])
+            X_rung, y_rung = (X, y) if len(indexes) == len(y) else (X[indexes], y[indexes])
+
+            promoted_from, study = study, self.create_study(X, y, study_name=name)
+            if promoted_from is not None:
+                n_trials = self._promote(study, promoted_from, n_trials)
+
+            with trace(f'rung_{k}', category='rung', feature=str(self), row_fraction=rung['rows'],
+                       budget=rung['budget'], **data_stats(X_rung)), \
+                    self.exp_backend.mark_time(f'optuna_rung{k}_'), \
+                    timer(self.logger, prefix=f'rung {k} ({len(y_rung)} rows, budget {rung["budget"]}, '
+                                              f'{n_trials} trials) finished: '), \
+                    self._use_rung(indexes, rung['budget']):
+                study = self._optimize(study, X_rung, y_rung, n_total=n_trials)
+
+            if not is_last:
+                n_trials = max(1, int(np.ceil(n_trials / self.halving_factor)))
+        return study
+
     def generate_default_model_parameter(self, X, y) -> dict:
         """
         The main loop which explore model parameter by optuna.
@@ -493,13 +1209,19 @@ class BaseOptunaOutOfFoldFeature(BaseOutOfFoldFeature):
         """
         self.logger.info('start optimize by optuna')
 
-        self.study = optuna.study.create_study(direction='maximize')
-        objective = lambda trial: self.get_objective(trial, X, y)
-
         # Stop model logging while optuna optimization
-        with self.exp_backend.mark_time('optuna_') as exp:
-            with self.set_silent():
-                self.study.optimize(objective, n_trials=self.n_trails, n_jobs=self.optuna_jobs)
+        with self.exp_backend.mark_time('optuna_') as exp, self._trial_storage_scope():
+            if self.halving_rungs:
+                self.study = self._optimize_by_halving(X, y)
+            else:
+                self.study = self.create_study(X, y)
+                n_remaining = self.n_trails - _count_finished_trials(self.study)
+                if n_remaining < self.n_trails:
+                    self.logger.info('resume study: {} trials are remaining'.format(max(n_remaining, 0)))
+                self.study = self._optimize(self.study, X, y, n_total=self.n_trails)
+
+            if self._temporary_storage is not None:
+                self.study = _copy_study_to_memory(self.study, pruner=self.create_pruner())
 
         self.logger.info('best trial params: {}'.format(self.study.best_params))
         self.logger.info('best value: {}'.format(self.study.best_value))
@@ -508,7 +1230,14 @@ class BaseOptunaOutOfFoldFeature(BaseOutOfFoldFeature):
         best_params.update(self.study.best_params)
         self.logger.info('best model paras: {}'.format(best_params))
 
+        n_pruned = len([t for t in self.study.trials if t.state == optuna.trial.TrialState.PRUNED])
+        self.logger.info('pruned trials: {}/{}'.format(n_pruned, len(self.study.trials)))
+        n_cache_hits = len([t for t in self.study.trials if t.user_attrs.get('cache_hit', False)])
+        self.logger.info('cache hit trials: {}/{}'.format(n_cache_hits, len(self.study.trials)))
+
         self.exp_backend.mark('optuna_best_value', self.study.best_value)
+        self.exp_backend.mark('optuna_n_pruned', n_pruned)
+        self.exp_backend.mark('optuna_n_cache_hits', n_cache_hits)
         self.exp_backend.save_object('study_log', self.study.trials_dataframe())
         self.exp_backend.save_object('best_params', best_params)
         self.exp_backend.save_object('best_trial_params', self.study.best_params)
@@ -612,10 +1341,11 @@ class ShowMetricMixin:
                  input_df: pd.DataFrame, parent_output_df: pd.DataFrame, out_df, y):
         for func in self.get_show_metric_generators():
             try:
-                outputs = func.call(feature_instance=self,
-                                    source_df=parent_output_df,
-                                    y=y,
-                                    oof=out_df.values[:, 0])
+                with trace(func.__class__.__name__, category='report', feature=str(self)):
+                    outputs = func.call(feature_instance=self,
+                                        source_df=parent_output_df,
+                                        y=y,
+                                        oof=out_df.values[:, 0])
 
                 if not self.is_recording:
                     continue
@@ -642,6 +1372,11 @@ class EnsembleFeature(ShowMetricMixin, AbstractFeature):
         super(EnsembleFeature, self).__init__(**kwargs)
         self.agg = agg
 
+    def get_cache_params(self) -> dict:
+        params = super(EnsembleFeature, self).get_cache_params()
+        params['agg'] = self.agg
+        return params
+
     @property
     def is_regression_model(self):
         """proxy to parent"""
@@ -1,3 +1,5 @@
+from typing import Union
+
 from lightgbm.callback import _format_eval_result, CallbackEnv
 from optuna import Trial
 
@@ -26,6 +28,27 @@ def logging_evaluation(logger, period=1, show_stdv=True, experiment_backend=None
     return _callback
 
 
+def get_best_iteration(model) -> Union[None, int]:
+    """
+    number of boosting rounds until the best iteration of early stopping.
+
+    Args:
+        model: fitted sklearn API model of LightGBM or XGBoost.
+
+    Returns:
+        number of rounds. If the model is not early stopped, return None.
+    """
+    # lightgbm: number of rounds (0 means not early stopped)
+    n_rounds = getattr(model, 'best_iteration_', None)
+    if n_rounds:
+        return int(n_rounds)
+    # xgboost: index of the best round (the attribute exists only when early stopped)
+    best_iteration = getattr(model, 'best_iteration', None)
+    if best_iteration is None:
+        return None
+    return int(best_iteration) + 1
+
+
 def get_boosting_parameter_suggestions(trial: Trial) -> dict:
     """
     Get parameter sample for Boosting (like XGBoost, LightGBM)
@@ -0,0 +1,173 @@
+# coding: utf-8
+"""
+Merge the boosters of the folds into one tree ensemble.
+
+The raw score of a GBDT model is the sum of the leaf values of all trees, so the booster which has all trees of
+K fold boosters with the leaf values scaled by 1/K predicts the mean of the raw scores of the folds in one pass.
+The link function (like sigmoid of binary classification) is applied to the mean raw score by the merged booster.
+"""
+
+import json
+import os
+import tempfile
+from typing import List, Union
+
+import lightgbm as lgbm
+import xgboost as xgb
+
+from .helpers import get_best_iteration
+
+
+def _scale_values(line: str, scale: float) -> str:
+    key, values = line.split('=', 1)
+    values = ' '.join(repr(float(v) * scale) for v in values.split())
+    return f'{key}={values}'
+
+
+def _lgbm_model_spec(header: str) -> List[str]:
+    """lines of the model header which must be the same in the merged boosters (`feature_infos` is data range)"""
+    keys = ('num_class=', 'num_tree_per_iteration=', 'max_feature_idx=', 'objective=', 'feature_names=')
+    return [line for line in header.split('\n') if line.startswith(keys)]
+
+
+def merge_lgbm_boosters(boosters: List[lgbm.Booster],
+                        num_iterations: Union[None, List[Union[None, int]]] = None) -> lgbm.Booster:
+    """
+    merge LightGBM boosters into one booster which predicts the mean raw score of them.
+
+    Args:
+        boosters: fitted boosters. all boosters must have the same objective and features.
+        num_iterations: number of iterations used in each booster (i.e. the best iteration).
+            If set None (or the element is None), use all iterations.
+
+    Returns:
+        merged booster
+    """
+    if num_iterations is None:
+        num_iterations = [None] * len(boosters)
+    scale = 1. / len(boosters)
+
+    header, footer = None, None
+    trees = []
+    for booster, num_iteration in zip(boosters, num_iterations):
+        model_str = booster.model_to_string(num_iteration=num_iteration or -1)
+        head, body = model_str.split('\nTree=', 1)
+        body, tail = ('Tree=' + body).split('end of trees', 1)
+        if header is None:
+            header, footer = head, tail
+        elif _lgbm_model_spec(head) != _lgbm_model_spec(header):
+            raise ValueError('boosters which have different objective or features can not be merged.')
+
+        for block in body.split('Tree=')[1:]:
+            lines = block.split('\n')
+            lines = [_scale_values(line, scale) if line.startswith(('leaf_value=', 'internal_value=')) else line
+                     for line in lines]
+            trees.append(lines)
+
+    if 'num_tree_per_iteration=1' not in header.split('\n') or 'average_output' in header.split('\n'):
+        raise ValueError('only single output gradient boosting models can be merged.')
+
+    blocks = []
+    for i, lines in enumerate(trees):
+        # the first line is the tree index
+        blocks.append('\n'.join([f'Tree={i}'] + lines[1:]))
+    tree_sizes = ' '.join(str(len(b.encode())) for b in blocks)
+    header = '\n'.join(f'tree_sizes={tree_sizes}' if line.startswith('tree_sizes=') else line
+                       for line in header.split('\n'))
+    model_str = header + '\n' + ''.join(blocks) + 'end of trees' + footer
+    return lgbm.Booster(model_str=model_str)
+
+
+def _dump_xgb_booster(booster: xgb.Booster) -> dict:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'model.json')
+        booster.save_model(path)
+        with open(path) as f:
+            return json.load(f)
+
+
+def _load_xgb_booster(model: dict) -> xgb.Booster:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'model.json')
+        with open(path, 'w') as f:
+            json.dump(model, f)
+        booster = xgb.Booster()
+        booster.load_model(path)
+        return booster
+
+
+def merge_xgb_boosters(boosters: List[xgb.Booster],
+                       num_iterations: Union[None, List[Union[None, int]]] = None) -> xgb.Booster:
+    """
+    merge XGBoost (gbtree) boosters into one booster which predicts the mean raw score of them.
+
+    Args:
+        boosters: fitted boosters. all boosters must have the same objective, base score and features.
+        num_iterations: number of iterations used in each booster (i.e. the best iteration).
+            If set None (or the element is None), use all iterations.
+
+    Returns:
+        merged booster
+    """
+    if num_iterations is None:
+        num_iterations = [None] * len(boosters)
+    scale = 1. / len(boosters)
+
+    merged = None
+    trees = []
+    for booster, num_iteration in zip(boosters, num_iterations):
+        model = _dump_xgb_booster(booster)
+        learner = model['learner']
+        if learner['gradient_booster']['name'] != 'gbtree':
+            raise ValueError('only gbtree booster can be merged. actually: {}'.format(
+                learner['gradient_booster']['name']))
+        if int(learner['learner_model_param']['num_class']) > 1 or \
+                int(learner['gradient_booster']['model']['gbtree_model_param'].get('num_parallel_tree', 1)) > 1:
+            raise ValueError('only single output boosting models can be merged.')
+
+        if merged is None:
+            merged = model
+        elif learner['learner_model_param'] != merged['learner']['learner_model_param'] or \
+                learner['objective'] != merged['learner']['objective']:
+            raise ValueError('boosters which have different objective, base score or features can not be merged.')
+
+        booster_trees = learner['gradient_booster']['model']['trees']
+        if num_iteration is not None:
+            booster_trees = booster_trees[:num_iteration]
+        for tree in booster_trees:
+            # leaf value is stored in `split_conditions` of the leaf nodes
+            tree['split_conditions'] = [v * scale if left == -1 else v
+                                        for v, left in zip(tree['split_conditions'], tree['left_children'])]
+            trees.append(tree)
+
+    for i, tree in enumerate(trees):
+        tree['id'] = i
+    gbtree = merged['learner']['gradient_booster']['model']
+    gbtree['trees'] = trees
+    gbtree['tree_info'] = [0] * len(trees)
+    gbtree['gbtree_model_param']['num_trees'] = str(len(trees))
+    if 'iteration_indptr' in gbtree:
+        gbtree['iteration_indptr'] = list(range(len(trees) + 1))
+    # best iteration of the first fold is not valid on the merged booster
+    merged['learner']['attributes'] = {}
+    return _load_xgb_booster(merged)
+
+
+def merge_boosters(models) -> Union[lgbm.Booster, xgb.Booster]:
+    """
+    merge the fitted sklearn API models of LightGBM or XGBoost into one native booster.
+    each model is cut to the best iteration if it is early stopped.
+
+    Args:
+        models: fitted `LGBMModel` or `XGBModel` instances.
+
+    Returns:
+        merged native booster
+    """
+    num_iterations = [get_best_iteration(m) for m in models]
+    if all(isinstance(m, lgbm.LGBMModel) for m in models):
+        return merge_lgbm_boosters([m.booster_ for m in models], num_iterations)
+    if all(isinstance(m, xgb.XGBModel) for m in models):
+        return merge_xgb_boosters([m.get_booster() for m in models], num_iterations)
+    raise ValueError('only LightGBM or XGBoost models can be merged. actually: {}'.format(
+        ', '.join(sorted({type(m).__name__ for m in models}))))
@@ -1,7 +1,12 @@
 from copy import deepcopy
 from typing import Union
 
-from .helpers import logging_evaluation
+import numpy as np
+import pandas as pd
+
+from .helpers import logging_evaluation, get_best_iteration
+from .merge import merge_boosters
+from .native import get_native_booster, get_native_dtype, predict_booster
 from ..base import BaseOutOfFoldFeature, GenericOutOfFoldFeature, GenericOutOfFoldOptunaFeature
 
 
@@ -11,6 +16,33 @@ class BoostingEarlyStoppingMixin:
     default_eval_metric = None
     fit_verbose = 100
 
+    def __init__(self, *args, merge_folds=False, native_predict=False, predict_threads=None, **kwargs):
+        """
+        Args:
+            merge_folds:
+                If set `True`, the fold boosters are merged into one booster (see `export_merged_booster`) and
+                it predicts the test in one pass. The prediction is the link function (like sigmoid) of
+                the mean raw score of the folds, so the probability on classification is slightly different from
+                the mean of the fold probabilities. It can not be used with `fold_agg` other than `"mean"`.
+            native_predict:
+                If set `True`, the fold models predict the test by the native boosters instead of the sklearn API.
+                The test is converted to the contiguous array of the native dtype (float32 on XGBoost, float64 on
+                LightGBM) only once, and the input transformers (scaling) run in place on the copy of it.
+            predict_threads:
+                number of threads of the native booster on predict (used when `merge_folds` or `native_predict`).
+                If set None, use the default of the library.
+            *args, **kwargs:
+                pass to superclass
+        """
+        super(BoostingEarlyStoppingMixin, self).__init__(*args, **kwargs)
+        if merge_folds and self.fold_agg != 'mean':
+            raise ValueError('`merge_folds` averages the raw scores of the folds, so `fold_agg` must be "mean". '
+                             'actually: {}'.format(self.fold_agg))
+        self.merge_folds = merge_folds
+        self.native_predict = native_predict
+        self.predict_threads = predict_threads
+        self._merged_booster = None
+
     def get_fit_params_on_each_fold(self: Union['BoostingEarlyStoppingMixin', BaseOutOfFoldFeature],
                                     model_params, training_set, validation_set, indexes_set):
         params = super(BoostingEarlyStoppingMixin, self) \
@@ -30,10 +62,82 @@ class BoostingEarlyStoppingMixin:
         params.update(add_params)
         return params
 
+    def get_refit_model_params(self: Union['BoostingEarlyStoppingMixin', BaseOutOfFoldFeature],
+                               default_params, fold_models):
+        """use the mean of the best iterations of early stopped folds as `n_estimators`"""
+        params = super(BoostingEarlyStoppingMixin, self).get_refit_model_params(default_params, fold_models)
+        best_iterations = [get_best_iteration(m.fitted_model_) for m in fold_models]
+        best_iterations = [n for n in best_iterations if n is not None]
+        if len(best_iterations) > 0:
+            params['n_estimators'] = int(np.round(np.mean(best_iterations)))
+        return params
+
+    def export_merged_booster(self: Union['BoostingEarlyStoppingMixin', BaseOutOfFoldFeature], path=None):
+        """
+        merge the fold boosters (cut to the best iteration of each fold) into one native booster whose
+        raw score is the mean of the raw scores of the folds.
+
+        Args:
+            path: If set, the merged booster is saved to the path.
+
+        Returns:
+            merged `lightgbm.Booster` or `xgboost.Booster`
+        """
+        models = self.get_predict_models()
+        if self._merged_booster is None or self._merged_booster[0] is not models:
+            for m in models:
+                if any(t.log or t.use_scaling for t in (m.input_transformer, m.target_transformer)):
+                    raise ValueError('models which use input / target scaling can not be merged.')
+            self._merged_booster = (models, merge_boosters([m.fitted_model_ for m in models]))
+
+        booster = self._merged_booster[1]
+        if path is not None:
+            booster.save_model(path)
+        return booster
+
+    def _predict_trained_models(self: Union['BoostingEarlyStoppingMixin', BaseOutOfFoldFeature], test_df):
+        if not self.merge_folds:
+            return super(BoostingEarlyStoppingMixin, self)._predict_trained_models(test_df)
+
+        booster = self.export_merged_booster()
+        X = self.get_predict_matrix(test_df)
+        preds = np.zeros(len(X), dtype=np.float32)
+        chunk_size = self.predict_chunk_size or max(len(X), 1)
+        for start in range(0, len(X), chunk_size):
+            x = X[start:start + chunk_size]
+            preds[start:start + len(x)] = predict_booster(booster, x, n_threads=self.predict_threads)
+        return pd.DataFrame(preds, columns=[str(self)])
+
+    def get_predict_matrix(self: Union['BoostingEarlyStoppingMixin', BaseOutOfFoldFeature], test_df):
+        if self.merge_folds or self.native_predict:
+            # native boosters predict the contiguous array of the native dtype without copy
+            return np.ascontiguousarray(test_df.values, dtype=get_native_dtype(self.model_class))
+        return super(BoostingEarlyStoppingMixin, self).get_predict_matrix(test_df)
+
+    def _predict_fold(self: Union['BoostingEarlyStoppingMixin', BaseOutOfFoldFeature], model, x):
+        if not self.native_predict:
+            return super(BoostingEarlyStoppingMixin, self)._predict_fold(model, x)
+
+        booster, num_iteration = get_native_booster(model.fitted_model_)
+        transformer = model.input_transformer
+        if transformer.log or transformer.use_scaling:
+            # the chunk is shared by all folds, so transform the copy
+            x = transformer.transform_inplace(np.array(x, dtype=get_native_dtype(self.model_class)))
+        pred = predict_booster(booster, x, num_iteration=num_iteration, n_threads=self.predict_threads)
+        return model.target_transformer.inverse_transform(pred)
+
 
 class BoostingOutOfFoldFeature(BoostingEarlyStoppingMixin, GenericOutOfFoldFeature):
     pass
 
 
 class BoostingOptunaFeature(BoostingEarlyStoppingMixin, GenericOutOfFoldOptunaFeature):
-    pass
+    min_rung_estimators = 10  # lower limit of boosting rounds on the low fidelity rung
+
+    def apply_rung_budget(self, model_params, budget):
+        """cap the boosting rounds (`n_estimators`) by the rung budget"""
+        n_estimators = model_params.get('n_estimators', None)
+        if n_estimators is None:
+            return model_params
+        n_estimators = max(self.min_rung_estimators, int(n_estimators * budget))
+        return {**model_params, 'n_estimators': n_estimators}
@@ -0,0 +1,75 @@
+# coding: utf-8
+"""
+Prediction by the native boosters of LightGBM / XGBoost.
+
+The sklearn API wrappers validate and copy the input on every call. The functions here pass the array directly
+to the native booster (`lightgbm.Booster.predict` / `xgboost.Booster.inplace_predict`), so the contiguous array of
+the native dtype (see `get_native_dtype`) is predicted without the conversion.
+"""
+
+import json
+import threading
+from typing import Tuple, Union
+
+import lightgbm as lgbm
+import numpy as np
+import xgboost as xgb
+
+from .helpers import get_best_iteration
+
+# `nthread` of XGBoost is the parameter of the booster, so it is changed only while predicting under the lock
+_xgb_nthread_lock = threading.Lock()
+
+
+def get_native_dtype(model_class) -> type:
+    """
+    dtype of the input which the booster uses internally. XGBoost compares the features as float32, while
+    LightGBM uses float64 thresholds (the prediction changes near the thresholds if the input is cast to float32).
+    """
+    if issubclass(model_class, xgb.XGBModel):
+        return np.float32
+    return np.float64
+
+
+def get_native_booster(model) -> Tuple[Union[lgbm.Booster, xgb.Booster], Union[None, int]]:
+    """
+    Args:
+        model: fitted `LGBMModel` or `XGBModel` instance.
+
+    Returns:
+        native booster of the model and the number of iterations used on predict (None means all iterations)
+    """
+    if isinstance(model, lgbm.LGBMModel):
+        return model.booster_, get_best_iteration(model)
+    if isinstance(model, xgb.XGBModel):
+        return model.get_booster(), get_best_iteration(model)
+    raise ValueError('only LightGBM or XGBoost models have native booster. actually: {}'.format(
+        type(model).__name__))
+
+
+def predict_booster(booster: Union[lgbm.Booster, xgb.Booster], x: np.ndarray,
+                    num_iteration: Union[None, int] = None, n_threads: Union[None, int] = None) -> np.ndarray:
+    """
+    predict by the native booster. the link function is applied (i.e. probability on binary classification)
+
+    Args:
+        booster: native booster.
+        x: input array. contiguous array of the native dtype is predicted without copy.
+        num_iteration: number of iterations used. If set None, use all iterations.
+        n_threads: number of threads used in this prediction. If set None, use the threads of the booster.
+            the booster itself is not changed.
+    """
+    if isinstance(booster, xgb.Booster):
+        iteration_range = (0, num_iteration or 0)
+        if n_threads is None:
+            return booster.inplace_predict(x, iteration_range=iteration_range)
+        with _xgb_nthread_lock:
+            previous = json.loads(booster.save_config())['learner']['generic_param']['nthread']
+            booster.set_param({'nthread': n_threads})
+            try:
+                return booster.inplace_predict(x, iteration_range=iteration_range)
+            finally:
+                booster.set_param({'nthread': previous})
+
+    params = {} if n_threads is None else {'num_threads': n_threads}
+    return booster.predict(x, num_iteration=num_iteration or -1, **params)
@@ -39,9 +39,7 @@ class OptunaXGBRegressionOutOfFold(BoostingOptunaFeature):
     initial_params = deepcopy(XGBoostRegressorOutOfFold.initial_params)
 
     def generate_model_class_try_params(self, trial):
-        param = get_boosting_parameter_suggestions(trial)
-        param['n_jobs'] = 1
-        return param
+        return get_boosting_parameter_suggestions(trial)
 
 
 class OptunaXGBClassifierOutOfFold(BoostingOptunaFeature):
@@ -50,6 +48,4 @@ class OptunaXGBClassifierOutOfFold(BoostingOptunaFeature):
     initial_params = deepcopy(XGBoostClassifierOutOfFold.initial_params)
 
     def generate_model_class_try_params(self, trial):
-        param = get_boosting_parameter_suggestions(trial)
-        param['n_jobs'] = 1
-        return param
+        return get_boosting_parameter_suggestions(trial)
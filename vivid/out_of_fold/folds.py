@@ -0,0 +1,180 @@
+# coding: utf-8
+"""
+Process wide store of the fold indexes.
+
+The splits are keyed by the cv spec (the class and all attributes, arrays are hashed by their contents) and the
+fingerprints of the target and the groups, so every out-of-fold feature in the graph (and every optuna trial) trained
+on the same target uses the same folds without splitting again.
+Recording features also save the splits in their root dir as compact int32 arrays, so other processes and later runs
+of the same project load exactly the same folds (i.e. the stacking levels trained in different processes are
+consistent). The splits of the other features are kept only in memory.
+"""
+
+import os
+import threading
+import warnings
+from collections import OrderedDict
+from typing import List, Tuple, Union
+
+import numpy as np
+
+from vivid.fingerprint import combine_fingerprints, fingerprint_array, fingerprint_params
+
+Splits = List[Tuple[np.ndarray, np.ndarray]]
+
+
+def _concat_indexes(indexes: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    offsets = np.cumsum([0] + [len(idx) for idx in indexes]).astype(np.int64)
+    values = np.concatenate(indexes).astype(np.int32) if len(indexes) > 0 else np.zeros(0, dtype=np.int32)
+    return values, offsets
+
+
+def _split_indexes(values: np.ndarray, offsets: np.ndarray) -> List[np.ndarray]:
+    return [values[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def is_deterministic(cv) -> bool:
+    """
+    whether `cv.split` returns the same splits every time.
+    The randomized cv (the one which has `random_state`, like `ShuffleSplit` or shuffled `KFold`) is deterministic
+    only when the seed is the integer (`None` or `RandomState` instance changes the splits on every call).
+    """
+    if not hasattr(cv, 'random_state') or not getattr(cv, 'shuffle', True):
+        return True
+    return not (cv.random_state is None or isinstance(cv.random_state, np.random.RandomState))
+
+
+class FoldStore:
+    """fold indexes on memory (LRU) and local files"""
+
+    def __init__(self, max_entries=16):
+        """
+        Args:
+            max_entries:
+                number of the splits kept on memory. The least recently used splits are removed first
+                (they are loaded from the file again when used, or split again if not saved).
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # type: OrderedDict[str, Splits]
+        self._lock = threading.RLock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.loads = 0
+        self.splits = 0
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'loads': self.loads,
+                'splits': self.splits,
+                'n_entries': len(self._entries)
+            }
+
+    def get_key(self, cv, y, groups=None) -> str:
+        """
+        key of the splits. unique to the cv spec (class and all attributes), the target and the groups.
+        the array attributes of the cv (like `test_fold` of `PredefinedSplit`) are hashed by their contents.
+        """
+        return combine_fingerprints(fingerprint_params(cv), fingerprint_array(y), fingerprint_array(groups))
+
+    def get_path(self, key: str, save_dir: str) -> str:
+        return os.path.join(save_dir, f'{key}.npz')
+
+    def get_splits(self, cv, X, y, groups=None, key: Union[None, str] = None,
+                   save_dir: Union[None, str] = None) -> Splits:
+        """
+        return the splits of `cv.split(X, y, groups)`. If the splits of the same key exist on memory or local file,
+        return them instead of splitting. The cv which is not deterministic (see `is_deterministic`) is always split.
+
+        Args:
+            cv: sklearn cv object which has `split` method.
+            X: training array. only the number of rows is used by the standard splitters.
+            y: target array.
+            groups: groups of the rows. pass to `cv.split`.
+            key: key of the splits. If set None, created from `get_key`.
+            save_dir: directory to load and save the splits. If set None, the splits are kept only in memory.
+                saving is best effort (the failure is warned and the splits are used as they are).
+
+        Returns:
+            list of (train indexes, validation indexes). the indexes are int32 array.
+        """
+        if not is_deterministic(cv):
+            self.splits += 1
+            return [(np.asarray(idx_train, dtype=np.int32), np.asarray(idx_valid, dtype=np.int32))
+                    for idx_train, idx_valid in cv.split(X, y, groups)]
+        if key is None:
+            key = self.get_key(cv, y, groups)
+
+        with self._lock:
+            splits = self._entries.get(key, None)
+            if splits is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return splits
+
+        splits = self._load(key, save_dir) if save_dir is not None else None
+        if splits is None:
+            splits = [(np.asarray(idx_train, dtype=np.int32), np.asarray(idx_valid, dtype=np.int32))
+                      for idx_train, idx_valid in cv.split(X, y, groups)]
+            if save_dir is not None:
+                self._save(key, splits, save_dir)
+            self.splits += 1
+        else:
+            self.loads += 1
+
+        with self._lock:
+            self._entries[key] = splits
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return splits
+
+    def _load(self, key: str, save_dir: str) -> Union[None, Splits]:
+        path = self.get_path(key, save_dir)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            trains = _split_indexes(data['train'], data['train_offsets'])
+            valids = _split_indexes(data['valid'], data['valid_offsets'])
+        return list(zip(trains, valids))
+
+    def _save(self, key: str, splits: Splits, save_dir: str):
+        path = self.get_path(key, save_dir)
+        train, train_offsets = _concat_indexes([s[0] for s in splits])
+        valid, valid_offsets = _concat_indexes([s[1] for s in splits])
+        # write to the temporary file at first, in order not to leave a broken file
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(save_dir, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, train=train, train_offsets=train_offsets, valid=valid, valid_offsets=valid_offsets)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            warnings.warn(f'failed to save the fold splits to {path}: {e}')
+            if os.path.isfile(tmp_path):
+                os.remove(tmp_path)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def clear(self):
+        """clear the splits on memory. the saved files are not removed."""
+        with self._lock:
+            self._entries.clear()
+
+
+_fold_store = None  # type: Union[None, FoldStore]
+_fold_store_lock = threading.Lock()
+
+
+def get_fold_store() -> FoldStore:
+    """get process wide fold store"""
+    global _fold_store
+    with _fold_store_lock:
+        if _fold_store is None:
+            _fold_store = FoldStore()
+    return _fold_store
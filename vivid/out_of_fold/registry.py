@@ -0,0 +1,170 @@
+# coding: utf-8
+"""
+Process wide registry of the fitted fold models loaded from local files.
+
+A feature which is not trained in the current process loads its fold models (and the input / target transformers)
+from joblib files on predict. The registry keeps the loaded models, so repeated predict calls in a long-lived
+process only run the inference. The models are keyed by the output dir of the feature and stored with the version
+(modified time of the model parameters file), so the models saved by a new fit are never mixed up with the old ones.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Union
+
+from vivid.env import Settings
+
+
+class _Entry:
+    def __init__(self, models: list, version: Hashable, nbytes: int):
+        self.models = models
+        self.version = version
+        self.nbytes = nbytes
+
+
+def get_models_nbytes(models) -> int:
+    """approximate memory size of the models. the size of saved files is used."""
+    nbytes = 0
+    for m in models:
+        output_dir = getattr(m, 'output_dir', None)
+        if output_dir is None or not os.path.exists(output_dir):
+            continue
+        for filename in ('best_fitted.joblib', 'input.joblib', 'target.joblib'):
+            path = os.path.join(output_dir, filename)
+            if os.path.exists(path):
+                nbytes += os.path.getsize(path)
+    return nbytes
+
+
+class ModelRegistry:
+    """LRU cache of the loaded models with the memory budget"""
+
+    def __init__(self, max_bytes: Union[None, int] = None):
+        """
+        Args:
+            max_bytes:
+                memory budget. If set None, the models are never evicted.
+                The least recently used models are evicted first when the budget is exceeded.
+        """
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # type: OrderedDict[Hashable, _Entry]
+        self._lock = threading.RLock()
+        self.reset_stats()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(e.nbytes for e in self._entries.values())
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'n_entries': len(self._entries),
+                'nbytes': self.nbytes
+            }
+
+    def put(self, key: Hashable, models: list, version: Hashable = None, nbytes: Union[None, int] = None):
+        """
+        Args:
+            key: registry key (like output dir of the feature).
+            models: fitted models.
+            version: version of the models. the models of the old version are replaced.
+            nbytes: memory size of the models. If set None, estimate from the size of saved files.
+        """
+        if nbytes is None:
+            nbytes = get_models_nbytes(models)
+        with self._lock:
+            self._entries[key] = _Entry(models, version=version, nbytes=nbytes)
+            self._entries.move_to_end(key)
+            self._evict(keep=key)
+
+    def get(self, key: Hashable, version: Hashable = None) -> Union[None, list]:
+        """return the registered models of the version. If not registered (or the version is old), return None."""
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is None or entry.version != version:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry.models
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], list], version: Hashable = None) -> list:
+        """return the registered models. If not registered, load them by `loader` and register."""
+        models = self.get(key, version=version)
+        if models is None:
+            models = loader()
+            self.put(key, models, version=version)
+        return models
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def discard(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _evict(self, keep=None):
+        if self.max_bytes is None:
+            return
+        while self.nbytes > self.max_bytes:
+            candidates = [k for k in self._entries.keys() if k != keep]
+            if len(candidates) == 0:
+                return
+            self._entries.pop(candidates[0])
+            self.evictions += 1
+
+
+_model_registry = None  # type: Union[None, ModelRegistry]
+_model_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """get process wide model registry. the budget is set from `Settings.MODEL_REGISTRY_MAX_BYTES`"""
+    global _model_registry
+    with _model_registry_lock:
+        if _model_registry is None:
+            _model_registry = ModelRegistry(max_bytes=Settings.MODEL_REGISTRY_MAX_BYTES)
+    return _model_registry
+
+
+def warm_up(features) -> int:
+    """
+    load the fitted models of all out-of-fold features in the graphs into the registry in advance
+    (i.e. before the first request of the serving process).
+
+    Args:
+        features: the last feature of the graph or list of them.
+            features which do not have fold models or are not recording are skipped.
+
+    Returns:
+        number of the features whose models are registered.
+    """
+    from vivid.executor import topological_sort
+
+    if not isinstance(features, (list, tuple)):
+        features = [features]
+
+    n_loaded = 0
+    visited = set()
+    for feature in features:
+        for node in topological_sort(feature):
+            if node in visited or not hasattr(node, 'load_best_models') or not node.is_recording:
+                continue
+            visited.add(node)
+            node.load_best_models()
+            n_loaded += 1
+    return n_loaded
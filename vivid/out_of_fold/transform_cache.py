@@ -0,0 +1,114 @@
+# coding: utf-8
+"""
+Process wide cache of the input / target transforms of each fold.
+
+Every fold of every optuna trial (and every seed feature of the same parent) fits the same `UtilityTransform`
+(log / standard scaling) on the same rows. The cache keeps the fitted transformers and the transformed training and
+validation arrays keyed by the fingerprint of the data, the fold and the scaling config, so the transforms run once.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Hashable, Union
+
+import numpy as np
+
+from vivid.env import Settings
+
+
+class FoldTransform:
+    """fitted transformers of the fold and the transformed arrays"""
+
+    def __init__(self, input_transformer, target_transformer, x_train, y_train, x_valid, y_valid):
+        self.input_transformer = input_transformer
+        self.target_transformer = target_transformer
+        self.x_train = x_train
+        self.y_train = y_train
+        self.x_valid = x_valid
+        self.y_valid = y_valid
+
+    @property
+    def nbytes(self) -> int:
+        return sum(np.asarray(x).nbytes for x in (self.x_train, self.y_train, self.x_valid, self.y_valid))
+
+
+class FoldTransformCache:
+    """LRU cache of the fold transforms with the memory budget"""
+
+    def __init__(self, max_bytes: Union[None, int] = None):
+        """
+        Args:
+            max_bytes:
+                memory budget. If set None, the transforms are never evicted.
+                The least recently used transforms are evicted first when the budget is exceeded.
+        """
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # type: OrderedDict[Hashable, FoldTransform]
+        self._lock = threading.RLock()
+        self.reset_stats()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(e.nbytes for e in self._entries.values())
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'n_entries': len(self._entries),
+                'nbytes': self.nbytes
+            }
+
+    def put(self, key: Hashable, transform: FoldTransform):
+        """register the transform. the transform larger than the budget is not registered."""
+        if self.max_bytes is not None and transform.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            self._entries[key] = transform
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def get(self, key: Hashable) -> Union[None, FoldTransform]:
+        with self._lock:
+            transform = self._entries.get(key, None)
+            if transform is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return transform
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _evict(self):
+        if self.max_bytes is None:
+            return
+        while self.nbytes > self.max_bytes and len(self._entries) > 0:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+_fold_transform_cache = None  # type: Union[None, FoldTransformCache]
+_fold_transform_cache_lock = threading.Lock()
+
+
+def get_fold_transform_cache() -> FoldTransformCache:
+    """get process wide fold transform cache. the budget is set from `Settings.FOLD_TRANSFORM_CACHE_MAX_BYTES`"""
+    global _fold_transform_cache
+    with _fold_transform_cache_lock:
+        if _fold_transform_cache is None:
+            _fold_transform_cache = FoldTransformCache(max_bytes=Settings.FOLD_TRANSFORM_CACHE_MAX_BYTES)
+    return _fold_transform_cache
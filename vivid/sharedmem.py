@@ -0,0 +1,105 @@
+# coding: utf-8
+"""
+Read-only memory-mapped arrays shared by the workers.
+
+The training matrix is written to a `.npy` file once (the file name is the fingerprint of the array) and opened as
+read-only `np.memmap`. `joblib` sends memory-mapped arrays to process workers by the file name, so each worker attaches
+to the same pages of OS page cache instead of receiving its own copy of the whole matrix, and the same matrix used in
+many folds / optuna trials is written only once.
+
+It is used only by the process backends (in threads the workers already share the matrix). The rows of each fold are
+still copied by the worker (`X[idx_train]`), because the estimators are fitted on the plain array of the fold.
+
+The out-of-fold feature shares the arrays inside `shared_scope`, so the files are written to the temporary directory
+of the fit and removed as soon as the fit ends.
+"""
+
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Union
+
+import numpy as np
+
+from .env import Settings
+from .fingerprint import fingerprint_array
+
+_created_paths = set()
+_lock = threading.Lock()
+# directories of `shared_scope` opened in the current thread
+_scopes = threading.local()
+
+
+def get_shared_dir() -> str:
+    """directory of the shared arrays. the temporary directory of the innermost `shared_scope` if it is opened"""
+    dirs = getattr(_scopes, 'dirs', None)
+    if dirs:
+        return dirs[-1]
+    return os.path.join(Settings.CACHE_DIR, 'memmap')
+
+
+@contextmanager
+def shared_scope():
+    """
+    the arrays shared in this scope (by the current thread) are written to the temporary directory,
+    and the directory is removed at the end of the scope.
+    """
+    directory = tempfile.mkdtemp(prefix='vivid_memmap_')
+    if getattr(_scopes, 'dirs', None) is None:
+        _scopes.dirs = []
+    _scopes.dirs.append(directory)
+    try:
+        yield directory
+    finally:
+        _scopes.dirs.remove(directory)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def is_shared_array(x) -> bool:
+    return isinstance(x, np.memmap) and getattr(x, 'filename', None) is not None
+
+
+def share_array(x: np.ndarray, directory: Union[None, str] = None) -> np.ndarray:
+    """
+    write the array to the memory-mapped file and open it as read-only.
+
+    Args:
+        x: array to share. object dtype array is returned as it is (it can not be memory-mapped).
+        directory: directory to write the file. If set None, use `get_shared_dir`.
+
+    Returns:
+        read-only memory-mapped array which has the same values as `x`
+    """
+    if is_shared_array(x):
+        return x
+    x = np.asarray(x)
+    if x.dtype == object:
+        return x
+
+    directory = directory or get_shared_dir()
+    path = os.path.join(directory, fingerprint_array(x) + '.npy')
+
+    with _lock:
+        if not os.path.exists(path):
+            os.makedirs(directory, exist_ok=True)
+            # write to the temporary file at first, because the other process may read the same file.
+            tmp_path = path + f'.{os.getpid()}.tmp.npy'
+            np.save(tmp_path, np.ascontiguousarray(x), allow_pickle=False)
+            os.replace(tmp_path, path)
+            _created_paths.add(path)
+    return np.load(path, mmap_mode='r')
+
+
+def clear_shared_arrays():
+    """remove the files created by this process"""
+    with _lock:
+        for path in list(_created_paths):
+            if os.path.exists(path):
+                os.remove(path)
+            _created_paths.discard(path)
+
+
+atexit.register(clear_shared_arrays)
@@ -64,6 +64,27 @@ class UtilityTransform(BaseEstimator, TransformerMixin):
                 x = x.reshape(-1, )
         return x
 
+    def transform_inplace(self, x: np.ndarray) -> np.ndarray:
+        """
+        transform the float array in place (the array is not copied). only standard scaling is supported.
+
+        Returns:
+            transformed array. the same object as `x`
+        """
+        check_is_fitted(self, 'is_one_dim_')
+        if self.log:
+            x += self.threshold
+            np.log1p(x, out=x)
+
+        if self.use_scaling:
+            if not isinstance(self.scaling, StandardScaler):
+                raise ValueError('only standard scaling can be run in place. actually: {}'.format(self.scaling))
+            if self.scaling.mean_ is not None:
+                x -= self.scaling.mean_.astype(x.dtype)
+            if self.scaling.scale_ is not None:
+                x /= self.scaling.scale_.astype(x.dtype)
+        return x
+
     def inverse_transform(self, x):
         check_is_fitted(self, 'is_one_dim_')
         if self.use_scaling:
@@ -180,8 +201,15 @@ class PrePostProcessModel(BaseEstimator):
         Returns: fitted model instance
 
         """
-        clf = self.create_model()
         x, y = self._before_fit(x_train, y_train)
+        return self.fit_transformed(x, y, **kwargs)
+
+    def fit_transformed(self, x, y, **kwargs):
+        """
+        fit the model on the data already transformed by the fitted `input_transformer` and `target_transformer`
+        (i.e. the output of `_before_fit`). After fitting, the model is saved as `fit`.
+        """
+        clf = self.create_model()
         self.fit_params_ = kwargs
         self.fitted_model_ = clf.fit(x, y, **kwargs)
         if self.is_recording:
@@ -0,0 +1,185 @@
+# coding: utf-8
+"""
+Structured execution tracing.
+
+Spans are recorded for the feature fit / predict, parent output assembly, out-of-fold folds, optuna trials,
+reports and backend saves. Tracing is disabled by default and `trace` does nothing until it is started, so the
+overhead in the normal run is only one flag check.
+
+Examples:
+    >>> with tracing() as tracer:
+    ...     feature.fit(train_df, y)
+    >>> tracer.save_chrome_trace('trace.json')  # open in Perfetto (https://ui.perfetto.dev) or chrome://tracing
+    >>> tracer.to_dataframe()  # flat table of the spans
+"""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+from time import time
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+SPAN_COLUMNS = ['name', 'category', 'start', 'end', 'duration', 'pid', 'tid', 'rows', 'columns', 'bytes']
+
+
+class Span:
+    def __init__(self, name: str, category: str, start: float, end: float, pid: int, tid: int, args: dict):
+        self.name = name
+        self.category = category
+        self.start = start
+        self.end = end
+        self.pid = pid
+        self.tid = tid
+        self.args = args
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'category': self.category,
+            'start': self.start,
+            'end': self.end,
+            'duration': self.duration,
+            'pid': self.pid,
+            'tid': self.tid,
+            **self.args
+        }
+
+
+def data_stats(data) -> dict:
+    """rows, columns and bytes of the dataframe or array"""
+    if isinstance(data, pd.DataFrame):
+        return {'rows': data.shape[0], 'columns': data.shape[1], 'bytes': int(data.memory_usage(index=True).sum())}
+    if isinstance(data, np.ndarray):
+        return {
+            'rows': data.shape[0] if data.ndim > 0 else 1,
+            'columns': data.shape[1] if data.ndim > 1 else 1,
+            'bytes': int(data.nbytes)
+        }
+    return {}
+
+
+class Tracer:
+    """collect spans of the run. It is thread safe."""
+
+    def __init__(self):
+        self.enabled = False
+        self.spans = []  # type: List[Span]
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, category='vivid', **args):
+        """
+        record the span of the block. the yielded dict is the span arguments, so the values known at the end of
+        the block (like output shape) can be added to it.
+        """
+        if not self.enabled:
+            yield {}
+            return
+
+        start = time()
+        try:
+            yield args
+        finally:
+            self.add(Span(name, category,
+                          start=start,
+                          end=time(),
+                          pid=os.getpid(),
+                          tid=threading.get_ident(),
+                          args=args))
+
+    def add(self, *spans: Span):
+        with self._lock:
+            self.spans.extend(spans)
+
+    def pop_since(self, index: int) -> List[Span]:
+        """remove and return the spans recorded after the `index`"""
+        with self._lock:
+            spans = self.spans[index:]
+            del self.spans[index:]
+        return spans
+
+    def clear(self):
+        with self._lock:
+            self.spans = []
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """flat table of the spans (one row per span). time is unix seconds."""
+        rows = [s.to_dict() for s in self.spans]
+        df = pd.DataFrame(rows)
+        columns = SPAN_COLUMNS + [c for c in df.columns if c not in SPAN_COLUMNS]
+        return df.reindex(columns=columns)
+
+    def save_csv(self, path: str):
+        self.to_dataframe().to_csv(path, index=False)
+
+    def to_chrome_trace(self) -> dict:
+        """spans as Chrome trace event format (complete events). time is micro seconds from the first span."""
+        origin = min([s.start for s in self.spans], default=0.)
+        events = []
+        for s in self.spans:
+            events.append({
+                'name': s.name,
+                'cat': s.category,
+                'ph': 'X',
+                'ts': (s.start - origin) * 1e6,
+                'dur': s.duration * 1e6,
+                'pid': s.pid,
+                'tid': s.tid,
+                'args': {k: str(v) if not isinstance(v, (int, float)) else v for k, v in s.args.items()}
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save_chrome_trace(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.to_chrome_trace(), f)
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    """get process wide tracer"""
+    return _tracer
+
+
+def trace(name: str, category='vivid', **args):
+    """record the span to the process wide tracer. see `Tracer.span`"""
+    return _tracer.span(name, category=category, **args)
+
+
+@contextmanager
+def tracing(clear=True):
+    """
+    enable tracing in the block.
+
+    Args:
+        clear: If set `True`, discard the spans recorded before.
+    """
+    if clear:
+        _tracer.clear()
+    enabled = _tracer.enabled
+    _tracer.enabled = True
+    try:
+        yield _tracer
+    finally:
+        _tracer.enabled = enabled
+
+
+def start_tracing(clear=True) -> Tracer:
+    if clear:
+        _tracer.clear()
+    _tracer.enabled = True
+    return _tracer
+
+
+def stop_tracing() -> Tracer:
+    _tracer.enabled = False
+    return _tracer
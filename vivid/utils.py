@@ -2,6 +2,7 @@
 """学習とかで使う汎用的な関数などを定義する
 """
 
+import os
 from contextlib import contextmanager
 from importlib import import_module
 from logging import getLogger, StreamHandler, FileHandler, Formatter
@@ -71,18 +72,36 @@ def timer(logger=None, format_str='{:.3f}[s]', prefix=None, suffix=None):
         print(out_str)
 
 
+class LazyFileHandler(FileHandler):
+    """file handler which creates the directory and opens the file when the first record is emitted"""
+
+    def __init__(self, filename, mode='a', encoding=None):
+        super(LazyFileHandler, self).__init__(filename, mode=mode, encoding=encoding, delay=True)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super(LazyFileHandler, self)._open()
+
+
 def get_logger(name, log_level="DEBUG",
                output_file=None,
                handler_level="INFO",
                output_level='DEBUG',
                format_str="%(message)s"):
     """
+    get the logger which has stream handler (and file handler if `output_file` is set).
+    When the logger has already been set up with the same arguments, it is returned as it is
+    (the handlers are not created again).
+
     :param str name:
     :param str log_level:
     :param str | None output_file:
     :return: logger
     """
     logger = getLogger(name)
+    config = (log_level, output_file, handler_level, output_level, format_str)
+    if getattr(logger, '_vivid_config', None) == config:
+        return logger
 
     formatter = Formatter(format_str)
 
@@ -91,15 +110,19 @@ def get_logger(name, log_level="DEBUG",
     handler.setLevel(handler_level)
     handler.setFormatter(formatter)
 
+    for old_handler in logger.handlers:
+        if isinstance(old_handler, FileHandler):
+            old_handler.close()
     logger.handlers = []
     logger.addHandler(handler)
 
     if output_file:
-        file_handler = FileHandler(output_file)
+        file_handler = LazyFileHandler(output_file)
         file_handler.setFormatter(formatter)
         file_handler.setLevel(output_level)
         logger.addHandler(file_handler)
 
+    logger._vivid_config = config
     return logger
 
 